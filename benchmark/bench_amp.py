@@ -0,0 +1,146 @@
+"""
+Throughput and image quality of the mixed precision modes (--amp).
+For each mode, times rendering (encode + volume rendering + neural renderer)
+and a generator training step (forward + scaled backward), and reports the
+PSNR of the renders against the fp32 renders; with -D, also the PSNR against
+the ground truth views and its delta to fp32.
+Usage: python benchmark/bench_amp.py [-c conf/exp/srn.conf] [--checkpoint ckpt]
+[-D data/cars -F srn] [--modes none bf16]
+"""
+import sys
+import os
+import os.path as osp
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), ".."))
+sys.path.insert(0, osp.join(ROOT_DIR, "src"))
+
+import argparse
+import time
+import torch
+import torch.nn.functional as F
+import util
+from pyhocon import ConfigFactory
+from model import make_model
+from render import NeRFRenderer
+from data import get_split_dataset
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--conf", "-c", type=str, default=osp.join(ROOT_DIR, "conf", "exp", "srn.conf"))
+parser.add_argument("--checkpoint", type=str, default=None, help="PixelNeRFNet state dict; random weights if not given")
+parser.add_argument("--datadir", "-D", type=str, default=None, help="Dataset to take views from; random images if not given")
+parser.add_argument("--dataset_format", "-F", type=str, default="srn")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+parser.add_argument("--modes", type=str, nargs="+", default=None, help="Modes to compare (default: none bf16, and fp16 on CUDA)")
+parser.add_argument("--batch_size", "-B", type=int, default=4, help="Number of objects")
+parser.add_argument("--views", "-V", type=int, default=4, help="Rendered views per object")
+parser.add_argument("--iters", type=int, default=5, help="Timed iterations per mode")
+parser.add_argument("--warmup", type=int, default=1, help="Untimed iterations per mode")
+args = parser.parse_args()
+
+device = torch.device(args.device)
+modes = args.modes
+if modes is None:
+    modes = ["none", "bf16"] + (["fp16"] if device.type == "cuda" else [])
+
+conf = ConfigFactory.parse_file(args.conf)
+# Encoder weights come from the checkpoint (or stay random), no need to download them
+conf.put("model.encoder.pretrained", False)
+net = make_model(conf["model"]).to(device=device)
+if args.checkpoint is not None:
+    net.load_state_dict(torch.load(args.checkpoint, map_location=device), strict=False)
+renderer = NeRFRenderer.from_conf(conf["renderer"]).to(device=device)
+render_par = renderer.bind_parallel(net).eval()
+
+SB, V = args.batch_size, args.views
+if args.datadir is not None:
+    dset = get_split_dataset(args.dataset_format, args.datadir, want_split="test", training=False)
+    z_near, z_far = dset.z_near, dset.z_far
+    objs = [dset[i] for i in range(SB)]
+    # Source view 0, rendered views spread over the rest
+    view_ids = torch.linspace(1, objs[0]["images"].shape[0] - 1, V).long()
+    src_images = torch.stack([obj["images"][0] for obj in objs])
+    poses = torch.stack([obj["poses"][view_ids] for obj in objs])
+    gt = torch.stack([obj["images"][view_ids] for obj in objs]) * 0.5 + 0.5
+    gt = gt.reshape(SB * V, *gt.shape[2:]).to(device=device)
+else:
+    z_near, z_far = 0.8, 1.8
+    torch.manual_seed(0)
+    src_images = torch.rand(SB, 3, 128, 128) * 2 - 1
+    poses = torch.stack(
+        [
+            util.pose_spherical(angle, -10.0, 1.3)
+            for angle in torch.linspace(-180, 180, SB * V + 1)[:-1].tolist()
+        ]
+    ).view(SB, V, 4, 4)
+    gt = None
+src_images = src_images.to(device=device)
+
+focal, c = util.feat_intrinsics(net.feat_size)
+rays = util.RayGenerator()(
+    poses.reshape(-1, 4, 4), net.feat_size, net.feat_size, focal, z_near, z_far, c=c
+).reshape(SB, -1, 8).to(device=device)
+focal, c = focal.to(device=device), c.to(device=device)
+
+
+def sync():
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def render():
+    shape, appearance = net.encode(src_images, focal=focal, c=c)
+    feat = render_par(rays, val_num=V, shape=shape, appearance=appearance)
+    return net.neural_renderer(feat)
+
+
+def timed(fn):
+    for _ in range(args.warmup):
+        fn()
+    sync()
+    t0 = time.perf_counter()
+    for _ in range(args.iters):
+        out = fn()
+    sync()
+    return (time.perf_counter() - t0) / args.iters, out
+
+
+results = {}
+for mode in modes:
+    scaler = torch.cuda.amp.GradScaler(enabled=mode == "fp16")
+
+    def render_step():
+        with torch.no_grad(), util.autocast(device, mode):
+            return render().float()
+
+    def train_step():
+        net.zero_grad(set_to_none=True)
+        with util.autocast(device, mode):
+            rgb = render()
+            target = gt if gt is not None else torch.zeros_like(rgb)
+            loss = F.mse_loss(rgb.float(), target)
+        scaler.scale(loss).backward()
+        return loss
+
+    net.eval()
+    render_time, rgb = timed(render_step)
+    net.train()
+    train_time, _ = timed(train_step)
+    results[mode] = dict(
+        render_views_per_s=SB * V / render_time,
+        train_steps_per_s=1.0 / train_time,
+        rgb=rgb,
+    )
+
+ref = results.get("none", results[modes[0]])
+print("mode  render views/s  train steps/s  psnr vs fp32" + ("  psnr  delta" if gt is not None else ""))
+for mode in modes:
+    res = results[mode]
+    line = "{:5} {:14.2f} {:14.3f}".format(mode, res["render_views_per_s"], res["train_steps_per_s"])
+    if res is ref:
+        line += " {:13}".format("-")
+    else:
+        line += " {:13.2f}".format(util.psnr(res["rgb"], ref["rgb"]))
+    if gt is not None:
+        psnr = util.psnr(res["rgb"], gt)
+        line += " {:6.2f} {:+6.2f}".format(psnr, psnr - util.psnr(ref["rgb"], gt))
+    print(line)
@@ -0,0 +1,106 @@
+"""
+Frames per second of eager vs compiled rendering (render.CompiledRenderer)
+of an encoded object, as in eval/gen_video.py: the object is encoded once and
+turntable frames are rendered frame_batch at a time.
+The first compiled call per input shape (compilation) is reported separately.
+Usage: python benchmark/bench_compile.py [-c conf/exp/srn.conf] [--checkpoint ckpt]
+[--backends eager trace compile]
+"""
+import sys
+import os
+import os.path as osp
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), ".."))
+sys.path.insert(0, osp.join(ROOT_DIR, "src"))
+
+import argparse
+import time
+import numpy as np
+import torch
+import util
+from pyhocon import ConfigFactory
+from model import make_model
+from render import NeRFRenderer, CompiledRenderer
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--conf", "-c", type=str, default=osp.join(ROOT_DIR, "conf", "exp", "srn.conf"))
+parser.add_argument("--checkpoint", type=str, default=None, help="PixelNeRFNet state dict; random weights if not given")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+parser.add_argument("--backends", type=str, nargs="+", default=["eager", "trace", "compile"])
+parser.add_argument("--compile_mode", type=str, default=None, help="torch.compile mode, e.g. reduce-overhead")
+parser.add_argument("--num_views", type=int, default=40, help="Number of frames")
+parser.add_argument("--frame_batch", type=int, default=8, help="Number of frames rendered at once")
+parser.add_argument("--repeats", type=int, default=2, help="Timed passes over all frames")
+args = parser.parse_args()
+
+device = torch.device(args.device)
+conf = ConfigFactory.parse_file(args.conf)
+# Encoder weights come from the checkpoint (or stay random), no need to download them
+conf.put("model.encoder.pretrained", False)
+net = make_model(conf["model"]).to(device=device).eval()
+if args.checkpoint is not None:
+    net.load_state_dict(torch.load(args.checkpoint, map_location=device), strict=False)
+renderer = NeRFRenderer.from_conf(conf["renderer"]).to(device=device).eval()
+render_par = renderer.bind_parallel(net, simple_output=True).eval()
+
+z_near, z_far = 0.8, 1.8
+focal, c = util.feat_intrinsics(net.feat_size)
+render_poses = torch.stack(
+    [
+        util.pose_spherical(angle, -10.0, 1.3)
+        for angle in np.linspace(-180, 180, args.num_views + 1)[:-1]
+    ],
+    0,
+)
+render_rays = util.RayGenerator()(
+    render_poses, net.feat_size, net.feat_size, focal, z_near, z_far, c=c
+).to(device=device)
+# Same number of frames per batch, so every backend compiles a single shape
+batches = [
+    rays.reshape(1, -1, 8)
+    for rays in torch.split(render_rays, args.frame_batch, dim=0)
+    if rays.shape[0] == args.frame_batch
+]
+n_frames = len(batches) * args.frame_batch
+
+torch.manual_seed(0)
+with torch.no_grad():
+    shape, appearance = net.encode(
+        torch.rand(1, 3, 128, 128, device=device) * 2 - 1,
+        focal=focal.to(device=device),
+        c=c.to(device=device),
+    )
+
+
+def sync():
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+print("backend  first call (s)  frames/s")
+for backend in args.backends:
+    if backend == "eager":
+
+        @torch.no_grad()
+        def render(rays):
+            feat = render_par(rays, val_num=args.frame_batch, shape=shape, appearance=appearance)
+            return net.neural_renderer(feat)
+
+    else:
+        compile_kwargs = {"mode": args.compile_mode} if backend == "compile" and args.compile_mode else {}
+        compiled = CompiledRenderer(net, renderer, backend=backend, **compile_kwargs)
+        render = lambda rays: compiled(rays, args.frame_batch, shape, appearance)
+
+    sync()
+    t0 = time.perf_counter()
+    render(batches[0])
+    sync()
+    first = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(args.repeats):
+        for rays in batches:
+            render(rays)
+    sync()
+    fps = n_frames * args.repeats / (time.perf_counter() - t0)
+    print("{:8} {:15.2f} {:9.2f}".format(backend, first, fps))
@@ -0,0 +1,320 @@
+"""
+Microbenchmarks of the render and training hot paths on synthetic inputs
+(random weights and images, runs on CPU), emitted as JSON so runs can be
+diffed to catch regressions and quantify optimizations:
+- gen_rays: util.gen_rays
+- sample_coarse: NeRFRenderer.sample_coarse
+- composite: NeRFRenderer.composite (coarse pass, no grad)
+- decoder: Decoder.forward
+- neural_renderer: NeuralRenderer.forward
+- encoder: SpatialEncoder.forward
+- train_step: PixelNeRFTrainer.train_step (discriminator + generator update)
+swept over object batch sizes, rays per object and n_coarse (where they apply;
+train_step renders model.feat_size ** 2 rays per view).
+Each result has the mean / std / min / max time per call, the throughput in
+items per second and the peak memory of the timed calls (CUDA allocated, or
+process RSS on CPU).
+Usage: python benchmark/bench_hot_paths.py [-c conf/exp/srn.conf]
+[--batch_sizes 1 4] [--ray_counts 256 1024] [--n_coarse 32 64]
+[--only decoder composite] [-O results.json]
+"""
+import sys
+import os
+import os.path as osp
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), ".."))
+sys.path.insert(0, osp.join(ROOT_DIR, "src"))
+sys.path.insert(0, osp.join(ROOT_DIR, "train"))
+
+import argparse
+import json
+import math
+import platform
+import tempfile
+import time
+import numpy as np
+import torch
+import util
+from pyhocon import ConfigFactory
+from model import make_model
+from render import NeRFRenderer
+
+BENCHMARKS = [
+    "gen_rays",
+    "sample_coarse",
+    "composite",
+    "decoder",
+    "neural_renderer",
+    "encoder",
+    "train_step",
+]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--conf", "-c", type=str, default=osp.join(ROOT_DIR, "conf", "exp", "srn.conf"))
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4], help="Object batch sizes (SB)")
+parser.add_argument("--ray_counts", type=int, nargs="+", default=[256, 1024], help="Rays per object, square numbers")
+parser.add_argument("--n_coarse", type=int, nargs="+", default=[32, 64], help="Coarse samples per ray")
+parser.add_argument("--only", type=str, nargs="+", default=None, choices=BENCHMARKS, help="Benchmarks to run (default: all)")
+parser.add_argument("--iters", type=int, default=5, help="Timed calls per configuration")
+parser.add_argument("--warmup", type=int, default=1, help="Untimed calls per configuration")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", "-O", type=str, default=None, help="JSON file to write (default: stdout)")
+args = parser.parse_args()
+
+device = torch.device(args.device)
+torch.manual_seed(args.seed)
+conf = ConfigFactory.parse_file(args.conf)
+# Random weights, no need to download the pretrained encoder
+conf.put("model.encoder.pretrained", False)
+net = make_model(conf["model"]).to(device=device)
+renderer = NeRFRenderer.from_conf(conf["renderer"]).to(device=device)
+z_near, z_far = 0.8, 1.8
+focal, c = util.feat_intrinsics(net.feat_size)
+focal, c = focal.to(device=device), c.to(device=device)
+
+
+def sync():
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def reset_peak_memory():
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    elif platform.system() == "Linux":
+        # Resets the peak RSS (VmHWM) of this process
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+
+
+def peak_memory_mb():
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2 ** 20
+    if platform.system() == "Linux":
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    return None
+
+
+def measure(name, params, items, unit, fn):
+    """
+    Time fn and append the result
+    :param items number of items (unit) processed per call, for the throughput
+    """
+    for _ in range(args.warmup):
+        fn()
+    sync()
+    reset_peak_memory()
+    times = []
+    for _ in range(args.iters):
+        t0 = time.perf_counter()
+        fn()
+        sync()
+        times.append(time.perf_counter() - t0)
+    times = np.array(times)
+    result = dict(
+        name=name,
+        params=params,
+        iters=args.iters,
+        mean_s=float(times.mean()),
+        std_s=float(times.std()),
+        min_s=float(times.min()),
+        max_s=float(times.max()),
+        throughput=items / float(times.mean()),
+        unit=unit,
+        peak_mem_mb=peak_memory_mb(),
+    )
+    results.append(result)
+    print(
+        "{:16} {:40} {:10.4f}s +- {:.4f}  {:12.1f} {}/s".format(
+            name, json.dumps(params), result["mean_s"], result["std_s"], result["throughput"], unit
+        ),
+        file=sys.stderr,
+    )
+
+
+def random_poses(n):
+    angles = torch.rand(n) * 360 - 180
+    return torch.stack(
+        [util.pose_spherical(angle, -10.0, 1.3) for angle in angles.tolist()]
+    ).to(device=device)
+
+
+def random_images(n):
+    return torch.rand(n, 3, 128, 128, device=device) * 2 - 1
+
+
+def make_rays(SB, num_rays):
+    feat_size = math.isqrt(num_rays)
+    assert feat_size ** 2 == num_rays, "ray counts must be square numbers"
+    focal, c = util.feat_intrinsics(feat_size)
+    rays = util.gen_rays(random_poses(SB), feat_size, feat_size, focal, z_near, z_far, c=c)
+    return rays.reshape(SB, num_rays, 8)
+
+
+def bench_gen_rays(SB, num_rays):
+    feat_size = math.isqrt(num_rays)
+    feat_focal, feat_c = util.feat_intrinsics(feat_size)
+    poses = random_poses(SB)
+    measure(
+        "gen_rays", dict(batch_size=SB, rays=num_rays), SB * num_rays, "rays",
+        lambda: util.gen_rays(poses, feat_size, feat_size, feat_focal, z_near, z_far, c=feat_c),
+    )
+
+
+@torch.no_grad()
+def bench_sample_coarse(SB, num_rays, n_coarse):
+    renderer.n_coarse = n_coarse
+    rays = make_rays(SB, num_rays).reshape(-1, 8)
+    measure(
+        "sample_coarse", dict(batch_size=SB, rays=num_rays, n_coarse=n_coarse), SB * num_rays, "rays",
+        lambda: renderer.sample_coarse(rays),
+    )
+
+
+@torch.no_grad()
+def bench_composite(SB, num_rays, n_coarse):
+    renderer.n_coarse = n_coarse
+    rays = make_rays(SB, num_rays).reshape(-1, 8)
+    z_coarse = renderer.sample_coarse(rays)
+    # Sets the input poses the points are transformed with
+    shape, appearance = net.encode(random_images(SB), focal=focal, c=c)
+    measure(
+        "composite", dict(batch_size=SB, rays=num_rays, n_coarse=n_coarse), SB * num_rays, "rays",
+        lambda: renderer.composite(net, rays, shape, appearance, z_coarse, False, coarse=True, sb=SB),
+    )
+
+
+@torch.no_grad()
+def bench_decoder(SB, num_rays, n_coarse):
+    num_points = num_rays * n_coarse
+    points = torch.rand(SB, num_points, 3, device=device) - 0.5
+    viewdirs = torch.nn.functional.normalize(torch.randn(SB, num_points, 3, device=device), dim=-1)
+    z_shape = torch.randn(SB, net.decoder.z_dim, device=device)
+    z_app = torch.randn(SB, net.decoder.z_dim, device=device)
+    measure(
+        "decoder", dict(batch_size=SB, rays=num_rays, n_coarse=n_coarse), SB * num_points, "points",
+        lambda: net.decoder(points, viewdirs, z_shape, z_app),
+    )
+
+
+@torch.no_grad()
+def bench_neural_renderer(SB):
+    feat = torch.randn(SB, net.neural_renderer.input_dim, net.feat_size, net.feat_size, device=device)
+    measure(
+        "neural_renderer", dict(batch_size=SB, feat_size=net.feat_size), SB, "images",
+        lambda: net.neural_renderer(feat),
+    )
+
+
+@torch.no_grad()
+def bench_encoder(SB):
+    images = random_images(SB)
+    measure("encoder", dict(batch_size=SB), SB, "images", lambda: net.encoder(images))
+
+
+def make_trainer():
+    """
+    PixelNeRFTrainer on the benchmark net and renderer, with train.py's
+    default arguments; logs and checkpoints go to a temporary directory
+    """
+    import train as train_script
+
+    train_args = train_script.extra_args(argparse.ArgumentParser()).parse_args([])
+    tmp_dir = tempfile.mkdtemp(prefix="bench_hot_paths_")
+    train_args.name = "bench"
+    train_args.logs_path = train_args.checkpoints_path = train_args.visual_path = tmp_dir
+    train_args.resume = False
+    train_args.lr = 1e-4
+    train_args.gamma = 1.0
+    train_args.epochs = 1
+    train_args.amp = "none"
+    train_args.gpu_id = [0]
+    # Batches are built directly, the loaders are never iterated
+    conf.put("train.num_workers", 0)
+    conf.put("train.views_per_object", 0)
+    render_par = renderer.bind_parallel(net).eval()
+    dset = SyntheticViews()
+    return train_script.PixelNeRFTrainer(
+        net, renderer, render_par, dset, dset, train_args, conf, device=device
+    )
+
+
+class SyntheticViews(torch.utils.data.Dataset):
+    """
+    Random single views in the format of the training set
+    """
+
+    z_near, z_far, lindisp = z_near, z_far, False
+
+    def __len__(self):
+        return 16
+
+    def __getitem__(self, index):
+        return {
+            "images": torch.rand(3, 128, 128) * 2 - 1,
+            "poses": util.pose_spherical(float(index * 20), -10.0, 1.3),
+            "focal": focal.cpu(),
+            "c": c.cpu(),
+        }
+
+
+def bench_train_step(trainer, SB, n_coarse):
+    renderer.n_coarse = n_coarse
+    data = torch.utils.data.default_collate([trainer.train_dataset[i] for i in range(SB)])
+    data = {k: v.to(device=device) for k, v in data.items()}
+    step = [0]
+
+    def train_step():
+        trainer.train_step(data, global_step=step[0])
+        step[0] += 1
+
+    net.train()
+    measure("train_step", dict(batch_size=SB, n_coarse=n_coarse, feat_size=net.feat_size), SB, "objects", train_step)
+    net.eval()
+
+
+results = []
+selected = args.only or BENCHMARKS
+n_coarse_default = renderer.n_coarse
+net.eval()
+for SB in args.batch_sizes:
+    if "encoder" in selected:
+        bench_encoder(SB)
+    if "neural_renderer" in selected:
+        bench_neural_renderer(SB)
+    for num_rays in args.ray_counts:
+        if "gen_rays" in selected:
+            bench_gen_rays(SB, num_rays)
+        for n_coarse in args.n_coarse:
+            if "sample_coarse" in selected:
+                bench_sample_coarse(SB, num_rays, n_coarse)
+            if "decoder" in selected:
+                bench_decoder(SB, num_rays, n_coarse)
+            if "composite" in selected:
+                bench_composite(SB, num_rays, n_coarse)
+if "train_step" in selected:
+    trainer = make_trainer()
+    for SB in args.batch_sizes:
+        for n_coarse in args.n_coarse:
+            bench_train_step(trainer, SB, n_coarse)
+renderer.n_coarse = n_coarse_default
+
+report = dict(
+    device=str(device),
+    torch=torch.__version__,
+    num_threads=torch.get_num_threads(),
+    conf=args.conf,
+    iters=args.iters,
+    warmup=args.warmup,
+    results=results,
+)
+if args.output is not None:
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Wrote", len(results), "results to", args.output, file=sys.stderr)
+else:
+    print(json.dumps(report, indent=2))
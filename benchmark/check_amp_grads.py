@@ -0,0 +1,154 @@
+"""
+Checks that loss scaling does not change the training gradients: runs a few
+PixelNeRFTrainer.train_step calls (default update path, no --shared_forward)
+from the same weights and random state in fp32 and with loss scaling, records
+the unscaled gradients each optimizer steps with and compares them to fp32.
+The discriminator and generator scalers get different scales, so gradients
+carried from one update to the other must be moved between the scales.
+- scaled: fp32 compute with loss scaling only (runs on CPU); must match fp32
+  up to rounding
+- fp16: --amp fp16 (CUDA only); must match fp32 up to fp16 precision
+Exits with status 1 if a mode is off by more than its tolerance.
+Usage: python benchmark/check_amp_grads.py [-c conf/exp/srn.conf] [--steps 2]
+"""
+import sys
+import os
+import os.path as osp
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), ".."))
+sys.path.insert(0, osp.join(ROOT_DIR, "src"))
+sys.path.insert(0, osp.join(ROOT_DIR, "train"))
+
+import argparse
+import copy
+import tempfile
+import torch
+import util
+from pyhocon import ConfigFactory
+from model import make_model
+from render import NeRFRenderer
+import train as train_script
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--conf", "-c", type=str, default=osp.join(ROOT_DIR, "conf", "exp", "srn.conf"))
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+parser.add_argument("--batch_size", "-B", type=int, default=2, help="Number of objects")
+parser.add_argument("--steps", type=int, default=2, help="Train steps per mode; > 1 also carries gradients across steps")
+parser.add_argument("--scaled_tol", type=float, default=1e-4, help="Max relative gradient error with loss scaling only")
+parser.add_argument("--fp16_tol", type=float, default=5e-2, help="Max relative gradient error in fp16")
+args = parser.parse_args()
+
+device = torch.device(args.device)
+torch.manual_seed(0)
+conf = ConfigFactory.parse_file(args.conf)
+# Random weights, no need to download the pretrained encoder
+conf.put("model.encoder.pretrained", False)
+conf.put("train.num_workers", 0)
+conf.put("train.views_per_object", 0)
+net = make_model(conf["model"]).to(device=device)
+renderer = NeRFRenderer.from_conf(conf["renderer"]).to(device=device)
+render_par = renderer.bind_parallel(net).eval()
+z_near, z_far = 0.8, 1.8
+focal, c = util.feat_intrinsics(net.feat_size)
+
+
+class SyntheticViews(torch.utils.data.Dataset):
+    """
+    Random single views in the format of the training set
+    """
+
+    z_near, z_far, lindisp = z_near, z_far, False
+
+    def __len__(self):
+        return 16
+
+    def __getitem__(self, index):
+        return {
+            "images": torch.rand(3, 128, 128) * 2 - 1,
+            "poses": util.pose_spherical(float(index * 20), -10.0, 1.3),
+            "focal": focal,
+            "c": c,
+        }
+
+
+train_args = train_script.extra_args(argparse.ArgumentParser()).parse_args([])
+tmp_dir = tempfile.mkdtemp(prefix="check_amp_grads_")
+train_args.name = "check"
+train_args.logs_path = train_args.checkpoints_path = train_args.visual_path = tmp_dir
+train_args.resume = False
+train_args.lr = 1e-4
+train_args.gamma = 1.0
+train_args.epochs = 1
+train_args.amp = "none"
+train_args.gpu_id = [0]
+dset = SyntheticViews()
+trainer = train_script.PixelNeRFTrainer(
+    net, renderer, render_par, dset, dset, train_args, conf, device=device
+)
+data = torch.utils.data.default_collate([dset[i] for i in range(args.batch_size)])
+data = {k: v.to(device=device) for k, v in data.items()}
+
+modules = {"net": net, "renderer": renderer, "discriminator": trainer.discriminator}
+optimizers = {"optim": trainer.optim, "optim_d": trainer.optim_d}
+init_state = copy.deepcopy(
+    {name: x.state_dict() for name, x in list(modules.items()) + list(optimizers.items())}
+)
+
+# Gradients each optimizer steps with, in call order
+recorded = []
+
+
+def record(optimizer, *_):
+    grads = [p.grad.detach().float().clone() for group in optimizer.param_groups for p in group["params"] if p.grad is not None]
+    recorded.append(grads)
+
+
+for optimizer in optimizers.values():
+    optimizer.register_step_pre_hook(record)
+
+
+def run(amp, scale=None, scale_d=None):
+    """
+    train_step from the initial state
+    :param scale, scale_d initial loss scales of the generator and
+    discriminator scalers; None = no loss scaling
+    :return list of recorded gradients
+    """
+    for name, x in list(modules.items()) + list(optimizers.items()):
+        x.load_state_dict(init_state[name])
+    enabled = scale is not None
+    trainer.scaler = torch.amp.GradScaler(device.type, init_scale=scale or 1.0, enabled=enabled)
+    trainer.scaler_d = torch.amp.GradScaler(device.type, init_scale=scale_d or 1.0, enabled=enabled)
+    trainer.args.amp = amp
+    for name in ("net", "discriminator"):
+        modules[name].zero_grad(set_to_none=True)
+    net.train()
+    recorded.clear()
+    torch.manual_seed(0)
+    for step in range(args.steps):
+        trainer.train_step(data, global_step=step)
+    return list(recorded)
+
+
+def max_rel_error(grads, ref_grads):
+    err = 0.0
+    for step_grads, step_ref in zip(grads, ref_grads):
+        assert len(step_grads) == len(step_ref)
+        for g, g_ref in zip(step_grads, step_ref):
+            err = max(err, ((g - g_ref).abs().max() / g_ref.abs().max().clamp(min=1e-12)).item())
+    return err
+
+
+ref = run("none")
+checks = [("scaled", "none", args.scaled_tol)]
+if device.type == "cuda":
+    checks.append(("fp16", "fp16", args.fp16_tol))
+failed = False
+for name, amp, tol in checks:
+    # Different scales for the two updates, as they drift apart in training
+    grads = run(amp, scale=2.0 ** 14, scale_d=2.0 ** 8)
+    err = max_rel_error(grads, ref)
+    ok = len(grads) == len(ref) and err <= tol
+    failed = failed or not ok
+    print("{:7} max relative gradient error {:.2e} (tol {:.0e}) {}".format(name, err, tol, "ok" if ok else "FAILED"))
+sys.exit(1 if failed else 0)
@@ -0,0 +1,103 @@
+"""
+Bake encoded objects into feature grids for eval/render_baked.py (see model.baked).
+Writes <output>/head.pt and one <output>/<subset>.pt per object.
+"""
+import sys
+import os
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+)
+
+import torch
+import util
+from data import get_split_dataset
+from model import make_model, FeatureGrid
+from model import baked
+import tqdm
+
+
+def extra_args(parser):
+    parser.add_argument(
+        "--subset", "-S", type=str, default="0", help="Subset(s) in data to bake, space delimited"
+    )
+    parser.add_argument(
+        "--split",
+        type=str,
+        default="test",
+        help="Split of data to use train | val | test",
+    )
+    parser.add_argument(
+        "--source", "-P", type=int, default=64, help="Source view of each object",
+    )
+    parser.add_argument(
+        "--output", "-O", type=str, default="baked", help="Output directory",
+    )
+    parser.add_argument(
+        "--resolution", type=int, default=64, help="Grid resolution per axis"
+    )
+    parser.add_argument(
+        "--bound", type=float, default=1.0, help="Half extent of the grid"
+    )
+    parser.add_argument(
+        "--block_size",
+        type=int,
+        default=8,
+        help="Store only occupied blocks of this size (0 = dense grid)",
+    )
+    parser.add_argument(
+        "--sigma_thresh",
+        type=float,
+        default=0.01,
+        help="Blocks with relu(sigma) <= this everywhere are dropped",
+    )
+    return parser
+
+
+args, conf = util.args.parse_args(extra_args)
+args.resume = True
+
+device = util.get_cuda(args.gpu_id[0])
+
+dset = get_split_dataset(
+    args.dataset_format, args.datadir, want_split=args.split, training=False
+)
+
+net = make_model(conf["model"]).to(device=device)
+net.load_weights(args)
+net.eval()
+
+# Intrinsics used in training (see train.py)
+focal, c = util.feat_intrinsics(net.feat_size)
+
+os.makedirs(args.output, exist_ok=True)
+baked.save_head(os.path.join(args.output, "head.pt"), net)
+
+with torch.no_grad():
+    for subset in tqdm.tqdm(list(map(int, args.subset.split()))):
+        data = dset[subset]
+        src_view = torch.tensor([args.source])
+        shape, appearance = net.encode(
+            data["images"][src_view].unsqueeze(0).to(device=device),
+            data["poses"][src_view].unsqueeze(0).to(device=device),
+            focal.to(device=device),
+            c=c.to(device=device),
+        )
+        grid = FeatureGrid.bake(
+            net.decoder,
+            shape,
+            resolution=args.resolution,
+            bound=args.bound,
+            eval_batch_size=args.ray_batch_size,
+        )
+        out_path = os.path.join(args.output, "{:04}.pt".format(subset))
+        baked.save_object(
+            out_path,
+            grid,
+            net.poses[0],
+            shape[0],
+            appearance[0],
+            block_size=args.block_size,
+            sigma_thresh=args.sigma_thresh,
+        )
+        print("Wrote", data["path"], "to", out_path, os.path.getsize(out_path) // 1024, "KB")
@@ -151,6 +151,7 @@ render_par = renderer.bind_parallel(net, args.gpu_id, simple_output=True).eval()
 
 z_near = dset.z_near
 z_far = dset.z_far
+ray_gen = util.RayGenerator()
 
 use_source_lut = len(args.viewlist) > 0
 if use_source_lut:
@@ -245,7 +246,7 @@ with torch.no_grad():
             poses = poses[target_view_mask]  # (NV[-NS], 4, 4)
 
             all_rays = (
-                util.gen_rays(
+                ray_gen(
                     poses.reshape(-1, 4, 4),
                     W,
                     H,
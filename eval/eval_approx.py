@@ -86,6 +86,7 @@ render_par = renderer.bind_parallel(net, args.gpu_id, simple_output=True).eval()
 
 z_near = dset.z_near
 z_far = dset.z_far
+ray_gen = util.RayGenerator()
 
 torch.random.manual_seed(args.seed)
 
@@ -97,13 +98,14 @@ cnt = 0
 source = torch.tensor(list(map(int, args.source.split())), dtype=torch.long)
 NS = len(source)
 random_source = NS == 1 and source[0] == -1
+# Rays are cast on the feature map, so intrinsics are those of the feature map
+focal, c = util.feat_intrinsics(net.feat_size)
 
-with torch.no_grad():
+with torch.no_grad(), util.autocast(device, args.amp):
     for data in tqdm.tqdm(data_loader, total=len(data_loader)):
         images = data["images"]  # (SB, NV, 3, H, W)
         masks = data["masks"]  # (SB, NV, 1, H, W)
         poses = data["poses"]  # (SB, NV, 4, 4)
-        focal = data["focal"][0]
 
         images_0to1 = images * 0.5 + 0.5  # (B, 3, H, W)
 
@@ -120,9 +122,9 @@ with torch.no_grad():
 
         dest_poses = util.batched_index_select_nd(poses, dest_view)
         
-        feat_H, feat_W = 16, 16
-        all_rays = util.gen_rays(
-            dest_poses.reshape(-1, 4, 4), feat_W, feat_H, focal, z_near, z_far
+        feat_H = feat_W = net.feat_size
+        all_rays = ray_gen(
+            dest_poses.reshape(-1, 4, 4), feat_W, feat_H, focal, z_near, z_far, c=c
         ).reshape(SB, -1, 8)
 
         pri_images = util.batched_index_select_nd(images, src_view)  # (SB, NS, 3, H, W)
@@ -132,11 +134,12 @@ with torch.no_grad():
             pri_images.to(device=device),
             pri_poses.to(device=device),
             focal.to(device=device),
+            c=c.to(device=device),
         )
          
              # NV = 1            # ray: 16 x 16
         featmap = render_par(all_rays.to(device=device))        # (4, 16384, 8) -> (batch, #ray, 8)
-        rgb_fine = net.neural_renderer(featmap)
+        rgb_fine = net.neural_renderer(featmap).float()
 
         rgb_fine = rgb_fine.reshape(SB, H, W, 3).cpu().numpy()
 
@@ -106,7 +106,7 @@ render_poses = torch.stack(
     0,
 )  # (NV, 4, 4)
 
-render_rays = util.gen_rays(render_poses, W, H, focal, z_near, z_far).to(device=device)
+render_rays = util.RayGenerator()(render_poses, W, H, focal, z_near, z_far).to(device=device)
 
 
 inputs_all = os.listdir(args.input)
@@ -10,10 +10,9 @@ import torch.nn.functional as F
 import numpy as np
 import imageio
 import util
-import warnings
 from data import get_split_dataset
-from render import NeRFRenderer
-from model import make_model
+from render import NeRFRenderer, CompiledRenderer
+from model import make_model, SceneCache
 from scipy.interpolate import CubicSpline
 import tqdm
 
@@ -48,7 +47,29 @@ def extra_args(parser):
         help="Elevation angle (negative is above)",
     )
     parser.add_argument(
-        "--scale", type=float, default=1.0, help="Video scale relative to input size"
+        "--feat_size",
+        type=int,
+        default=0,
+        help="Feature map resolution to render at, the output image scales with it (0 = model.feat_size)",
+    )
+    parser.add_argument(
+        "--frame_batch", type=int, default=8, help="Number of frames rendered at once"
+    )
+    parser.add_argument(
+        "--bake_resolution",
+        type=int,
+        default=0,
+        help="Bake the density branch into a grid of this resolution and render frames by trilinear lookup (0 = exact MLP)",
+    )
+    parser.add_argument(
+        "--bake_bound", type=float, default=1.0, help="Half extent of the baked grid"
+    )
+    parser.add_argument(
+        "--compile",
+        type=str,
+        default="none",
+        choices=["none", "trace", "compile"],
+        help="Render frames with a compiled pipeline (render.CompiledRenderer)",
     )
     parser.add_argument(
         "--radius",
@@ -76,38 +97,25 @@ print("Data instance loaded:", data_path)
 images = data["images"]  # (NV, 3, H, W)
 
 poses = data["poses"]  # (NV, 4, 4)
-focal = data["focal"]
-if isinstance(focal, float):
-    # Dataset implementations are not consistent about
-    # returning float or scalar tensor in case of fx=fy
-    focal = torch.tensor(focal, dtype=torch.float32)
-focal = focal[None]
-
-c = data.get("c")
-if c is not None:
-    c = c.to(device=device).unsqueeze(0)
 
 NV, _, H, W = images.shape
 
-if args.scale != 1.0:
-    Ht = int(H * args.scale)
-    Wt = int(W * args.scale)
-    if abs(Ht / args.scale - H) > 1e-10 or abs(Wt / args.scale - W) > 1e-10:
-        warnings.warn(
-            "Inexact scaling, please check {} times ({}, {}) is integral".format(
-                args.scale, H, W
-            )
-        )
-    H, W = Ht, Wt
-
 net = make_model(conf["model"]).to(device=device)
 net.load_weights(args)
 
+# Feature map resolution (default: the one trained with) and its intrinsics;
+# the neural renderer upsamples the feature map to the output image
+feat_H = feat_W = args.feat_size if args.feat_size > 0 else net.feat_size
+focal, c = util.feat_intrinsics(feat_H)
+
 renderer = NeRFRenderer.from_conf(
     conf["renderer"], lindisp=dset.lindisp, eval_batch_size=args.ray_batch_size,
 ).to(device=device)
 
 render_par = renderer.bind_parallel(net, args.gpu_id, simple_output=True).eval()
+compiled = None
+if args.compile != "none":
+    compiled = CompiledRenderer(net, renderer, backend=args.compile)
 
 # Get the distance from camera to origin
 z_near = dset.z_near
@@ -171,18 +179,10 @@ else:
         0,
     )  # (NV, 4, 4)
 
-render_rays = util.gen_rays(
-    render_poses,
-    W,
-    H,
-    focal * args.scale,
-    z_near,
-    z_far,
-    c=c * args.scale if c is not None else None,
+render_rays = util.RayGenerator()(
+    render_poses, feat_W, feat_H, focal, z_near, z_far, c=c
 ).to(device=device)
-# (NV, H, W, 8)
-
-focal = focal.to(device=device)
+# (NV, feat_H, feat_W, 8)
 
 source = torch.tensor(list(map(int, args.source.split())), dtype=torch.long)
 NS = len(source)
@@ -192,34 +192,48 @@ assert not (source >= NV).any()
 if renderer.n_coarse < 64:
     # Ensure decent sampling resolution
     renderer.n_coarse = 64
-    renderer.n_fine = 128
 
-with torch.no_grad():
+scene_cache = SceneCache(
+    net,
+    resolution=args.bake_resolution,
+    bound=args.bake_bound,
+    eval_batch_size=args.ray_batch_size,
+)
+
+with torch.no_grad(), util.autocast(device, args.amp):
     print("Encoding source view(s)")
     if random_source:
         src_view = torch.randint(0, NV, (1,))
     else:
         src_view = source
 
-    net.encode(
-        images[src_view].unsqueeze(0),
+    # One encode (and bake, if enabled) for all frames
+    shape, appearance = scene_cache.encode(
+        data_path,
+        images[src_view].unsqueeze(0).to(device=device),
         poses[src_view].unsqueeze(0).to(device=device),
-        focal,
-        c=c,
+        focal.to(device=device),
+        c=c.to(device=device),
     )
 
-    print("Rendering", args.num_views * H * W, "rays")
-    all_rgb_fine = []
-    for rays in tqdm.tqdm(
-        torch.split(render_rays.view(-1, 8), args.ray_batch_size, dim=0)
-    ):
-        rgb, _depth = render_par(rays[None])
-        all_rgb_fine.append(rgb[0])
-    _depth = None
-    rgb_fine = torch.cat(all_rgb_fine)
-    # rgb_fine (V*H*W, 3)
-
-    frames = rgb_fine.view(-1, H, W, 3)
+    print("Rendering", args.num_views, "frames")
+    frames = []
+    for rays in tqdm.tqdm(torch.split(render_rays, args.frame_batch, dim=0)):
+        n_frames = rays.shape[0]
+        if compiled is not None:
+            rgb = compiled(rays.reshape(1, -1, 8), n_frames, shape, appearance)
+        else:
+            feat = render_par(
+                rays.reshape(1, -1, 8),
+                val_num=n_frames,
+                shape=shape,
+                appearance=appearance,
+            )  # (n_frames, C, feat_H, feat_W)
+            rgb = net.neural_renderer(feat)  # (n_frames, 3, H, W)
+        rgb = rgb.float()
+        frames.append(rgb.clamp(0.0, 1.0).permute(0, 2, 3, 1))
+    frames = torch.cat(frames)
+    scene_cache.clear()
 
 print("Writing video")
 vid_name = "{:04}".format(args.subset)
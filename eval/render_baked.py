@@ -0,0 +1,89 @@
+"""
+Render turntable videos of objects baked by eval/bake.py.
+Needs neither the image encoder nor the density MLP; runs on CPU by default.
+Usage: python eval/render_baked.py -B baked -I 0000 0001 [-c conf/exp/srn.conf]
+"""
+import sys
+import os
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+)
+
+import argparse
+import torch
+import numpy as np
+import imageio
+import util
+from pyhocon import ConfigFactory
+from render import NeRFRenderer
+from model.baked import BakedField
+import tqdm
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--bake_dir", "-B", type=str, required=True, help="Output of eval/bake.py")
+parser.add_argument("--objects", "-I", type=str, nargs="+", required=True, help="Baked object names")
+parser.add_argument("--conf", "-c", type=str, default="conf/exp/srn.conf", help="Config for the renderer")
+parser.add_argument("--output", "-O", type=str, default="output", help="Output directory")
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--num_views", type=int, default=40, help="Number of video frames")
+parser.add_argument("--elevation", type=float, default=-10.0, help="Elevation angle (negative is above)")
+parser.add_argument("--radius", type=float, default=1.3, help="Distance of camera from origin")
+parser.add_argument("--z_near", type=float, default=0.8)
+parser.add_argument("--z_far", type=float, default=1.8)
+parser.add_argument("--feat_size", type=int, default=0, help="Feature map resolution to render at (0 = as trained)")
+parser.add_argument("--frame_batch", type=int, default=8, help="Number of frames rendered at once")
+parser.add_argument("--fps", type=int, default=30, help="FPS of video")
+parser.add_argument(
+    "--amp", type=str, default="none", choices=["none", "fp16", "bf16"], help="Mixed precision mode (bf16 on CPU)"
+)
+args = parser.parse_args()
+
+device = torch.device(args.device)
+conf = ConfigFactory.parse_file(args.conf)
+
+net = BakedField(os.path.join(args.bake_dir, "head.pt")).to(device=device).eval()
+renderer = NeRFRenderer.from_conf(conf["renderer"]).to(device=device)
+# Occupancy grids are built with the decoder's density branch, which is not
+# loaded in a BakedField (the baked grids already hold the density)
+renderer.occupancy = None
+render_par = renderer.bind_parallel(net, simple_output=True).eval()
+
+# Feature map resolution (default: the one trained with) and its intrinsics
+feat_H = feat_W = args.feat_size if args.feat_size > 0 else net.feat_size
+focal, c = util.feat_intrinsics(feat_H)
+
+render_poses = torch.stack(
+    [
+        util.pose_spherical(angle, args.elevation, args.radius)
+        for angle in np.linspace(-180, 180, args.num_views + 1)[:-1]
+    ],
+    0,
+)  # (NV, 4, 4)
+render_rays = util.RayGenerator()(
+    render_poses, feat_W, feat_H, focal, args.z_near, args.z_far, c=c
+).to(device=device)  # (NV, feat_H, feat_W, 8)
+
+os.makedirs(args.output, exist_ok=True)
+with torch.no_grad(), util.autocast(device, args.amp):
+    shape, appearance = net.load_objects(
+        [os.path.join(args.bake_dir, name + ".pt") for name in args.objects]
+    )
+    SB = shape.shape[0]
+    frames = []
+    for rays in tqdm.tqdm(torch.split(render_rays, args.frame_batch, dim=0)):
+        n_frames = rays.shape[0]
+        feat = render_par(
+            rays.reshape(1, -1, 8).expand(SB, -1, -1),
+            val_num=n_frames,
+            shape=shape,
+            appearance=appearance,
+        )  # (SB * n_frames, C, feat_H, feat_W)
+        rgb = net.neural_renderer(feat).float().clamp(0.0, 1.0)
+        frames.append(rgb.view(SB, n_frames, *rgb.shape[1:]).permute(0, 1, 3, 4, 2))
+    frames = (torch.cat(frames, dim=1).cpu().numpy() * 255).astype(np.uint8)
+
+for name, obj_frames in zip(args.objects, frames):
+    vid_path = os.path.join(args.output, "baked_" + name + ".mp4")
+    imageio.mimwrite(vid_path, obj_frames, fps=args.fps, quality=8)
+    print("Wrote to", vid_path)
@@ -0,0 +1,138 @@
+"""
+Shape/appearance swap matrices from a persisted latent store.
+Encodes a library of images once into a LatentStore (shape, appearance,
+input pose and predicted camera pose per image id), then renders
+(shape_i, appearance_j, pose_k) combinations in batches: one grid per render
+pose, rows = shapes, columns = appearances.
+Render poses are either the predicted camera poses of stored images (as the
+swapped views in training) or a turntable.
+
+Usage:
+python eval/swap_matrix.py -n srn_car -I input --store latents.pt  (image directory)
+python eval/swap_matrix.py -n srn_car -D data/cars --split test --store latents.pt
+    [--shapes id ...] [--appearances id ...] [--pose_ids id ... | --num_views 4]
+"""
+import sys
+import os
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+)
+
+import json
+import numpy as np
+import torch
+import tqdm
+import util
+from PIL import Image
+from torchvision.utils import save_image
+from data import get_split_dataset
+from model import make_model, LatentStore
+from render import NeRFRenderer, ObjectRenderer
+
+
+def extra_args(parser):
+    parser.add_argument(
+        "--input", "-I", type=str, default=None, help="Image directory to encode instead of a dataset"
+    )
+    parser.add_argument("--split", type=str, default="test", help="Dataset split to encode")
+    parser.add_argument("--source", "-P", type=int, default=64, help="Dataset view to encode per object")
+    parser.add_argument("--store", type=str, required=True, help="Latent store file, created or extended")
+    parser.add_argument("--max_objects", type=int, default=0, help="Max number of new images to encode (0 = all)")
+    parser.add_argument("--shapes", type=str, nargs="*", default=None, help="Image ids for the rows (default: first 8)")
+    parser.add_argument("--appearances", type=str, nargs="*", default=None, help="Image ids for the columns (default: shapes)")
+    parser.add_argument(
+        "--pose_ids", type=str, nargs="*", default=None, help="Render from the predicted camera poses of these images"
+    )
+    parser.add_argument("--num_views", type=int, default=1, help="Turntable views, if no --pose_ids")
+    parser.add_argument("--elevation", type=float, default=-10.0)
+    parser.add_argument("--radius", type=float, default=1.3)
+    parser.add_argument("--z_near", type=float, default=0.8)
+    parser.add_argument("--z_far", type=float, default=1.8)
+    parser.add_argument("--batch_size", "-B", type=int, default=32, help="Images per encode / combinations per render")
+    return parser
+
+
+def library():
+    """
+    Images to encode
+    :return generator of (image id, (3, H, W) image in [-1, 1])
+    """
+    if args.input is not None:
+        image_to_tensor = util.get_image_to_tensor_balanced()
+        for name in sorted(os.listdir(args.input)):
+            if not name.lower().endswith((".png", ".jpg", ".jpeg")):
+                continue
+            image = Image.open(os.path.join(args.input, name)).convert("RGB")
+            image = image.resize((128, 128), Image.BILINEAR)
+            yield os.path.splitext(name)[0], image_to_tensor(image)
+    else:
+        dset = get_split_dataset(
+            args.dataset_format, args.datadir, want_split=args.split, training=False
+        )
+        for i in range(len(dset)):
+            data = dset[i]
+            yield os.path.basename(data["path"]), data["images"][args.source]
+
+
+args, conf = util.args.parse_args(extra_args, default_expname="srn_car", default_data_format="srn")
+args.resume = True
+device = util.get_cuda(args.gpu_id[0])
+
+net = make_model(conf["model"]).to(device=device).load_weights(args).eval()
+renderer = NeRFRenderer.from_conf(conf["renderer"], eval_batch_size=args.ray_batch_size).to(device=device).eval()
+api = ObjectRenderer(net, renderer, z_near=args.z_near, z_far=args.z_far)
+store = LatentStore(args.store)
+
+# Encode images not in the store yet
+with util.autocast(device, args.amp):
+    batch_ids, batch_images = [], []
+    num_new = 0
+    for image_id, image in library():
+        if args.max_objects > 0 and num_new >= args.max_objects:
+            break
+        if image_id in store:
+            continue
+        batch_ids.append(image_id)
+        batch_images.append(image)
+        num_new += 1
+        if len(batch_ids) == args.batch_size:
+            store.add(batch_ids, api.encode(torch.stack(batch_images)))
+            batch_ids, batch_images = [], []
+    if batch_ids:
+        store.add(batch_ids, api.encode(torch.stack(batch_images)))
+if num_new > 0:
+    store.save()
+print("Latent store", args.store, "has", len(store), "images,", num_new, "new")
+
+shape_ids = args.shapes or store.ids[:8]
+appearance_ids = args.appearances or shape_ids
+if args.pose_ids:
+    pose_names = args.pose_ids
+    render_poses = store.get(args.pose_ids).rotmat
+else:
+    angles = np.linspace(-180, 180, args.num_views + 1)[:-1]
+    pose_names = ["turntable{:03}".format(k) for k in range(args.num_views)]
+    render_poses = torch.stack(
+        [util.pose_spherical(angle, args.elevation, args.radius) for angle in angles]
+    )
+
+# All (shape, appearance) pairs, each rendered from all poses
+combos = [(s, a) for s in shape_ids for a in appearance_ids]
+rows = []
+with util.autocast(device, args.amp):
+    for start in tqdm.tqdm(range(0, len(combos), args.batch_size)):
+        chunk = combos[start : start + args.batch_size]
+        codes = store.combine([s for s, _ in chunk], [a for _, a in chunk])
+        poses = render_poses[None].expand(len(chunk), -1, -1, -1)
+        rows.append(api.render(codes, poses).cpu())  # (N, K, 3, H, W)
+images = torch.cat(rows)  # (S * A, K, 3, H, W)
+
+out_dir = os.path.join(args.visual_path, args.name, "swap_matrix")
+os.makedirs(out_dir, exist_ok=True)
+for k, pose_name in enumerate(pose_names):
+    path = os.path.join(out_dir, "swap_{}.png".format(pose_name))
+    save_image(images[:, k], path, nrow=len(appearance_ids), padding=2)
+with open(os.path.join(out_dir, "index.json"), "w") as f:
+    json.dump({"rows_shape": shape_ids, "cols_appearance": appearance_ids, "poses": pose_names}, f, indent=2)
+print("Wrote", len(pose_names), "swap matrices to", out_dir)
@@ -0,0 +1,110 @@
+"""
+Convert an SRN dataset (cars/chairs) into memory-mapped arrays for SRNShardDataset.
+Usage: python scripts/srn_to_shards.py -D data/cars [--stages train val test]
+reads data/cars_<stage>/*/{rgb,pose,intrinsics.txt} and writes data/cars_<stage>_shard/
+"""
+import sys
+import os
+import os.path as osp
+import argparse
+import glob
+import json
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), ".."))
+sys.path.insert(0, osp.join(ROOT_DIR, "src"))
+
+import numpy as np
+import imageio
+import tqdm
+from data.SRNShardDataset import shard_dir
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--datadir", "-D", type=str, required=True, help="SRN dataset path, e.g. data/cars"
+)
+parser.add_argument(
+    "--stages", type=str, nargs="+", default=["train", "val", "test"], help="Splits to convert"
+)
+args = parser.parse_args()
+
+# Same as SRNDataset._coord_trans
+_coord_trans = np.diag(np.array([1, -1, -1, 1], dtype=np.float32))
+
+
+def convert(path, stage):
+    base_path = path + "_" + stage
+    if not osp.exists(base_path):
+        print("Skipping missing split", base_path)
+        return
+    if "chair" in osp.basename(path) and stage == "train":
+        # Ugly thing from SRN's public dataset
+        tmp = osp.join(base_path, "chairs_2.0_train")
+        if osp.exists(tmp):
+            base_path = tmp
+
+    intrins = sorted(glob.glob(osp.join(base_path, "*", "intrinsics.txt")))
+    obj_paths = [osp.dirname(x) for x in intrins]
+    all_rgb_paths, all_pose_paths = [], []
+    for dir_path in obj_paths:
+        rgb_paths = sorted(glob.glob(osp.join(dir_path, "rgb", "*")))
+        pose_paths = sorted(glob.glob(osp.join(dir_path, "pose", "*")))
+        assert len(rgb_paths) == len(pose_paths)
+        all_rgb_paths.append(rgb_paths)
+        all_pose_paths.append(pose_paths)
+    offsets = np.cumsum([0] + [len(x) for x in all_rgb_paths]).astype(np.int64)
+    num_views = int(offsets[-1])
+    assert num_views > 0, "no views found in " + base_path
+
+    H, W = imageio.imread(all_rgb_paths[0][0]).shape[:2]
+    out_dir = shard_dir(path, stage)
+    os.makedirs(out_dir, exist_ok=True)
+    print("Converting", len(obj_paths), "objects,", num_views, "views to", out_dir)
+
+    open_out = lambda name, dtype, shape: np.lib.format.open_memmap(
+        osp.join(out_dir, name + ".npy"), mode="w+", dtype=dtype, shape=shape
+    )
+    images = open_out("images", np.uint8, (num_views, H, W, 3))
+    masks = open_out("masks", np.uint8, (num_views, H, W))
+    poses = open_out("poses", np.float32, (num_views, 4, 4))
+    bboxes = open_out("bboxes", np.float32, (num_views, 4))
+    intrinsics = np.zeros((len(obj_paths), 3), dtype=np.float32)
+
+    for obj_idx, intrin_path in enumerate(tqdm.tqdm(intrins)):
+        with open(intrin_path, "r") as intrinfile:
+            lines = intrinfile.readlines()
+            focal, cx, cy, _ = map(float, lines[0].split())
+        intrinsics[obj_idx] = focal, cx, cy
+
+        start = offsets[obj_idx]
+        for i, (rgb_path, pose_path) in enumerate(
+            zip(all_rgb_paths[obj_idx], all_pose_paths[obj_idx])
+        ):
+            img = imageio.imread(rgb_path)[..., :3]
+            mask = (img != 255).all(axis=-1)
+            rows = np.any(mask, axis=1)
+            cols = np.any(mask, axis=0)
+            rnz = np.where(rows)[0]
+            cnz = np.where(cols)[0]
+            if len(rnz) == 0:
+                raise RuntimeError(
+                    "ERROR: Bad image at", rgb_path, "please investigate!"
+                )
+            rmin, rmax = rnz[[0, -1]]
+            cmin, cmax = cnz[[0, -1]]
+
+            pose = np.loadtxt(pose_path, dtype=np.float32).reshape(4, 4)
+            images[start + i] = img
+            masks[start + i] = mask.astype(np.uint8) * 255
+            poses[start + i] = pose @ _coord_trans
+            bboxes[start + i] = cmin, rmin, cmax, rmax
+
+    for arr in (images, masks, poses, bboxes):
+        arr.flush()
+    np.save(osp.join(out_dir, "intrinsics.npy"), intrinsics)
+    np.save(osp.join(out_dir, "offsets.npy"), offsets)
+    with open(osp.join(out_dir, "meta.json"), "w") as f:
+        json.dump({"paths": obj_paths, "num_views": num_views}, f)
+
+
+for stage in args.stages:
+    convert(args.datadir, stage)
@@ -0,0 +1,82 @@
+"""
+Client for serve/server.py. Sends render requests (optionally many at once,
+to exercise request coalescing), writes the returned frames and prints the
+latencies and the server metrics.
+Usage: python serve/client.py -I input/car.png [--appearance other.png]
+[--num_views 8] [--concurrency 8 --requests 32] [-O output]
+"""
+import argparse
+import base64
+import concurrent.futures
+import json
+import os
+import time
+import urllib.request
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", type=str, default="http://127.0.0.1:8000")
+parser.add_argument("--images", "-I", type=str, nargs="+", required=True, help="Source images, sent round robin")
+parser.add_argument("--appearance", type=str, default=None, help="Image to take the appearance from (edited view)")
+parser.add_argument("--num_views", type=int, default=8)
+parser.add_argument("--elevation", type=float, default=-10.0)
+parser.add_argument("--resolution", type=int, default=None, help="Feature map size (default: model's)")
+parser.add_argument("--requests", type=int, default=1, help="Total number of requests")
+parser.add_argument("--concurrency", type=int, default=1, help="Number of requests in flight")
+parser.add_argument("--output", "-O", type=str, default=None, help="Directory to write the frames of each request to")
+args = parser.parse_args()
+
+
+def read_b64(path):
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
+
+def call(path, body=None):
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    req = urllib.request.Request(
+        args.url + path, data=data, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())
+
+
+images = [read_b64(path) for path in args.images]
+appearance = read_b64(args.appearance) if args.appearance is not None else None
+
+
+def send(i):
+    body = {
+        "image": images[i % len(images)],
+        "appearance_image": appearance,
+        "num_views": args.num_views,
+        "elevation": args.elevation,
+        "resolution": args.resolution,
+    }
+    t0 = time.perf_counter()
+    result = call("/render", body)
+    latency = time.perf_counter() - t0
+    if args.output is not None:
+        out_dir = os.path.join(args.output, "{:04}".format(i))
+        os.makedirs(out_dir, exist_ok=True)
+        for j, frame in enumerate(result["images"]):
+            with open(os.path.join(out_dir, "{:04}.png".format(j)), "wb") as f:
+                f.write(base64.b64decode(frame))
+    return latency
+
+
+t0 = time.perf_counter()
+with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+    latencies = list(pool.map(send, range(args.requests)))
+total = time.perf_counter() - t0
+
+latencies.sort()
+print(
+    "{} requests in {:.2f}s ({:.2f} req/s), latency p50 {:.3f}s max {:.3f}s".format(
+        len(latencies),
+        total,
+        len(latencies) / total,
+        latencies[len(latencies) // 2],
+        latencies[-1],
+    )
+)
+print(json.dumps(call("/metrics"), indent=2))
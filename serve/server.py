@@ -0,0 +1,422 @@
+"""
+Long-lived local rendering service.
+Loads the model once and serves turntable / edited views of uploaded images
+over HTTP. Concurrent requests are coalesced into superbatches: the worker
+waits up to --max_wait_ms after the first queued request (or until
+--max_batch requests are queued), then encodes all new images in one encoder
+call and renders all requests with the same number of views in one forward.
+Codes of recently seen images are cached.
+
+Endpoints (JSON):
+POST /render {"image": base64 image, "appearance_image": optional base64
+image whose appearance is used instead, "num_views": V, "elevation": deg,
+"radius": r, "poses": optional (V, 4, 4) list instead of a turntable,
+"resolution": optional feature map size}
+-> {"images": [base64 png] * V, "latency": seconds}
+GET /metrics -> queue depth, request/batch counts, latency percentiles
+GET /health
+
+Usage: python serve/server.py -n srn_car -c conf/exp/srn.conf [--port 8000]
+See serve/client.py for a client.
+"""
+import sys
+import os
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import hashlib
+import io
+import json
+import time
+import numpy as np
+import torch
+import util
+from PIL import Image
+from model import make_model, ObjectCode
+from render import NeRFRenderer, ObjectRenderer
+
+
+def extra_args(parser):
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--max_batch", type=int, default=16, help="Max number of requests per superbatch"
+    )
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=20.0,
+        help="Latency budget for coalescing: how long the first queued request waits for others",
+    )
+    parser.add_argument(
+        "--code_cache", type=int, default=256, help="Number of encoded images kept"
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="eager",
+        choices=["eager", "trace", "compile"],
+        help="Render backend (see render.CompiledRenderer)",
+    )
+    parser.add_argument("--size", type=int, default=128, help="Input image size")
+    parser.add_argument("--z_near", type=float, default=0.8)
+    parser.add_argument("--z_far", type=float, default=1.8)
+    parser.add_argument(
+        "--max_views", type=int, default=64, help="Max number of views per request"
+    )
+    parser.add_argument(
+        "--max_resolution",
+        type=int,
+        default=64,
+        help="Max feature map size per request (images are 128 / feat_size times larger)",
+    )
+    return parser
+
+
+class Metrics:
+    """
+    Request and batch statistics, latencies over the last window requests
+    """
+
+    def __init__(self, window=1000):
+        self.num_requests = 0
+        self.num_errors = 0
+        self.num_batches = 0
+        self.num_encoded = 0
+        self.num_cache_hits = 0
+        self.latency = collections.deque(maxlen=window)
+        self.queue_wait = collections.deque(maxlen=window)
+        self.batch_size = collections.deque(maxlen=window)
+
+    def snapshot(self, queue_depth):
+        def percentiles(values):
+            if len(values) == 0:
+                return {}
+            p = np.percentile(np.array(values), [50, 95, 99])
+            return {"p50": p[0], "p95": p[1], "p99": p[2], "max": max(values)}
+
+        return {
+            "queue_depth": queue_depth,
+            "requests": self.num_requests,
+            "errors": self.num_errors,
+            "batches": self.num_batches,
+            "mean_batch_size": float(np.mean(self.batch_size)) if self.batch_size else 0.0,
+            "encoded_images": self.num_encoded,
+            "code_cache_hits": self.num_cache_hits,
+            "latency_s": percentiles(self.latency),
+            "queue_wait_s": percentiles(self.queue_wait),
+        }
+
+
+class RenderRequest:
+    """
+    :param image (3, H, W) source image in [-1, 1]
+    :param image_key digest of the source image, for the code cache
+    :param poses (V, 4, 4) poses to render
+    :param appearance optional (image, image_key) to take the appearance from
+    :param resolution feature map size, None = model's
+    """
+
+    def __init__(self, image, image_key, poses, appearance=None, resolution=None):
+        self.image = image
+        self.image_key = image_key
+        self.poses = poses
+        self.appearance = appearance
+        self.resolution = resolution
+        self.t_submit = time.perf_counter()
+        self.future = None
+
+
+class Batcher:
+    """
+    Coalesces queued requests into superbatches and runs them on one
+    executor thread (the model runs one batch at a time)
+    :param api render.ObjectRenderer
+    :param max_batch max number of requests per batch
+    :param max_wait max seconds the oldest request waits for a batch to fill
+    :param code_cache number of ObjectCodes of seen images kept
+    """
+
+    def __init__(self, api, max_batch=16, max_wait=0.02, code_cache=256, amp="none"):
+        self.api = api
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.code_cache = code_cache
+        self.amp = amp
+        self.codes = collections.OrderedDict()
+        self.queue = asyncio.Queue()
+        self.metrics = Metrics()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, request):
+        """
+        :return images (V, 3, H, W) uint8
+        """
+        request.future = asyncio.get_running_loop().create_future()
+        await self.queue.put(request)
+        return await request.future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = batch[0].t_submit + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            t_start = time.perf_counter()
+            for req in batch:
+                self.metrics.queue_wait.append(t_start - req.t_submit)
+            try:
+                results = await loop.run_in_executor(self.executor, self._process, batch)
+            except Exception as e:
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                self.metrics.num_errors += len(batch)
+                continue
+            self.metrics.num_batches += 1
+            self.metrics.batch_size.append(len(batch))
+            t_end = time.perf_counter()
+            for req, images in zip(batch, results):
+                if isinstance(images, Exception):
+                    self.metrics.num_errors += 1
+                    if not req.future.done():
+                        req.future.set_exception(images)
+                    continue
+                self.metrics.latency.append(t_end - req.t_submit)
+                if not req.future.done():
+                    req.future.set_result(images)
+
+    def _get_codes(self, images):
+        """
+        :param images dict image_key -> (3, H, W) image
+        :return dict image_key -> single-object ObjectCode
+        """
+        codes, missing = {}, []
+        for key in images:
+            if key in self.codes:
+                self.codes.move_to_end(key)
+                codes[key] = self.codes[key]
+                self.metrics.num_cache_hits += 1
+            else:
+                missing.append(key)
+        if missing:
+            # One encoder call for all new images of the batch
+            new_codes = self.api.encode(torch.stack([images[key] for key in missing]))
+            for key, code in zip(missing, new_codes.split()):
+                codes[key] = self.codes[key] = code
+            self.metrics.num_encoded += len(missing)
+            while len(self.codes) > self.code_cache:
+                self.codes.popitem(last=False)
+        return codes
+
+    def _process(self, batch):
+        """
+        :return per request, images (V, 3, H, W) uint8 or the exception
+        raised rendering its group (other groups still render)
+        """
+        with util.autocast(self.api.device, self.amp):
+            images = {req.image_key: req.image for req in batch}
+            for req in batch:
+                if req.appearance is not None:
+                    images[req.appearance[1]] = req.appearance[0]
+            codes = self._get_codes(images)
+
+            # Requests with the same view count and resolution render together
+            groups = collections.defaultdict(list)
+            for i, req in enumerate(batch):
+                groups[(req.poses.shape[0], req.resolution)].append(i)
+            results = [None] * len(batch)
+            for (_, resolution), indices in groups.items():
+                req_codes = []
+                for i in indices:
+                    code = codes[batch[i].image_key]
+                    if batch[i].appearance is not None:
+                        # Edited view: appearance of the other image
+                        code = ObjectCode(
+                            code.shape,
+                            codes[batch[i].appearance[1]].appearance,
+                            code.input_poses,
+                            code.rotmat,
+                        )
+                    req_codes.append(code)
+                poses = torch.stack([batch[i].poses for i in indices])
+                try:
+                    out = self.api.render(
+                        ObjectCode.cat(req_codes), poses, resolution=resolution
+                    )
+                except Exception as e:
+                    # Only fail the requests of this group
+                    for i in indices:
+                        results[i] = e
+                    continue
+                out = (out * 255).round().to(torch.uint8).cpu()
+                for i, images_i in zip(indices, out):
+                    results[i] = images_i
+        return results
+
+
+def decode_image(data, size):
+    """
+    :param data base64 encoded image file
+    :return (3, size, size) in [-1, 1], digest of the file
+    """
+    raw = base64.b64decode(data)
+    image = Image.open(io.BytesIO(raw)).convert("RGB")
+    if image.size != (size, size):
+        image = image.resize((size, size), Image.BILINEAR)
+    return image_to_tensor(image), hashlib.sha1(raw).hexdigest()
+
+
+def encode_png(image):
+    """
+    :param image (3, H, W) uint8 tensor
+    :return base64 png
+    """
+    buf = io.BytesIO()
+    Image.fromarray(image.permute(1, 2, 0).numpy()).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def parse_render_request(body):
+    image, image_key = decode_image(body["image"], args.size)
+    appearance = None
+    if body.get("appearance_image") is not None:
+        appearance = decode_image(body["appearance_image"], args.size)
+    if body.get("poses") is not None:
+        poses = torch.tensor(body["poses"], dtype=torch.float32).view(-1, 4, 4)
+    else:
+        num_views = int(body.get("num_views", 8))
+        elevation = float(body.get("elevation", -10.0))
+        radius = float(body.get("radius", (args.z_near + args.z_far) * 0.5))
+        poses = torch.stack(
+            [
+                util.pose_spherical(angle, elevation, radius)
+                for angle in np.linspace(-180, 180, num_views + 1)[:-1]
+            ]
+        )
+    if not 0 < poses.shape[0] <= args.max_views:
+        raise ValueError("number of views must be in [1, {}]".format(args.max_views))
+    resolution = body.get("resolution")
+    if resolution is not None:
+        resolution = int(resolution)
+        if not 0 < resolution <= args.max_resolution:
+            raise ValueError(
+                "resolution must be in [1, {}]".format(args.max_resolution)
+            )
+    return RenderRequest(
+        image, image_key, poses, appearance=appearance, resolution=resolution
+    )
+
+
+async def write_response(writer, status, obj):
+    payload = json.dumps(obj).encode("utf-8")
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+    writer.write(
+        (
+            "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+            "Content-Length: {}\r\nConnection: close\r\n\r\n"
+        ).format(status, reason, len(payload)).encode("ascii")
+        + payload
+    )
+    await writer.drain()
+
+
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+async def handle(reader, writer):
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) < 2:
+            return
+        method, path = request_line[0], request_line[1]
+        if method == "GET" and path == "/health":
+            await write_response(writer, 200, {"status": "ok"})
+        elif method == "GET" and path == "/metrics":
+            await write_response(writer, 200, batcher.metrics.snapshot(batcher.queue.qsize()))
+        elif method == "POST" and path == "/render":
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_SIZE:
+                await write_response(writer, 400, {"error": "request too large"})
+                return
+            batcher.metrics.num_requests += 1
+            try:
+                request = parse_render_request(json.loads(await reader.readexactly(length)))
+            except Exception as e:
+                batcher.metrics.num_errors += 1
+                await write_response(writer, 400, {"error": str(e)})
+                return
+            try:
+                images = await batcher.submit(request)
+            except Exception as e:
+                await write_response(writer, 500, {"error": str(e)})
+                return
+            await write_response(
+                writer,
+                200,
+                {
+                    "images": [encode_png(image) for image in images],
+                    "latency": time.perf_counter() - request.t_submit,
+                },
+            )
+        else:
+            await write_response(writer, 404, {"error": "not found"})
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    global batcher
+    batcher = Batcher(
+        api,
+        max_batch=args.max_batch,
+        max_wait=args.max_wait_ms / 1000.0,
+        code_cache=args.code_cache,
+        amp=args.amp,
+    )
+    worker = asyncio.ensure_future(batcher.run())
+    server = await asyncio.start_server(handle, args.host, args.port)
+    print("Serving on http://{}:{}".format(args.host, args.port))
+    async with server:
+        await server.serve_forever()
+    worker.cancel()
+
+
+if __name__ == "__main__":
+    args, conf = util.args.parse_args(
+        extra_args, default_expname="srn_car", default_data_format="srn",
+    )
+    args.resume = True
+
+    device = util.get_cuda(args.gpu_id[0])
+    net = make_model(conf["model"]).to(device=device).load_weights(args).eval()
+    renderer = NeRFRenderer.from_conf(
+        conf["renderer"], eval_batch_size=args.ray_batch_size
+    ).to(device=device).eval()
+    api = ObjectRenderer(
+        net, renderer, z_near=args.z_near, z_far=args.z_far, backend=args.backend
+    )
+    image_to_tensor = util.get_image_to_tensor_balanced()
+    batcher = None
+    asyncio.run(main())
@@ -74,6 +74,16 @@ class SRNDataset(torch.utils.data.Dataset):
             glob.glob(os.path.join(self.base_path, "*", "pose", "*"))
         )
 
+        # Train-mode indices of the views of each object, for ObjectBatchSampler
+        obj_dirs = [os.path.dirname(os.path.dirname(x)) for x in self.rgb]
+        self.obj_view_indices = []
+        self.view_obj_ids = []
+        for i, obj_dir in enumerate(obj_dirs):
+            if i == 0 or obj_dir != obj_dirs[i - 1]:
+                self.obj_view_indices.append([])
+            self.obj_view_indices[-1].append(i)
+            self.view_obj_ids.append(len(self.obj_view_indices) - 1)
+
 
     def __len__(self):
         if self.stage == 'train':
@@ -127,6 +137,7 @@ class SRNDataset(torch.utils.data.Dataset):
             result = {
                 # "path": dir_path,       # dir_path: 50개짜리 이미지 묶음 있는 디렉토리 
                 "img_id": index,
+                "obj_id": self.view_obj_ids[index],
                 "focal": self.focal,
                 "c": torch.tensor([self.cx, self.cy], dtype=torch.float32),
                 "images": img_tensor,
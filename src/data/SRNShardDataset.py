@@ -0,0 +1,158 @@
+import os
+import json
+import torch
+import torch.nn.functional as F
+import numpy as np
+
+# Array files of a shard directory, written by scripts/srn_to_shards.py
+SHARD_ARRAYS = ("images", "masks", "poses", "bboxes", "intrinsics", "offsets")
+
+
+def shard_dir(path, stage):
+    return path + "_" + stage + "_shard"
+
+
+class SRNShardDataset(torch.utils.data.Dataset):
+    """
+    SRN dataset preprocessed into memory-mapped arrays by scripts/srn_to_shards.py.
+    Serves the same items as SRNDataset, but without decoding PNGs or parsing
+    poses: images/masks are stored as uint8, poses (already in our coordinate
+    convention), bboxes and per-object intrinsics as float32, and
+    offsets[i]:offsets[i + 1] are the views of object i.
+    """
+
+    def __init__(
+        self, path, stage="train", image_size=(128, 128), world_scale=1.0,
+    ):
+        """
+        :param path dataset path passed to srn_to_shards.py (e.g. data/cars)
+        :param stage train | val | test
+        :param image_size result image size (resizes if different)
+        :param world_scale amount to scale entire world by
+        """
+        super().__init__()
+        self.stage = stage
+        self.base_path = shard_dir(path, stage)
+        self.dataset_name = os.path.basename(path)
+
+        print("Loading SRN shards", self.base_path, "name:", self.dataset_name)
+        assert os.path.exists(self.base_path), "run scripts/srn_to_shards.py first"
+
+        with open(os.path.join(self.base_path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.obj_paths = meta["paths"]
+        self.num_views = meta["num_views"]
+
+        self.image_size = image_size
+        self.world_scale = world_scale
+
+        is_chair = "chair" in self.dataset_name
+        if is_chair:
+            self.z_near = 1.25
+            self.z_far = 2.75
+        else:
+            self.z_near = 0.8
+            self.z_far = 1.8
+        self.lindisp = False
+
+        # Same normalized intrinsics as SRNDataset uses in training
+        self.focal, self.cx, self.cy = 2.187719, 8.000000, 8.000000
+
+        # Opened lazily so that each loader worker maps the files itself
+        self._arrays = None
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            # Copy-on-write maps are writable, so torch.from_numpy is zero-copy
+            self._arrays = {
+                name: np.load(
+                    os.path.join(self.base_path, name + ".npy"), mmap_mode="c"
+                )
+                for name in SHARD_ARRAYS
+            }
+        return self._arrays
+
+    @property
+    def obj_view_indices(self):
+        """
+        Train-mode indices of the views of each object, for ObjectBatchSampler
+        """
+        offsets = self.arrays["offsets"]
+        return [list(range(offsets[i], offsets[i + 1])) for i in range(len(offsets) - 1)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def __len__(self):
+        if self.stage == "train":
+            return self.num_views
+        else:
+            return len(self.obj_paths)
+
+    @staticmethod
+    def _to_tensors(images, masks):
+        """
+        Same as get_image_to_tensor_balanced / get_mask_to_tensor
+        :param images (..., H, W, 3) uint8
+        :param masks (..., H, W) uint8
+        :return images (..., 3, H, W) in [-1, 1], masks (..., 1, H, W) in [0, 1]
+        """
+        img_tensor = torch.from_numpy(images).movedim(-1, -3).contiguous()
+        img_tensor = img_tensor.float().div(255).sub_(0.5).div_(0.5)
+        mask_tensor = torch.from_numpy(masks).unsqueeze(-3).float().div(255)
+        return img_tensor, mask_tensor
+
+    def __getitem__(self, index):
+        arrays = self.arrays
+        if self.stage == "train":
+            img_tensor, mask_tensor = self._to_tensors(
+                arrays["images"][index], arrays["masks"][index]
+            )
+            pose = torch.from_numpy(arrays["poses"][index]).clone()
+            bbox = torch.from_numpy(arrays["bboxes"][index]).clone()
+            focal, cx, cy = self.focal, self.cx, self.cy
+            obj_id = int(np.searchsorted(arrays["offsets"], index, side="right")) - 1
+        else:
+            start, end = arrays["offsets"][index : index + 2]
+            img_tensor, mask_tensor = self._to_tensors(
+                arrays["images"][start:end], arrays["masks"][start:end]
+            )
+            pose = torch.from_numpy(arrays["poses"][start:end]).clone()
+            bbox = torch.from_numpy(arrays["bboxes"][start:end]).clone()
+            focal, cx, cy = map(float, arrays["intrinsics"][index])
+
+        if img_tensor.shape[-2:] != self.image_size:
+            scale = self.image_size[0] / img_tensor.shape[-2]
+            focal *= scale
+            cx *= scale
+            cy *= scale
+            bbox *= scale
+
+            resize = lambda t: F.interpolate(
+                t.view(-1, *t.shape[-3:]), size=self.image_size, mode="area"
+            ).view(*t.shape[:-2], *self.image_size)
+            img_tensor = resize(img_tensor)
+            mask_tensor = resize(mask_tensor)
+
+        if self.world_scale != 1.0:
+            focal *= self.world_scale
+            pose[..., :3, 3] *= self.world_scale
+
+        result = {
+            "img_id": index,
+            "focal": focal,
+            "c": torch.tensor([cx, cy], dtype=torch.float32),
+            "images": img_tensor,
+            "masks": mask_tensor,
+            "bbox": bbox,
+            "poses": pose,
+        }
+        if self.stage == "train":
+            result["obj_id"] = obj_id
+        else:
+            result["path"] = self.obj_paths[index]
+            result["focal"] = torch.tensor(focal, dtype=torch.float32)
+        return result
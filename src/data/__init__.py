@@ -3,14 +3,15 @@ import os
 from .MultiObjectDataset import MultiObjectDataset
 from .DVRDataset import DVRDataset
 from .SRNDataset import SRNDataset
+from .SRNShardDataset import SRNShardDataset
 
-from .data_util import ColorJitterDataset
+from .data_util import ColorJitterDataset, ObjectBatchSampler, DevicePrefetcher
 
 
 def get_split_dataset(dataset_type, datadir, want_split="all", training=True, **kwargs):
     """
     Retrieved desired dataset class
-    :param dataset_type dataset type name (srn|dvr|dvr_gen, etc)
+    :param dataset_type dataset type name (srn|srn_shard|dvr|dvr_gen, etc)
     :param datadir root directory name for the dataset. For SRN/multi_obj data:
     if data is in dir/cars_train, dir/cars_test, ... then put dir/cars
     :param want_split root directory name for the dataset
@@ -22,6 +23,9 @@ def get_split_dataset(dataset_type, datadir, want_split="all", training=True, **
     if dataset_type == "srn":
         # For ShapeNet single-category (from SRN)
         dset_class = SRNDataset
+    elif dataset_type == "srn_shard":
+        # SRN converted by scripts/srn_to_shards.py
+        dset_class = SRNShardDataset
     elif dataset_type == "multi_obj":
         # For multiple-object
         dset_class = MultiObjectDataset
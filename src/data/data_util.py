@@ -1,4 +1,6 @@
 import os
+import time
+import collections
 import torch
 import torch.nn.functional as F
 import torchvision.transforms.functional_tensor as F_t
@@ -52,3 +54,149 @@ class ColorJitterDataset(torch.utils.data.Dataset):
         data = self.base_dset[idx]
         data["images"] = self.apply_color_jitter(data["images"])
         return data
+
+
+class ObjectBatchSampler(torch.utils.data.Sampler):
+    """
+    Object-major batch sampler: each batch holds num_views views of each of
+    num_objs objects, laid out as [obj0 views, obj1 views, ...] so the batch
+    can be viewed as (num_objs, num_views, ...). Views within an object are
+    yielded in sorted order so reads stay local to the object directory.
+    :param obj_view_indices list of lists of dataset indices, one per object
+    (see SRNDataset.obj_view_indices)
+    :param num_objs objects per batch
+    :param num_views views per object; objects with fewer views are sampled
+    with replacement
+    :param drop_last drop the last incomplete batch of objects
+    :param num_replicas number of distributed processes; each one gets a
+    disjoint share of the objects of a shared, per-epoch permutation (call
+    set_epoch each epoch, as with DistributedSampler)
+    :param rank rank of this process
+    """
+
+    def __init__(self, obj_view_indices, num_objs, num_views, drop_last=True, num_replicas=1, rank=0):
+        self.obj_view_indices = [torch.as_tensor(x) for x in obj_view_indices]
+        self.num_objs = num_objs
+        self.num_views = num_views
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        num_objs_total = len(self.obj_view_indices) // self.num_replicas
+        if self.drop_last:
+            return num_objs_total // self.num_objs
+        return (num_objs_total + self.num_objs - 1) // self.num_objs
+
+    def __iter__(self):
+        if self.num_replicas > 1:
+            # Same permutation on all ranks, split between them
+            generator = torch.Generator()
+            generator.manual_seed(self.epoch)
+            obj_perm = torch.randperm(len(self.obj_view_indices), generator=generator)
+            obj_perm = obj_perm[self.rank :: self.num_replicas]
+        else:
+            obj_perm = torch.randperm(len(self.obj_view_indices))
+        for i in range(len(self)):
+            batch = []
+            for obj_idx in obj_perm[i * self.num_objs : (i + 1) * self.num_objs]:
+                views = self.obj_view_indices[obj_idx]
+                if len(views) >= self.num_views:
+                    sel = torch.randperm(len(views))[: self.num_views]
+                else:
+                    sel = torch.randint(0, len(views), (self.num_views,))
+                batch.extend(views[sel.sort()[0]].tolist())
+            yield batch
+
+
+def batch_to_device(data, device, non_blocking=False):
+    """
+    Move all tensors of a (nested) batch to device
+    """
+    if torch.is_tensor(data):
+        return data.to(device=device, non_blocking=non_blocking)
+    if isinstance(data, dict):
+        return {k: batch_to_device(v, device, non_blocking) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return type(data)(batch_to_device(v, device, non_blocking) for v in data)
+    return data
+
+
+def _record_stream(data, stream):
+    if torch.is_tensor(data):
+        data.record_stream(stream)
+    elif isinstance(data, dict):
+        for v in data.values():
+            _record_stream(v, stream)
+    elif isinstance(data, (list, tuple)):
+        for v in data:
+            _record_stream(v, stream)
+
+
+class DevicePrefetcher:
+    """
+    Iterates a DataLoader with the next depth batches already being copied to
+    the device, on a side CUDA stream so the copies overlap with compute
+    (use a loader with pin_memory=True). On CPU the batches are passed through.
+    wait_time is the time (s) the last step spent waiting for its batch.
+    :param loader iterable of batches
+    :param device device to copy batches to
+    :param depth number of batches in flight, >= 1
+    :param repeat loop over loader forever
+    """
+
+    def __init__(self, loader, device, depth=2, repeat=False):
+        assert depth >= 1
+        self.loader = loader
+        self.device = torch.device(device if device is not None else "cpu")
+        self.depth = depth
+        self.repeat = repeat
+        self.stream = (
+            torch.cuda.Stream(self.device) if self.device.type == "cuda" else None
+        )
+        self.wait_time = 0.0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _batches(self):
+        while True:
+            for data in self.loader:
+                yield data
+            if not self.repeat:
+                return
+
+    def _load(self, batches, queue):
+        data = next(batches, None)
+        if data is None:
+            return
+        if self.stream is None:
+            queue.append((data, None))
+            return
+        with torch.cuda.stream(self.stream):
+            data = batch_to_device(data, self.device, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        queue.append((data, event))
+
+    def __iter__(self):
+        batches = self._batches()
+        queue = collections.deque()
+        t0 = time.perf_counter()
+        for _ in range(self.depth):
+            self._load(batches, queue)
+        while queue:
+            data, event = queue.popleft()
+            if event is not None:
+                # Compute waits for the copy; the memory now belongs to it
+                torch.cuda.current_stream(self.device).wait_event(event)
+                _record_stream(data, torch.cuda.current_stream(self.device))
+            self.wait_time = time.perf_counter() - t0
+            yield data
+            t0 = time.perf_counter()
+            # Refill after the step, so it is not held up by a later batch
+            self._load(batches, queue)
@@ -2,6 +2,10 @@ from .models import PixelNeRFNet
 from .decoder import Decoder
 from .neural_renderer import NeuralRenderer
 from .discriminator import DCDiscriminator
+from .scene_cache import FeatureGrid, SceneCache
+from .baked import BakedField
+from .object_code import ObjectCode
+from .latent_store import LatentStore
 
 def make_model(conf, *args, **kwargs):
     """ Placeholder to allow more model types """
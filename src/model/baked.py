@@ -0,0 +1,170 @@
+"""
+On-disk baked feature fields, for rendering encoded objects without the image
+encoder or the density MLP (e.g. on CPU at serving time).
+
+A bake is a directory with
+- head.pt: the decoder view head and the neural renderer weights, shared by
+  all objects of a checkpoint
+- <name>.pt per object: the FeatureGrid of one encoded object in fp16, dense or
+  as sparse blocks, plus its latent codes and encoded input pose
+"""
+import torch
+import torch.nn.functional as F
+from .decoder import Decoder
+from .neural_renderer import NeuralRenderer
+from .scene_cache import FeatureGrid
+
+BAKE_VERSION = 1
+
+# Decoder parameters needed after baking (see Decoder.forward_view)
+VIEW_HEAD_PREFIXES = ("fc_z_view.", "fc_view.", "blocks_view.", "feat_out.")
+
+
+def save_head(path, net):
+    """
+    Save the parts of a PixelNeRFNet needed to render baked grids
+    :param path output file
+    :param net PixelNeRFNet
+    """
+    view_head = {
+        k: v.detach().cpu()
+        for k, v in net.decoder.state_dict().items()
+        if k.startswith(VIEW_HEAD_PREFIXES)
+    }
+    neural_renderer = {
+        k: v.detach().cpu() for k, v in net.neural_renderer.state_dict().items()
+    }
+    torch.save(
+        {
+            "version": BAKE_VERSION,
+            "feat_size": net.feat_size,
+            "view_head": view_head,
+            "neural_renderer": neural_renderer,
+        },
+        path,
+    )
+
+
+def save_object(path, grid, poses, shape, appearance, block_size=0, sigma_thresh=0.01):
+    """
+    Save one baked object
+    :param path output file
+    :param grid FeatureGrid of a single object
+    :param poses (3, 4) encoded input pose (PixelNeRFNet.poses of the object)
+    :param shape (z_dim) shape code the grid was baked from
+    :param appearance (z_dim) appearance code
+    :param block_size if > 0, only blocks of block_size^3 cells containing
+    some relu(sigma) > sigma_thresh (and their neighbors) are stored
+    """
+    values = grid.grid[0].detach().cpu()  # (C + 1, R, R, R)
+    reso = values.shape[-1]
+    obj = {
+        "version": BAKE_VERSION,
+        "resolution": reso,
+        "bound": grid.bound,
+        "poses": poses.detach().cpu().float(),
+        "shape": shape.detach().cpu().float(),
+        "appearance": appearance.detach().cpu().float(),
+        "block_size": block_size,
+    }
+    if block_size > 0:
+        nb = -(-reso // block_size)
+        pad = nb * block_size - reso
+        values = F.pad(values, (0, pad, 0, pad, 0, pad))
+        C = values.shape[0]
+        blocks = values.view(C, nb, block_size, nb, block_size, nb, block_size)
+        blocks = blocks.permute(1, 3, 5, 0, 2, 4, 6).reshape(
+            -1, C, block_size, block_size, block_size
+        )
+        keep = (torch.relu(blocks[:, -1]) > sigma_thresh).flatten(1).any(dim=1)
+        # Also keep the neighbors of occupied blocks, which trilinear lookups
+        # near block faces read from
+        keep = F.max_pool3d(
+            keep.float().view(1, 1, nb, nb, nb), 3, stride=1, padding=1
+        ).view(-1) > 0
+        coords = torch.stack(
+            torch.meshgrid(*[torch.arange(nb)] * 3, indexing="ij"), dim=-1
+        ).view(-1, 3)
+        obj["blocks"] = blocks[keep].half()
+        obj["block_coords"] = coords[keep].short()
+    else:
+        obj["grid"] = values.half()
+    torch.save(obj, path)
+
+
+def load_object_grid(obj):
+    """
+    Dense fp32 grid of a saved object
+    :param obj dict loaded from a file written by save_object
+    :return (C + 1, R, R, R)
+    """
+    if obj["block_size"] == 0:
+        return obj["grid"].float()
+    bs, reso = obj["block_size"], obj["resolution"]
+    blocks = obj["blocks"].float()
+    nb = -(-reso // bs)
+    values = blocks.new_zeros(blocks.shape[1], nb * bs, nb * bs, nb * bs)
+    for (i, j, k), block in zip(obj["block_coords"].long().tolist(), blocks):
+        values[:, i * bs : (i + 1) * bs, j * bs : (j + 1) * bs, k * bs : (k + 1) * bs] = block
+    return values[:, :reso, :reso, :reso].contiguous()
+
+
+class BakedField(torch.nn.Module):
+    """
+    Stand-in for PixelNeRFNet that renders baked objects: same forward
+    signature, so it can be bound to NeRFRenderer (occupancy skipping aside),
+    and a neural_renderer for the feature maps.
+    Only the decoder view head and the neural renderer are loaded; the
+    density branch comes from the baked grids.
+    """
+
+    def __init__(self, head_path, map_location="cpu"):
+        super().__init__()
+        head = torch.load(head_path, map_location=map_location)
+        assert head["version"] == BAKE_VERSION
+        # Decoder/NeuralRenderer are built with the defaults, as in make_model
+        self.decoder = Decoder()
+        self.decoder.load_state_dict(head["view_head"], strict=False)
+        self.feat_size = head["feat_size"]
+        self.neural_renderer = NeuralRenderer(feat_size=self.feat_size)
+        self.neural_renderer.load_state_dict(head["neural_renderer"])
+        self.feature_grid = None
+        self.register_buffer("poses", torch.empty(1, 3, 4), persistent=False)
+        self.shape = self.appearance = None
+
+    def load_objects(self, paths):
+        """
+        Make a batch of baked objects current, like PixelNeRFNet.encode
+        :param paths object files written by save_object; all with the same
+        resolution and bound
+        :return shape (SB, z_dim), appearance (SB, z_dim)
+        """
+        device = self.poses.device
+        objs = [torch.load(p, map_location="cpu") for p in paths]
+        grids = torch.stack([load_object_grid(obj) for obj in objs]).to(device=device)
+        self.shape = torch.stack([obj["shape"] for obj in objs]).to(device=device)
+        self.appearance = torch.stack([obj["appearance"] for obj in objs]).to(
+            device=device
+        )
+        self.poses = torch.stack([obj["poses"] for obj in objs]).to(device=device)
+        self.feature_grid = FeatureGrid(grids, self.shape, objs[0]["bound"])
+        return self.shape, self.appearance
+
+    def forward(self, xyz, num_pts, shape, appearance, coarse=True, viewdirs=None, training=False, far=False, poses=None):
+        """
+        Same as PixelNeRFNet.forward, using the baked grids
+        :param xyz (SB, B, 3) world space points
+        :param poses optional (SB, 3, 4) input poses instead of the loaded ones
+        :return (SB, B, C + 1) features and sigma
+        """
+        SB, B, _ = xyz.shape
+        if poses is None:
+            poses = self.poses
+        if SB != poses.shape[0]:
+            poses = poses.repeat(SB // poses.shape[0], 1, 1)
+        rot = poses[:, None, :3, :3]
+        xyz_rot = torch.matmul(rot, xyz.unsqueeze(-1))[..., 0]
+        viewdirs = torch.matmul(rot, viewdirs.reshape(SB, B, 3, 1))[..., 0]
+
+        feat, sigma = self.feature_grid.query(self.decoder, xyz_rot, viewdirs, appearance)
+        return torch.cat((feat, F.relu(sigma).unsqueeze(-1)), dim=-1)
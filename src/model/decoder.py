@@ -1,4 +1,3 @@
-
 import torch.nn as nn
 import torch.nn.functional as F
 import torch
@@ -6,6 +5,12 @@ import numpy as np
 from numpy import pi
 
 
+def _is_compiling():
+    compiler = getattr(torch, "compiler", None)
+    return torch.jit.is_tracing() or (
+        compiler is not None and compiler.is_compiling())
+
+
 class Decoder(nn.Module):
     ''' Decoder class.
 
@@ -69,6 +74,13 @@ class Decoder(nn.Module):
         else:
             dim_embed = 3 * self.n_freq_posenc * 2
             dim_embed_view = 3 * self.n_freq_posenc_views * 2
+            # (2 ** i) * pi for the positional encoding, see transform_points
+            # (not persistent, so checkpoints are unaffected)
+            self.register_buffer('freq_bands', torch.tensor(
+                [(2 ** i) * pi for i in range(n_freq_posenc)]), persistent=False)
+            self.register_buffer('freq_bands_views', torch.tensor(
+                [(2 ** i) * pi for i in range(n_freq_posenc_views)]),
+                persistent=False)
 
         # Density Prediction Layers
         self.fc_in = nn.Linear(dim_embed, hidden_size)
@@ -97,6 +109,66 @@ class Decoder(nn.Module):
                 [nn.Linear(dim_embed_view + hidden_size, hidden_size)
                  for i in range(n_blocks_view - 1)])
 
+        # Latent projections reused across calls in eval, see _project_cached
+        self._latent_cache = {}
+
+    def train(self, mode=True):
+        self._latent_cache.clear()
+        return super().train(mode)
+
+    def _project_cached(self, name, z, project):
+        ''' Applies project to z, reusing the last result for the same z.
+
+        Only used in eval mode without gradients (e.g. rendering many ray
+        chunks / frames of one encoded object). Entries are invalidated when
+        z or the decoder weights change.
+
+        Args:
+            name (str): cache slot
+            z (tensor): latent code (batch, z_dim)
+            project (callable): maps z to the projections
+        '''
+        if self.training or torch.is_grad_enabled() or _is_compiling():
+            # Compiled/traced graphs recompute the projection instead of
+            # capturing a cached value
+            return project(z)
+        version = (z._version,) + tuple(p._version for p in self.parameters())
+        entry = self._latent_cache.get(name)
+        if entry is not None:
+            z_old, version_old, out = entry
+            if version == version_old and (z_old is z or (
+                    z_old.shape == z.shape and z_old.device == z.device
+                    and torch.equal(z_old, z))):
+                return out
+        out = project(z)
+        self._latent_cache[name] = (z, version, out)
+        return out
+
+    def project_shape(self, z_shape):
+        ''' Projects the shape code to the density branch biases.
+
+        Args:
+            z_shape (tensor): shape code (batch, z_dim)
+        Returns:
+            fc_z bias (batch, 1, hidden_size), list of skip biases
+        '''
+        def project(z):
+            skips = [fc(z).unsqueeze(1) for fc in self.fc_z_skips] \
+                if hasattr(self, 'fc_z_skips') else []
+            return self.fc_z(z).unsqueeze(1), skips
+        return self._project_cached('shape', z_shape, project)
+
+    def project_appearance(self, z_app):
+        ''' Projects the appearance code to the feature branch bias.
+
+        Args:
+            z_app (tensor): appearance code (batch, z_dim)
+        Returns:
+            fc_z_view bias (batch, 1, hidden_size)
+        '''
+        return self._project_cached(
+            'appearance', z_app, lambda z: self.fc_z_view(z).unsqueeze(1))
+
     def transform_points(self, p, views=False):
         # Positional encoding
         # normalize p between [-1, 1]
@@ -110,38 +182,70 @@ class Decoder(nn.Module):
             p_transformed = torch.cat(
                 [torch.sin(p_transformed), torch.cos(p_transformed)], dim=-1)
         else:
-            L = self.n_freq_posenc_views if views else self.n_freq_posenc
-            p_transformed = torch.cat([torch.cat(
-                [torch.sin((2 ** i) * pi * p),
-                 torch.cos((2 ** i) * pi * p)],
-                dim=-1) for i in range(L)], dim=-1)
+            # All frequencies in one broadcast, laid out as
+            # [sin(f_0 p), cos(f_0 p), sin(f_1 p), cos(f_1 p), ...]
+            freqs = self.freq_bands_views if views else self.freq_bands
+            p_scaled = p.unsqueeze(-2) * freqs.unsqueeze(-1)  # (..., L, 3)
+            p_transformed = torch.stack(
+                [torch.sin(p_scaled), torch.cos(p_scaled)], dim=-2).flatten(-3)
         return p_transformed
 
-    def forward(self, p_in, ray_d, z_shape=None, z_app=None, **kwargs):
+    def forward_density(self, p_in, z_shape=None):
+        ''' Runs the density branch only.
+
+        Sigma depends on the location and the shape code only, so this is
+        all that is needed to query occupancy.
+
+        Args:
+            p_in (tensor): points (batch, n, 3)
+            z_shape (tensor): shape code (batch, z_dim)
+        Returns:
+            hidden features (batch, n, hidden_size), sigma (batch, n)
+        '''
         a = F.relu
-        if self.z_dim > 0:
-            batch_size = p_in.shape[0]
-            if z_shape is None:
-                z_shape = torch.randn(batch_size, self.z_dim).to(p_in.device)
-            if z_app is None:
-                z_app = torch.randn(batch_size, self.z_dim).to(p_in.device)
         p = self.transform_points(p_in)
         net = self.fc_in(p)
         if z_shape is not None:
-            net = net + self.fc_z(z_shape).unsqueeze(1)
+            z_bias, z_skip_biases = self.project_shape(z_shape)
+            net = net + z_bias
         net = a(net)
 
         skip_idx = 0
         for idx, layer in enumerate(self.blocks):
             net = a(layer(net))
             if (idx + 1) in self.skips and (idx < len(self.blocks) - 1):
-                net = net + self.fc_z_skips[skip_idx](z_shape).unsqueeze(1)
+                net = net + z_skip_biases[skip_idx]
                 net = net + self.fc_p_skips[skip_idx](p)
                 skip_idx += 1
         sigma_out = self.sigma_out(net).squeeze(-1)
+        return net, sigma_out
 
-        net = self.feat_view(net)
-        net = net + self.fc_z_view(z_app).unsqueeze(1)
+    def forward(self, p_in, ray_d, z_shape=None, z_app=None, **kwargs):
+        if self.z_dim > 0:
+            batch_size = p_in.shape[0]
+            if z_shape is None:
+                z_shape = torch.randn(batch_size, self.z_dim).to(p_in.device)
+            if z_app is None:
+                z_app = torch.randn(batch_size, self.z_dim).to(p_in.device)
+        net, sigma_out = self.forward_density(p_in, z_shape)
+        feat_out = self.forward_view(self.feat_view(net), ray_d, z_app)
+        return feat_out, sigma_out
+
+    def forward_view(self, net, ray_d, z_app):
+        ''' Runs the view-dependent feature head.
+
+        The input is feat_view of the density branch hidden features, which
+        is what a baked feature grid stores (see model.scene_cache).
+
+        Args:
+            net (tensor): feat_view outputs (batch, n, hidden_size)
+            ray_d (tensor): viewing directions (batch, n, 3)
+            z_app (tensor): appearance code (batch, z_dim)
+        Returns:
+            features (batch, n, rgb_out_dim)
+        '''
+        a = F.relu
+        net = net + self.project_appearance(z_app)
         if self.use_viewdirs and ray_d is not None:
             ray_d = ray_d / torch.norm(ray_d, dim=-1, keepdim=True)
             ray_d = self.transform_points(ray_d, views=True)
@@ -154,5 +258,4 @@ class Decoder(nn.Module):
 
         if self.final_sigmoid_activation:
             feat_out = torch.sigmoid(feat_out)
-
-        return feat_out, sigma_out
+        return feat_out
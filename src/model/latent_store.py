@@ -0,0 +1,97 @@
+"""
+Persisted ObjectCodes of an image library, for rendering shape/appearance
+swaps without re-encoding.
+"""
+import os
+import torch
+from .object_code import ObjectCode
+
+LATENT_STORE_VERSION = 1
+
+
+class LatentStore:
+    """
+    ObjectCodes indexed by image id, saved as one file.
+    :param path file to load from / save to; loaded if it exists
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.ids = []
+        self.index = {}
+        self.codes = None
+        if path is not None and os.path.exists(path):
+            state = torch.load(path, map_location="cpu")
+            assert state["version"] == LATENT_STORE_VERSION
+            self.ids = list(state["ids"])
+            self.index = {image_id: i for i, image_id in enumerate(self.ids)}
+            self.codes = ObjectCode.from_state_dict(state["codes"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, image_id):
+        return image_id in self.index
+
+    def add(self, ids, codes):
+        """
+        Add (or replace) codes
+        :param ids list of N image ids
+        :param codes ObjectCode of N objects
+        """
+        codes = codes.to(device="cpu")
+        new_ids = []
+        for i, image_id in enumerate(ids):
+            if image_id in self.index:
+                j = self.index[image_id]
+                for name in ObjectCode.FIELDS:
+                    getattr(self.codes, name)[j] = getattr(codes, name)[i]
+            else:
+                new_ids.append(i)
+        if new_ids:
+            new_codes = codes[torch.tensor(new_ids)]
+            self.codes = (
+                new_codes if self.codes is None else ObjectCode.cat([self.codes, new_codes])
+            )
+            for i in new_ids:
+                self.index[ids[i]] = len(self.ids)
+                self.ids.append(ids[i])
+
+    def get(self, ids):
+        """
+        :param ids list of N image ids
+        :return ObjectCode of N objects
+        """
+        return self.codes[torch.tensor([self.index[image_id] for image_id in ids])]
+
+    def combine(self, shape_ids, appearance_ids):
+        """
+        Swapped codes: shape (and input pose) of one image with the
+        appearance of another
+        :param shape_ids list of N image ids to take the shape from
+        :param appearance_ids list of N image ids to take the appearance from
+        :return ObjectCode of N objects
+        """
+        shapes = self.get(shape_ids)
+        return ObjectCode(
+            shapes.shape,
+            self.get(appearance_ids).appearance,
+            shapes.input_poses,
+            shapes.rotmat,
+        )
+
+    def save(self, path=None):
+        """
+        Write the store; the previous file is replaced atomically
+        """
+        path = path or self.path
+        tmp_path = path + ".tmp"
+        torch.save(
+            {
+                "version": LATENT_STORE_VERSION,
+                "ids": self.ids,
+                "codes": self.codes.state_dict(),
+            },
+            tmp_path,
+        )
+        os.replace(tmp_path, path)
@@ -6,7 +6,7 @@ from .encoder import ImageEncoder
 from .code import PositionalEncoding
 from .model_util import make_encoder, make_mlp
 import torch.autograd.profiler as profiler
-from util import repeat_interleave
+from util import repeat_interleave, CheckpointManager
 import os
 import os.path as osp
 import warnings
@@ -92,7 +92,13 @@ class PixelNeRFNet(torch.nn.Module):
             device = self.poses.device
         self.decoder = decoder.to(device)
 
-        self.neural_renderer = NeuralRenderer().to(device)
+        # Resolution of the rendered feature maps, upsampled to the image by
+        # the neural renderer (see util.feat_intrinsics for the matching rays)
+        self.feat_size = conf.get_int("feat_size", 16)
+        self.neural_renderer = NeuralRenderer(feat_size=self.feat_size).to(device)
+
+        # Baked FeatureGrid used instead of the density MLP, set by SceneCache
+        self.feature_grid = None
 
     #######################################################################################
     ################### 여기서부터 잘 집중해서 읽어보기! encode하는 부분에서도 잘 가져오기!! #############
@@ -128,9 +134,7 @@ class PixelNeRFNet(torch.nn.Module):
             poses = poses.reshape(-1, 4, 4)     
 
         # 여기서부터 가져올 부분 poses -> self.rotmat으로 대체 
-        rot = poses[:, :3, :3].transpose(1, 2)  # (B, 3, 3)     # 역행렬 -> 원래의 rotation으로 바꿔준다 
-        trans = -torch.bmm(rot, poses[:, :3, 3:])  # (B, 3, 1)      # 이 translation이 의외군.. 
-        self.poses = torch.cat((rot, trans), dim=-1)  # (B, 3, 4)
+        self.poses = self.world_to_input(poses)  # (B, 3, 4)
 
         self.image_shape[0] = images.shape[-1]
         self.image_shape[1] = images.shape[-2]
@@ -164,12 +168,51 @@ class PixelNeRFNet(torch.nn.Module):
             self.global_encoder(images)
         return self.shape, self.appearance 
 
+    @staticmethod
+    def world_to_input(poses):
+        """
+        World -> input view transforms of the input camera poses
+        (what encode stores in self.poses)
+        :param poses (B, 4, 4) camera to world
+        :return (B, 3, 4)
+        """
+        rot = poses[:, :3, :3].transpose(1, 2)  # (B, 3, 3)     # 역행렬 -> 원래의 rotation으로 바꿔준다 
+        trans = -torch.bmm(rot, poses[:, :3, 3:])  # (B, 3, 1)      # 이 translation이 의외군.. 
+        return torch.cat((rot, trans), dim=-1)  # (B, 3, 4)
+
+    def _input_poses(self, SB, poses=None):
+        """
+        Encoded poses for a batch of SB objects. SB may be a multiple of the
+        number of encoded objects when several render passes of the same
+        encode are stacked (see render.render_multi); poses are tiled then.
+        :param poses (N, 3, 4) world -> input view transforms to use instead
+        of the ones stored by encode
+        :return (SB, 3, 4)
+        """
+        if poses is None:
+            poses = self.poses
+        if SB != poses.shape[0]:
+            poses = poses.repeat(SB // poses.shape[0], 1, 1)
+        return poses
+
+    def to_input_space(self, xyz, poses=None):
+        """
+        Rotate world space points into the frame of the encoded input view.
+        This is the space the decoder is queried in.
+        Please call encode first (or pass poses)!
+        :param xyz (SB, B, 3)
+        :param poses optional (N, 3, 4) input poses, see _input_poses
+        :return (SB, B, 3)
+        """
+        poses = self._input_poses(xyz.shape[0], poses)
+        return torch.matmul(poses[:, None, :3, :3], xyz.unsqueeze(-1))[..., 0]
+
     #######################################################################################
     ################### 여기서부터 잘 집중해서 읽어보기! xyz 만드는 과정도 똑같이 할 것! ################
     #######################################################################################
 
     ### 여기서부터 잘 집중해서 읽어보기!!! + xyz는 어쨌든 sampling된 query points인데 어떻게 나오게 된 건지 파악하기!
-    def forward(self, xyz, num_pts, shape, appearance, coarse=True, viewdirs=None, training=False, far=False):  # world space points xyz
+    def forward(self, xyz, num_pts, shape, appearance, coarse=True, viewdirs=None, training=False, far=False, poses=None):  # world space points xyz
         # 어차피 여기 한번밖에 안지나감 괜쫄!
         # xyz: (batch, #rays * #points, 3)
         """
@@ -179,18 +222,18 @@ class PixelNeRFNet(torch.nn.Module):
         SB is batch of objects
         B is batch of points (in rays)
         NS is number of input views
+        :param poses optional (SB, 3, 4) input poses to use instead of the
+        encoded ones (self.poses); keeps the call free of encode state
         :return (SB, B, 4) r g b sigma
         """
         with profiler.record_function("model_inference"):       # memory, time tracking tool -> 한번 다 합치고 돌려보기!
             SB, B, _ = xyz.shape       # SB: batch of objects, B: num_rays * num_points -> batch of points in rays -> 리얼 한 세트로 돌리네! 굿! 배치마다의 샘플 속 모든 ray를 포괄!
             ##################################################################################
             # Transform query points into the camera spaces of the input views
-            xyz_rot = torch.matmul(self.poses[:, None, :3, :3], xyz.unsqueeze(-1))[     # xyz를 self.poses로 rotate -> transpose했던거에 다시 연산됨..! -> 헐 그러면 이 상태에서 예측하는건가보다 그러면 이게 sampled points고 앞에 camera가 원래 ray에서...!
-                                                                                        # 그래야 transformation이 말이 되는 듯.. 근데 그럴거면 왜 transformation을 예측하지..? 
-                ..., 0                                                                  # 아무튼 여기가 transform query points into the camera spaces! (self.poses를 곱함!)
-            ]
+            xyz_rot = self.to_input_space(xyz, poses)     # xyz를 self.poses로 rotate -> 아무튼 여기가 transform query points into the camera spaces! (self.poses를 곱함!)
             # 오키.. def encoder에서 생긴 얘가 여기로 들어감!
-            xyz = xyz_rot + self.poses[:, None, :3, 3]      # 얘네가 sampling points!     # 아무튼 여기가 transform query points into the camera spaces! (self.poses를 곱함!) 
+            poses = self._input_poses(SB, poses)
+            xyz = xyz_rot + poses[:, None, :3, 3]      # 얘네가 sampling points!     # 아무튼 여기가 transform query points into the camera spaces! (self.poses를 곱함!) 
             # Transform query points into the camera spaces of the input views
             ##################################################################################
             # * Encode the xyz coordinates
@@ -199,7 +242,7 @@ class PixelNeRFNet(torch.nn.Module):
             # Viewdirs to input view space
             viewdirs = viewdirs.reshape(SB, B, 3, 1)
             viewdirs = torch.matmul(
-                self.poses[:, None, :3, :3], viewdirs   # pose에 viewdir 곱함 <- 위에와 마찬가지로 곱해줌!!
+                poses[:, None, :3, :3], viewdirs   # pose에 viewdir 곱함 <- 위에와 마찬가지로 곱해줌!!
             )  # (SB*NS, B, 3, 1)
             viewdirs = viewdirs.reshape(SB, -1, 3)  # (SB*B, 3)
             
@@ -215,7 +258,11 @@ class PixelNeRFNet(torch.nn.Module):
             # 얘도 뭔가 그냥 아예 batch 단위로 한번에 들어가버림 
             # Run main NeRF network
             # images       dim 맞음! # feature, viewdirs, shape, appearance dimension 맞춰주기 
-            feat, sigma = self.decoder(z_feature, viewdirs, shape, appearance)        # z_feature, viewdirs, : (batch, -1, 3), shape&app : (batch, 256)
+            if self.feature_grid is not None and self.feature_grid.matches(shape):
+                # Trilinear lookup in the baked density branch (eval only, see SceneCache)
+                feat, sigma = self.feature_grid.query(self.decoder, z_feature, viewdirs, appearance)
+            else:
+                feat, sigma = self.decoder(z_feature, viewdirs, shape, appearance)        # z_feature, viewdirs, : (batch, -1, 3), shape&app : (batch, 256)
             if training:
                 sigma += torch.randn_like(sigma)
             sigma_i = sigma.reshape(SB, B // num_pts, num_pts)          # 4, 256, 64
@@ -251,6 +298,15 @@ class PixelNeRFNet(torch.nn.Module):
         if device is None:
             device = self.poses.device
 
+        # Latest consolidated training checkpoint (trainlib.Trainer), if any
+        ckpt_dir = "%s/%s/ckpt" % (args.checkpoints_path, args.name)
+        if ckpt_name == "pixel_nerf_latest" and os.path.isdir(ckpt_dir):
+            ckpt = CheckpointManager(ckpt_dir)
+            if ckpt.latest() is not None:
+                print("Load", ckpt.latest())
+                self.load_state_dict(ckpt.load(map_location=device)["net"], strict=False)
+                return self
+
         if os.path.exists(model_path):
             print("Load", model_path)
             self.load_state_dict(
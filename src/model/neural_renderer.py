@@ -15,6 +15,9 @@ class NeuralRenderer(nn.Module):
         final_actvn (bool): whether to apply a final activation (sigmoid)
         min_feat (int): minimum features
         img_size (int): output image size
+        feat_size (int): input feature map size; the renderer upsamples
+            by log2(img_size / feat_size) blocks. Being fully convolutional,
+            it also runs on other input sizes (output size scales with it)
         use_rgb_skip (bool): whether to use RGB skip connections
         upsample_feat (str): upsampling type for feature upsampling
         upsample_rgb (str): upsampling type for rgb upsampling
@@ -23,7 +26,7 @@ class NeuralRenderer(nn.Module):
 
     def __init__(
             self, n_feat=128, input_dim=128, out_dim=3, final_actvn=True,
-            min_feat=32, img_size=128, use_rgb_skip=True,
+            min_feat=32, img_size=128, feat_size=16, use_rgb_skip=True,
             upsample_feat="nn", upsample_rgb="bilinear", use_norm=False,
             **kwargs):
         super().__init__()
@@ -31,7 +34,7 @@ class NeuralRenderer(nn.Module):
         self.input_dim = input_dim
         self.use_rgb_skip = use_rgb_skip
         self.use_norm = use_norm
-        n_blocks = int(log2(img_size) - 4)
+        n_blocks = int(log2(img_size) - log2(feat_size))
 
         assert(upsample_feat in ("nn", "bilinear"))
         if upsample_feat == "nn":
@@ -0,0 +1,86 @@
+"""
+Encoded objects as values, independent of the encode state on PixelNeRFNet.
+"""
+import io
+import torch
+
+OBJECT_CODE_VERSION = 1
+
+
+class ObjectCode:
+    """
+    Everything rendering needs from the encoder for a batch of objects: the
+    latent codes and the world -> input view transforms. Batchable (cat,
+    indexing, split) and serializable (state_dict, to_bytes), so codes can be
+    cached and render requests for different objects stacked into one batch.
+    :param shape (N, z_dim) shape codes
+    :param appearance (N, z_dim) appearance codes
+    :param input_poses (N, 3, 4) world -> input view transforms
+    (see PixelNeRFNet.world_to_input)
+    :param rotmat (N, 4, 4) camera poses predicted by the encoder
+    """
+
+    FIELDS = ("shape", "appearance", "input_poses", "rotmat")
+
+    def __init__(self, shape, appearance, input_poses, rotmat):
+        self.shape = shape
+        self.appearance = appearance
+        self.input_poses = input_poses
+        self.rotmat = rotmat
+
+    def __len__(self):
+        return self.shape.shape[0]
+
+    def __getitem__(self, index):
+        """
+        :param index int, slice or index tensor over objects
+        """
+        if isinstance(index, int):
+            index = slice(index, index + 1)
+        return ObjectCode(*(getattr(self, name)[index] for name in self.FIELDS))
+
+    @property
+    def device(self):
+        return self.shape.device
+
+    def to(self, *args, **kwargs):
+        return ObjectCode(
+            *(getattr(self, name).to(*args, **kwargs) for name in self.FIELDS)
+        )
+
+    def split(self):
+        """
+        :return list of single-object codes
+        """
+        return [self[i] for i in range(len(self))]
+
+    @classmethod
+    def cat(cls, codes):
+        """
+        Batch codes (e.g. of different requests) into one
+        :param codes list of ObjectCode, on the same device
+        """
+        return cls(
+            *(torch.cat([getattr(code, name) for code in codes]) for name in cls.FIELDS)
+        )
+
+    def state_dict(self):
+        state = {name: getattr(self, name).detach().cpu() for name in self.FIELDS}
+        state["version"] = OBJECT_CODE_VERSION
+        return state
+
+    @classmethod
+    def from_state_dict(cls, state, device="cpu"):
+        assert state["version"] == OBJECT_CODE_VERSION
+        return cls(*(state[name].to(device=device) for name in cls.FIELDS))
+
+    def to_bytes(self):
+        buf = io.BytesIO()
+        torch.save(self.state_dict(), buf)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, device="cpu"):
+        return cls.from_state_dict(
+            torch.load(io.BytesIO(data), map_location="cpu"), device=device
+        )
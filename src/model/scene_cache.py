@@ -0,0 +1,177 @@
+"""
+Caching of encoded objects and their baked feature fields, for rendering many
+views (e.g. turntable videos) of the same objects.
+"""
+from collections import OrderedDict
+import torch
+import torch.nn.functional as F
+import util
+
+
+class FeatureGrid:
+    """
+    Density-branch outputs of a batch of objects baked on a regular grid.
+    The grid lives in the decoder input frame (world points rotated into the
+    encoded view, see PixelNeRFNet.to_input_space) and stores, per cell,
+    feat_view(h) and the raw sigma of Decoder.forward_density. Both depend on
+    the shape code only, so the appearance code and view directions are still
+    applied per sample by Decoder.forward_view, and one bake serves all render
+    poses and appearances. Samples are looked up trilinearly; points outside
+    [-bound, bound]^3 are treated as empty space.
+    :param grid (SB, hidden_size + 1, R, R, R) indexed (x, y, z)
+    :param z_shape (SB, z_dim) shape codes the grid was baked for
+    :param bound half extent of the grid
+    """
+
+    def __init__(self, grid, z_shape, bound=1.0):
+        self.grid = grid
+        self.z_shape = z_shape
+        self.bound = bound
+
+    @classmethod
+    @torch.no_grad()
+    def bake(cls, decoder, z_shape, resolution=64, bound=1.0, eval_batch_size=100000):
+        """
+        Evaluate the density branch at the grid points
+        :param decoder model.Decoder
+        :param z_shape (SB, z_dim)
+        :param resolution grid resolution per axis
+        :param eval_batch_size max number of points per decoder call
+        """
+        reso = resolution
+        c1, c2 = [-bound] * 3, [bound] * 3
+        points = util.gen_grid(*zip(c1, c2, [reso] * 3), ij_indexing=True)
+        points = points.to(device=z_shape.device)
+
+        grids = []
+        for z in z_shape:
+            vals = []
+            for pnts in torch.split(points, eval_batch_size, dim=0):
+                net, sigma = decoder.forward_density(pnts[None], z[None])
+                vals.append(torch.cat((decoder.feat_view(net), sigma[..., None]), dim=-1)[0])
+            grid = torch.cat(vals).view(reso, reso, reso, -1).permute(3, 0, 1, 2)
+            grids.append(grid)
+        return cls(torch.stack(grids), z_shape, bound)
+
+    def _tiled(self, t, SB):
+        # render_multi stacks several passes of the same objects
+        if SB != t.shape[0]:
+            t = t.repeat(SB // t.shape[0], *[1] * (t.dim() - 1))
+        return t
+
+    def matches(self, shape):
+        """
+        Whether the grid was baked for these shape codes
+        (possibly tiled, see render.render_multi)
+        :param shape (SB, z_dim)
+        """
+        if shape is None or shape.shape[0] % self.z_shape.shape[0] != 0:
+            return False
+        z_shape = self._tiled(self.z_shape, shape.shape[0])
+        return z_shape.device == shape.device and torch.equal(z_shape, shape)
+
+    def query(self, decoder, p, ray_d, z_app):
+        """
+        Drop-in for Decoder.forward using the baked grid
+        :param decoder model.Decoder
+        :param p (SB, N, 3) points in the decoder input frame
+        :param ray_d (SB, N, 3) viewing directions
+        :param z_app (SB, z_dim)
+        :return features (SB, N, rgb_out_dim), sigma (SB, N)
+        """
+        SB, N, _ = p.shape
+        grid = self._tiled(self.grid, SB)
+        # grid_sample takes (x, y, z) coordinates for (W, H, D), our grid is (x, y, z)
+        coords = (p / self.bound).flip(-1).view(SB, 1, 1, N, 3)
+        vals = F.grid_sample(
+            grid, coords, mode="bilinear", padding_mode="zeros", align_corners=True
+        )
+        vals = vals.view(SB, -1, N).transpose(1, 2)  # (SB, N, hidden_size + 1)
+        feat = decoder.forward_view(vals[..., :-1], ray_d, z_app)
+        return feat, vals[..., -1]
+
+
+class SceneCache:
+    """
+    LRU cache of encoded objects. Stores what PixelNeRFNet.encode computes, so
+    an object is encoded once and can be re-activated for any number of
+    renders, and optionally bakes a FeatureGrid that the network then uses
+    instead of the density MLP (resolution 0 keeps the exact MLP).
+    :param net PixelNeRFNet
+    :param resolution feature grid resolution, 0 to disable baking
+    :param bound half extent of the feature grid
+    :param eval_batch_size max number of points per decoder call while baking
+    :param cache_size max number of objects (encode calls) kept
+    """
+
+    # Attributes set by PixelNeRFNet.encode
+    ENCODE_ATTRS = (
+        "rotmat",
+        "shape",
+        "appearance",
+        "poses",
+        "image_shape",
+        "focal",
+        "c",
+        "num_objs",
+        "num_views_per_obj",
+    )
+
+    def __init__(self, net, resolution=0, bound=1.0, eval_batch_size=100000, cache_size=16):
+        self.net = net
+        self.resolution = resolution
+        self.bound = bound
+        self.eval_batch_size = eval_batch_size
+        self.cache_size = cache_size
+        self.entries = OrderedDict()
+
+    @torch.no_grad()
+    def encode(self, key, images, poses=None, focal=None, c=None):
+        """
+        Like PixelNeRFNet.encode, but cached under key (e.g. the object path).
+        Leaves the object active on the network.
+        :return shape, appearance
+        """
+        if key not in self.entries:
+            self.net.encode(images, poses, focal, c=c)
+            state = {
+                attr: getattr(self.net, attr) for attr in self.ENCODE_ATTRS
+            }
+            # encode writes this buffer in place
+            state["image_shape"] = state["image_shape"].clone()
+            grid = None
+            if self.resolution > 0:
+                grid = FeatureGrid.bake(
+                    self.net.decoder,
+                    state["shape"],
+                    resolution=self.resolution,
+                    bound=self.bound,
+                    eval_batch_size=self.eval_batch_size,
+                )
+            self.entries[key] = (state, grid)
+            if len(self.entries) > self.cache_size:
+                self.entries.popitem(last=False)
+        return self.activate(key)
+
+    def activate(self, key):
+        """
+        Restore a cached object on the network
+        :return shape, appearance
+        """
+        self.entries.move_to_end(key)
+        state, grid = self.entries[key]
+        for attr, value in state.items():
+            setattr(self.net, attr, value)
+        self.net.image_shape = state["image_shape"].clone()
+        self.net.feature_grid = grid
+        return state["shape"], state["appearance"]
+
+    def release(self):
+        """
+        Stop using baked grids on the network
+        """
+        self.net.feature_grid = None
+
+    def clear(self):
+        self.release()
+        self.entries.clear()
@@ -1 +1,3 @@
-from .nerf import NeRFRenderer
+from .nerf import NeRFRenderer, render_multi, render_progressive
+from .compiled import CompiledRenderer
+from .object_renderer import ObjectRenderer
@@ -0,0 +1,108 @@
+"""
+Compiled inference entry point for rendering already encoded objects.
+"""
+from collections import OrderedDict
+import torch
+
+
+class _RenderFunction(torch.nn.Module):
+    """
+    Rendering of (rays, latent codes, input poses) to images with no encode
+    state read from the model, so that it can be compiled or traced
+    """
+
+    def __init__(self, net, renderer, val_num, use_neural_renderer=True):
+        super().__init__()
+        self.net = net
+        self.renderer = renderer
+        self.val_num = val_num
+        self.use_neural_renderer = use_neural_renderer
+
+    def forward(self, rays, shape, appearance, poses):
+        feat, _ = self.renderer.render_feat(
+            self.net, rays, False, self.val_num, shape, appearance, poses=poses,
+        )
+        if self.use_neural_renderer:
+            return self.net.neural_renderer(feat)
+        return feat
+
+
+class CompiledRenderer:
+    """
+    Inference-only NeRFRenderer + neural renderer, compiled once per input
+    shape. Takes the encode outputs explicitly (latent codes and input poses),
+    so one compiled function serves all objects and frames of that shape.
+    :param net PixelNeRFNet (or model.BakedField), in eval mode
+    :param renderer NeRFRenderer, in eval mode
+    :param backend compile (torch.compile) | trace (TorchScript trace; the
+    traced graph is fixed, so occupancy skipping and early ray termination,
+    which depend on the data, are not supported, and calls run eagerly while
+    the net has a feature grid, whose use depends on the codes)
+    :param use_neural_renderer if true, returns images; else feature maps
+    :param cache_size max number of compiled input shapes kept
+    :param compile_kwargs extra torch.compile arguments (e.g. mode)
+    """
+
+    def __init__(self, net, renderer, backend="compile", use_neural_renderer=True, cache_size=8, **compile_kwargs):
+        if backend not in ("compile", "trace"):
+            raise ValueError("Unsupported backend " + backend)
+        if backend == "trace" and (
+            renderer.occupancy is not None or renderer.early_stop_thresh > 0.0
+        ):
+            raise ValueError(
+                "trace backend does not support occupancy or early_stop_thresh"
+            )
+        self.net = net
+        self.renderer = renderer
+        self.backend = backend
+        self.use_neural_renderer = use_neural_renderer
+        self.cache_size = cache_size
+        self.compile_kwargs = compile_kwargs
+        self.functions = OrderedDict()
+
+    def _build(self, val_num, inputs):
+        fn = _RenderFunction(
+            self.net, self.renderer, val_num, self.use_neural_renderer
+        )
+        if self.backend == "trace":
+            # Sampling is random, so the traced outputs can't be checked
+            return torch.jit.trace(fn, inputs, check_trace=False)
+        return torch.compile(fn, dynamic=False, **self.compile_kwargs)
+
+    @torch.no_grad()
+    def __call__(self, rays, val_num, shape, appearance, poses=None):
+        """
+        :param rays (SB, val_num * H * W, 8)
+        :param shape (SB, z_dim)
+        :param appearance (SB, z_dim)
+        :param poses (SB, 3, 4) encoded input poses; default the ones stored
+        by the last net.encode
+        :return images (SB * val_num, 3, H', W'), or feature maps
+        (SB * val_num, C, H, W) if use_neural_renderer is false
+        """
+        if poses is None:
+            poses = self.net.poses
+        inputs = (rays, shape, appearance, poses)
+        if self.backend == "trace" and getattr(self.net, "feature_grid", None) is not None:
+            # A trace would bake in whether (and which) grid the codes use
+            return _RenderFunction(
+                self.net, self.renderer, val_num, self.use_neural_renderer
+            )(*inputs)
+        key = (
+            val_num,
+            rays.device,
+            rays.dtype,
+            id(getattr(self.net, "feature_grid", None)),
+        ) + tuple(tuple(t.shape) for t in inputs)
+        fn = self.functions.get(key)
+        if fn is None:
+            fn = self._build(val_num, inputs)
+            self.functions[key] = fn
+            if len(self.functions) > self.cache_size:
+                self.functions.popitem(last=False)
+        else:
+            self.functions.move_to_end(key)
+        return fn(*inputs)
+
+    def clear(self):
+        self.functions.clear()
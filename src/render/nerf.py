@@ -11,8 +11,70 @@ import torch.autograd.profiler as profiler
 from torch.nn import DataParallel
 from dotmap import DotMap
 from model import NeuralRenderer
+from .occupancy import OccupancyGridCache
 import math 
 
+def render_multi(render_par, passes, neural_renderer=None, val_num=1, want_weights=False, training=False, timer=None):
+    """
+    Render several (rays, shape, appearance) passes of the same encode as one
+    superbatch, so the decoder and neural renderer run once instead of once
+    per pass. Passes must have the same object batch and ray count.
+    :param render_par wrapper returned by NeRFRenderer.bind_parallel
+    :param passes list of (rays (SB, B, 8), shape (SB, z), appearance (SB, z))
+    :param neural_renderer if given, also runs it on the fused feature maps
+    :param timer optional util.StageTimer, times the "render" and
+    "neural_renderer" stages
+    :return tuple with one output per pass: feature maps (SB * val_num, C, h, w),
+    or images (SB * val_num, 3, H, W) if neural_renderer is given
+    """
+    rays = torch.cat([p[0] for p in passes], dim=0)
+    shape = torch.cat([p[1] for p in passes], dim=0)
+    appearance = torch.cat([p[2] for p in passes], dim=0)
+    if timer is None:
+        timer = util.StageTimer()
+    with timer("render"):
+        out = render_par(
+            rays, val_num=val_num, want_weights=want_weights, shape=shape, appearance=appearance, training=training,
+        )
+    if neural_renderer is not None:
+        with timer("neural_renderer"):
+            out = neural_renderer(out)
+    return torch.chunk(out, len(passes), dim=0)
+
+
+def render_progressive(render_par, neural_renderer, poses, shape, appearance, z_near, z_far, feat_sizes=(4, 8, 16), ray_gen=None):
+    """
+    Progressive preview: render the same views at increasing feature map
+    resolutions, so a coarse image can be shown quickly and then refined.
+    The neural renderer is fully convolutional, so all sizes use the trained
+    weights; rays use util.feat_intrinsics of each size.
+    :param render_par wrapper returned by NeRFRenderer.bind_parallel
+    :param neural_renderer model.NeuralRenderer
+    :param poses (SB, V, 4, 4) camera poses, V views per object
+    :param shape (SB, z) encoded shape codes
+    :param appearance (SB, z) encoded appearance codes
+    :param feat_sizes feature map sizes, coarse to fine
+    :param ray_gen optional util.RayGenerator to reuse
+    :return generator of (feat_size, images (SB * V, 3, H, W)), images upsampled
+    to the output size of the last feature size
+    """
+    if ray_gen is None:
+        ray_gen = util.RayGenerator()
+    SB, V = poses.shape[:2]
+    # The neural renderer upsamples by a fixed factor, one 2x per conv layer
+    out_size = feat_sizes[-1] * 2 ** len(neural_renderer.conv_layers)
+    for feat_size in feat_sizes:
+        focal, c = util.feat_intrinsics(feat_size)
+        rays = ray_gen(poses.reshape(-1, 4, 4), feat_size, feat_size, focal, z_near, z_far, c=c)
+        feat = render_par(
+            rays.reshape(SB, -1, 8), val_num=V, shape=shape, appearance=appearance,
+        )
+        images = neural_renderer(feat)
+        if images.shape[-1] != out_size:
+            images = F.interpolate(images, size=(out_size, out_size), mode="bilinear", align_corners=False)
+        yield feat_size, images
+
+
 class _RenderWrapper(torch.nn.Module):
     def __init__(self, net, renderer, simple_output):
         super().__init__()
@@ -20,7 +82,7 @@ class _RenderWrapper(torch.nn.Module):
         self.renderer = renderer    # self.renderer 
         self.simple_output = simple_output
 
-    def forward(self, rays, val_num=1, shape=None, appearance=None, want_weights=False, training=False):
+    def forward(self, rays, val_num=1, shape=None, appearance=None, want_weights=False, training=False, poses=None):
         if rays.shape[0] == 0:
             return (
                 torch.zeros(0, 3, device=rays.device),
@@ -32,7 +94,7 @@ class _RenderWrapper(torch.nn.Module):
         ###### 여기에서 밑의 함수로 흘러들어간다!
         ###### self.net = NeRFRenderer
         outputs = self.renderer(
-            self.net, rays, training, val_num, shape, appearance, want_weights=want_weights and not self.simple_output
+            self.net, rays, training, val_num, shape, appearance, want_weights=want_weights and not self.simple_output, poses=poses,
         )
         featmap = outputs.feat
         return featmap
@@ -46,9 +108,18 @@ class NeRFRenderer(torch.nn.Module):
     :param n_fine_depth number of expected depth samples
     :param noise_std noise to add to sigma. We do not use it
     :param depth_std noise for depth samples
-    :param eval_batch_size ray batch size for evaluation
+    :param eval_batch_size max number of points sent through the model at once;
+    bounds peak activation memory of composite
     :param white_bkgd if true, background color is white; else black
     :param lindisp if to use samples linear in disparity instead of distance
+    :param use_fine if true, runs an importance-sampled fine pass (n_fine samples)
+    on top of the coarse compositing weights, using the shared decoder
+    :param occupancy optional OccupancyGridCache; if given, samples in empty
+    cells are skipped when rendering without gradients
+    :param early_stop_thresh when rendering without gradients, stop evaluating
+    rays once their transmittance falls below this; 0 = disable
+    :param early_stop_segment number of samples per ray evaluated at a time
+    when early_stop_thresh > 0
     :param sched ray sampling schedule. list containing 3 lists of equal length.
     sched[0] is list of iteration numbers,
     sched[1] is list of coarse sample numbers,
@@ -66,6 +137,10 @@ class NeRFRenderer(torch.nn.Module):
         white_bkgd=False,
         lindisp=False,
         sched=None,  # ray sampling schedule for coarse and fine rays
+        use_fine=False,
+        occupancy=None,
+        early_stop_thresh=0.0,
+        early_stop_segment=16,
     ):
         super().__init__()
         self.n_coarse = n_coarse
@@ -74,12 +149,16 @@ class NeRFRenderer(torch.nn.Module):
 
         self.noise_std = noise_std
         self.depth_std = depth_std
+        self.eval_batch_size = eval_batch_size
 
         self.white_bkgd = white_bkgd
         self.lindisp = lindisp
         if lindisp:
             print("Using linear displacement rays")
-        self.using_fine = n_fine > 0
+        self.using_fine = use_fine and n_fine > 0
+        self.occupancy = occupancy
+        self.early_stop_thresh = early_stop_thresh
+        self.early_stop_segment = early_stop_segment
         self.sched = sched
         if sched is not None and len(sched) == 0:
             self.sched = None
@@ -156,7 +235,122 @@ class NeRFRenderer(torch.nn.Module):
         z_samp = torch.max(torch.min(z_samp, rays[:, -1:]), rays[:, -2:-1])
         return z_samp
 
-    def composite(self, model, rays, shape, appearance, z_samp, training, coarse=True, sb=0):        # 여기서 가져와지는 애들 찾기!
+    def _eval_model(self, model, points, viewdirs, num_pts, shape, appearance, coarse=True, poses=None):
+        """
+        Evaluate the model on all points, at most ~eval_batch_size at a time.
+        :param points (SB, N, 3), N = rays * num_pts
+        :param viewdirs (SB, N, 3)
+        :param num_pts number of samples per ray; chunks hold whole rays
+        since the model reshapes its output by it
+        :param poses optional input poses passed to the model (see forward)
+        :return (SB, N, C)
+        """
+        sb = points.shape[0]
+        eval_batch_size = max(self.eval_batch_size // (sb * num_pts), 1) * num_pts
+        split_points = torch.split(points, eval_batch_size, dim=1)
+        split_viewdirs = torch.split(viewdirs, eval_batch_size, dim=1)
+        val_all = []
+        for pnts, dirs in zip(split_points, split_viewdirs):
+            val_all.append(
+                model(pnts, num_pts=num_pts, shape=shape, appearance=appearance, coarse=coarse, viewdirs=dirs, training=self.training, poses=poses)
+            )
+        return torch.cat(val_all, dim=1)
+
+    def _eval_model_masked(self, model, points, viewdirs, mask, shape, appearance, coarse=True, poses=None):
+        """
+        Evaluate the model only where mask is set; other outputs are zero
+        (no feature, no density).
+        Selected points are packed to the front of each object's row and
+        padded to the largest count in the batch.
+        :param points (SB, N, 3)
+        :param viewdirs (SB, N, 3)
+        :param mask (SB, N) bool
+        :return (SB, N, C)
+        """
+        SB, N, _ = points.shape
+        counts = mask.sum(dim=1)  # (SB)
+        n_max = max(int(counts.max()), 1)
+        # Stable sort puts selected indices first, in their original order
+        order = torch.sort((~mask).to(torch.uint8), dim=1, stable=True)[1][:, :n_max]
+        valid = torch.arange(n_max, device=points.device)[None] < counts[:, None]
+
+        pnts = util.batched_index_select_nd(points, order)  # (SB, n_max, 3)
+        dirs = util.batched_index_select_nd(viewdirs, order)
+        out_sel = self._eval_model(model, pnts, dirs, 1, shape, appearance, coarse, poses)
+        out_sel = out_sel * valid.unsqueeze(-1)
+
+        # order holds distinct indices per row; padded entries write zeros
+        # to points that were not selected anyway
+        out = out_sel.new_zeros(SB, N, out_sel.shape[-1])
+        out.scatter_(1, order.unsqueeze(-1).expand(-1, -1, out.shape[-1]), out_sel)
+        return out
+
+    def _occupancy_mask(self, model, points, shape, poses=None):
+        """
+        :param points (SB, N, 3) world space
+        :return (SB, N) bool, False for samples in empty cells
+        """
+        grids = self.occupancy.get(model.decoder, shape)
+        mask = self.occupancy.lookup(grids, model.to_input_space(points, poses))
+        self.occupancy.num_total += mask.numel()
+        self.occupancy.num_queried += int(mask.sum())
+        return mask
+
+    def _composite_early_stop(self, model, points, viewdirs, deltas, z_samp, shape, appearance, coarse=True, poses=None):
+        """
+        Inference-only compositing with early ray termination.
+        Walks the samples front to back in segments of early_stop_segment and
+        stops querying the model for rays whose transmittance dropped below
+        early_stop_thresh. Terminated samples get zero weight, so the result
+        matches composite up to ~early_stop_thresh * |feat|.
+        :param points (SB, B'*K, 3)
+        :param viewdirs (SB, B'*K, 3)
+        :param deltas (B, K)
+        :param z_samp (B, K)
+        :return weights (B, K), feat (B, C), depth (B)
+        """
+        B, K = z_samp.shape
+        sb = points.shape[0]
+        points = points.reshape(B, K, 3)
+        viewdirs = viewdirs.reshape(B, K, 3)
+
+        weights = torch.zeros_like(z_samp)
+        feat_final = 0.0
+        T = torch.ones_like(z_samp[:, 0])  # (B) transmittance before the segment
+        for k0 in range(0, K, self.early_stop_segment):
+            k1 = min(k0 + self.early_stop_segment, K)
+            active = T > self.early_stop_thresh  # (B)
+            if not active.any():
+                break
+            pnts = points[:, k0:k1].reshape(sb, -1, 3)  # (SB, B'*n, 3)
+            dirs = viewdirs[:, k0:k1].reshape(sb, -1, 3)
+            mask = active[:, None].expand(-1, k1 - k0).reshape(sb, -1)
+            if self.occupancy is not None:
+                mask = mask & self._occupancy_mask(model, pnts, shape, poses)
+            out = self._eval_model_masked(
+                model, pnts, dirs, mask, shape, appearance, coarse, poses
+            ).reshape(B, k1 - k0, -1).float()
+
+            feats = out[..., :-1]  # (B, n, C)
+            sigmas = out[..., -1]  # (B, n)
+            alphas = 1 - torch.exp(-deltas[:, k0:k1] * torch.relu(sigmas))  # (B, n)
+            alphas_shifted = torch.cat(
+                [torch.ones_like(alphas[:, :1]), 1 - alphas + 1e-10], -1
+            )  # (B, n+1)
+            T_seg = T.unsqueeze(-1) * torch.cumprod(alphas_shifted, -1)  # (B, n+1)
+            seg_weights = alphas * T_seg[:, :-1]  # (B, n)
+
+            weights[:, k0:k1] = seg_weights
+            feat_final = feat_final + torch.sum(seg_weights.unsqueeze(-1) * feats, -2)
+            T = T_seg[:, -1]
+        depth_final = torch.sum(weights * z_samp, -1)  # (B)
+        return (
+            weights,
+            feat_final,
+            depth_final,
+        )
+
+    def composite(self, model, rays, shape, appearance, z_samp, training, coarse=True, sb=0, poses=None):        # 여기서 가져와지는 애들 찾기!
         """     
         Render RGB and depth for each ray using NeRF alpha-compositing formula,
         given sampled positions along each ray (see sample_*)
@@ -166,6 +360,7 @@ class NeRFRenderer(torch.nn.Module):
         :param z_samp z positions sampled for each ray (B, K)
         :param coarse whether to evaluate using coarse NeRF
         :param sb super-batch dimension; 0 = disable
+        :param poses optional input poses passed to the model (see forward)
         :return weights (B, K), rgb (B, 3), depth (B)
         """
         # nerf.py가 나름 바깥에서 batch 연산을 적용중!
@@ -192,23 +387,38 @@ class NeRFRenderer(torch.nn.Module):
             #############################################################################
 
             use_viewdirs = hasattr(model, "use_viewdirs") and model.use_viewdirs
-            val_all = []
             # points: (4, 8192, 3)
-            # eval_batch_size = 25000
-            # 아 그냥 eval batch 구분하지 말고 바로 넣기 (어차피 구분 안돼서 들어가고 있었음)
             dim1 = K    # 64: # sampling points for each ray 
             viewdirs = rays[:, None, 3:6].expand(-1, dim1, -1)  # (B, K, 3)     # (512 batch * rays, 64 #sampling points , 3)
             viewdirs = viewdirs.reshape(sb, -1, 3)  # (SB, B'*K, 3)  # (batch, rays*sampling points, 3)
-            out = model(points, num_pts=K, shape=shape, appearance=appearance, coarse=coarse, viewdirs=viewdirs, training=self.training) # pnts, dirs 둘 다 :(4, 8192, 3) <- 뭐야 그냥 그대로 들어가도 되는거였음 
-                # 여기서는 model: PixelNeRFNet의 forward함수로 바로 ㄱㄱ!
+
+            if self.early_stop_thresh > 0.0 and not torch.is_grad_enabled():
+                return self._composite_early_stop(
+                    model, points, viewdirs, deltas, z_samp, shape, appearance, coarse, poses
+                )
+
+            if self.occupancy is not None and not torch.is_grad_enabled():
+                # Empty-space skipping: only query the model at samples in
+                # occupied cells of the shape's occupancy grid
+                mask = self._occupancy_mask(model, points, shape, poses)
+                out = self._eval_model_masked(
+                    model, points, viewdirs, mask, shape, appearance, coarse, poses
+                )
+                mask = None
+            else:
+                out = self._eval_model(
+                    model, points, viewdirs, K, shape, appearance, coarse, poses
+                )   # 여기서는 model: PixelNeRFNet의 forward함수로 바로 ㄱㄱ!
 
             points = None
             viewdirs = None
 
             # 오케... 여기까지가 sampling points 다 살아있는 상태에서 rgba 계산된 결과!!
-            # (B*K, 4) OR (SB, B'*K, 4)
-
+            # (SB, B'*K, 129)
             out = out.reshape(B, K, -1)  # (B, K, 4 or 5)   (512, 64, 4) <- (batch*#rays, #points, rgba)
+            # Composite in fp32 under autocast: the transmittance cumprod
+            # underflows in half precision
+            out = out.float()
 
             feats = out[..., :-1]  # (B, K, 3)
             sigmas = out[..., -1]  # (B, K)
@@ -227,6 +437,7 @@ class NeRFRenderer(torch.nn.Module):
             alphas_shifted = None
 
             feat_final = torch.sum(weights.unsqueeze(-1) * feats, -2)  # (B, 3)
+            depth_final = torch.sum(weights * z_samp, -1)  # (B)
             # compositing 성공!
 
             # 여기에 neural renderer 넣기 -> net에 최종으로 잘 들어가는지 확인!
@@ -236,10 +447,14 @@ class NeRFRenderer(torch.nn.Module):
             # pix_alpha = weights.sum(dim=1)  # (B), pixel alpha
             # rgb_final = rgb_final + 1 - pix_alpha.unsqueeze(-1)  # (B, 3)
 
-            return feat_final
+            return (
+                weights,
+                feat_final,
+                depth_final,
+            )
 
     def forward(
-        self, model, rays, training, val_num, shape, appearance, want_weights=False,
+        self, model, rays, training, val_num, shape, appearance, want_weights=False, poses=None,
     ):
         """
         :model nerf model, should return (SB, B, (r, g, b, sigma))
@@ -249,49 +464,88 @@ class NeRFRenderer(torch.nn.Module):
         Should also support 'coarse' boolean argument for coarse NeRF.
         :param rays ray spec [origins (3), directions (3), near (1), far (1)] (SB, B, 8)
         :param want_weights if true, returns compositing weights (SB, B, K)
+        :param poses optional (SB, 3, 4) world -> input view transforms, used
+        instead of the ones stored on the model by encode
         :return render dict
         """
         with profiler.record_function("renderer_forward"):
-            if self.sched is not None and self.last_sched.item() > 0:
-                self.n_coarse = self.sched[1][self.last_sched.item() - 1]
-                self.n_fine = self.sched[2][self.last_sched.item() - 1]
-
-            assert len(rays.shape) == 3
-            superbatch_size = rays.shape[0] # (1, 16*16, 8)
-            rays = rays.reshape(-1, 8)  # (SB * B, 8) -> (16*16, 8)
-            ray_res = int(math.sqrt(rays.shape[0]/ val_num / superbatch_size))  # -> 16
-
-            z_coarse = self.sample_coarse(rays)  # (B, Kc)  # coarse        # sampled points  -> (16*16, 8) -> 64도 same
-            # -> z_coarse = (1024 (4 * 256), 64), rays = (1024 (4 * 256), 8)
-            coarse_composite = self.composite(               # given models, rays, z_coars values, -> sampled points along ray! 
-                model, rays, shape, appearance, z_coarse, training, coarse=True, sb=superbatch_size,
-            ).reshape(superbatch_size * val_num, -1, ray_res, ray_res)   # [1]: feat -> (batch*ray, feat_dim) -> 우리는 여기서 2DCNN을 가져와서 돌려야 함!   -> 각 ray가 rgb가 아닌 feature를 가지고 있기 때문!
-
-            # for visualization -> 정리하기!
-            # rgb_np= np.array(rgb.detach().cpu())
-            # out_file_name = 'visualization_%010d.png' % it
-            # image_grid = make_grid(torch.cat((x_real, image_fake.clamp_(0., 1.), image_swap.clamp_(0., 1.), image_rand.clamp_(0., 1.)), dim=0), nrow=image_fake.shape[0])
-            # save_image(image_grid, os.path.join(self.val_vis_dir, out_file_name))
-
-            ################################################################
-            ################## 여기까지 해서, 최종 ray 뽑자 ######################
-            ################################################################
-            ################################################################
-            outputs = DotMap(
-                feat=self._format_outputs(
-                    coarse_composite, superbatch_size, want_weights=want_weights,
-                ),  # 이거를 coarse.rgb로 호출할 수 있게 됨!
+            feat, feat_coarse = self.render_feat(
+                model, rays, training, val_num, shape, appearance, want_weights=want_weights, poses=poses,
             )
+            outputs = DotMap(feat=feat)  # 이거를 coarse.rgb로 호출할 수 있게 됨!
+            if feat_coarse is not None:
+                outputs.feat_coarse = feat_coarse
             return outputs
 
+    def render_feat(
+        self, model, rays, training, val_num, shape, appearance, want_weights=False, poses=None,
+    ):
+        """
+        Tensor-only part of forward (see there for the arguments), e.g. for
+        compiling it (see render.CompiledRenderer)
+        :return feature maps (SB * val_num, C, H, W), coarse feature maps
+        if the fine pass is used (else None)
+        """
+        if self.sched is not None and self.last_sched.item() > 0:
+            self.n_coarse = self.sched[1][self.last_sched.item() - 1]
+            self.n_fine = self.sched[2][self.last_sched.item() - 1]
+
+        assert len(rays.shape) == 3
+        superbatch_size = rays.shape[0] # (1, 16*16, 8)
+        rays = rays.reshape(-1, 8)  # (SB * B, 8) -> (16*16, 8)
+        ray_res = int(math.sqrt(rays.shape[0]/ val_num / superbatch_size))  # -> 16
+
+        z_coarse = self.sample_coarse(rays)  # (B, Kc)  # coarse        # sampled points  -> (16*16, 8) -> 64도 same
+        # -> z_coarse = (1024 (4 * 256), 64), rays = (1024 (4 * 256), 8)
+        coarse_composite = self.composite(               # given models, rays, z_coars values, -> sampled points along ray! 
+            model, rays, shape, appearance, z_coarse, training, coarse=True, sb=superbatch_size, poses=poses,
+        )   # [1]: feat -> (batch*ray, feat_dim) -> 우리는 여기서 2DCNN을 가져와서 돌려야 함!   -> 각 ray가 rgb가 아닌 feature를 가지고 있기 때문!
+
+        # for visualization -> 정리하기!
+        # rgb_np= np.array(rgb.detach().cpu())
+        # out_file_name = 'visualization_%010d.png' % it
+        # image_grid = make_grid(torch.cat((x_real, image_fake.clamp_(0., 1.), image_swap.clamp_(0., 1.), image_rand.clamp_(0., 1.)), dim=0), nrow=image_fake.shape[0])
+        # save_image(image_grid, os.path.join(self.val_vis_dir, out_file_name))
+
+        ################################################################
+        ################## 여기까지 해서, 최종 ray 뽑자 ######################
+        ################################################################
+        ################################################################
+        feat = self._format_outputs(
+            coarse_composite, superbatch_size * val_num, ray_res, want_weights=want_weights,
+        )
+        feat_coarse = None
+
+        if self.using_fine:
+            # Importance samples from the coarse weights, composited together
+            # with the coarse samples. The fine map replaces feat.
+            all_samps = [z_coarse]
+            if self.n_fine - self.n_fine_depth > 0:
+                all_samps.append(
+                    self.sample_fine(rays, coarse_composite[0].detach())
+                )  # (B, Kf - Kfd)
+            if self.n_fine_depth > 0:
+                all_samps.append(
+                    self.sample_fine_depth(rays, coarse_composite[2].detach())
+                )  # (B, Kfd)
+            z_combine = torch.cat(all_samps, dim=-1)  # (B, Kc + Kf)
+            z_combine_sorted, argsort = torch.sort(z_combine, dim=-1)
+            fine_composite = self.composite(
+                model, rays, shape, appearance, z_combine_sorted, training, coarse=False, sb=superbatch_size, poses=poses,
+            )
+            feat_coarse = feat
+            feat = self._format_outputs(
+                fine_composite, superbatch_size * val_num, ray_res, want_weights=want_weights,
+            )
+        return feat, feat_coarse
+
     def _format_outputs(
-        self, rendered_outputs, superbatch_size, want_weights=False,
+        self, rendered_outputs, num_maps, ray_res, want_weights=False,
     ):
-        # rendered_outputs: (batch * rays, 3)
-        # superbatch로 reshape -> (batch, rays, 3)
-        feat_map = rendered_outputs  # 
-        # if superbatch_size > 0:
-        #     feat_map = feat.reshape(superbatch_size, -1, 128)  # batch, rays, #feat
+        # rendered_outputs: weights (batch * rays, K), feat (batch * rays, 128), depth (batch * rays)
+        # feat -> (batch * val_num, 128, ray_res, ray_res) feature map for the neural renderer
+        weights, feat, depth = rendered_outputs
+        feat_map = feat.reshape(num_maps, -1, ray_res, ray_res)
         return feat_map
 
     def sched_step(self, steps=1):
@@ -318,6 +572,12 @@ class NeRFRenderer(torch.nn.Module):
 
     @classmethod
     def from_conf(cls, conf, white_bkgd=False, lindisp=False, eval_batch_size=100000):
+        eval_batch_size = conf.get_int("eval_batch_size", eval_batch_size)
+        occupancy = None
+        if conf.get_bool("occupancy.enabled", False):
+            occupancy = OccupancyGridCache.from_conf(
+                conf["occupancy"], eval_batch_size=eval_batch_size
+            )
         return cls(
             conf.get_int("n_coarse", 128),
             conf.get_int("n_fine", 0),
@@ -326,8 +586,12 @@ class NeRFRenderer(torch.nn.Module):
             depth_std=conf.get_float("depth_std", 0.01),
             white_bkgd=conf.get_float("white_bkgd", white_bkgd),
             lindisp=lindisp,
-            eval_batch_size=conf.get_int("eval_batch_size", eval_batch_size),
+            eval_batch_size=eval_batch_size,
             sched=conf.get_list("sched", None),
+            use_fine=conf.get_bool("use_fine", False),
+            occupancy=occupancy,
+            early_stop_thresh=conf.get_float("early_stop_thresh", 0.0),
+            early_stop_segment=conf.get_int("early_stop_segment", 16),
         )
 
     def bind_parallel(self, net, gpus=None, simple_output=False):
@@ -0,0 +1,88 @@
+"""
+Stateless inference API: encode images to ObjectCodes, render codes from
+arbitrary poses. Nothing is read from or left on the network between calls,
+so codes of different clients can be cached and rendered together.
+"""
+import torch
+import util
+from model import ObjectCode
+from .compiled import CompiledRenderer
+
+
+class ObjectRenderer:
+    """
+    :param net PixelNeRFNet, in eval mode
+    :param renderer NeRFRenderer, in eval mode
+    :param z_near near bound of the rendered rays
+    :param z_far far bound of the rendered rays
+    :param backend eager | trace | compile; the latter two render with a
+    CompiledRenderer (compiled once per batch shape)
+    """
+
+    def __init__(self, net, renderer, z_near=0.8, z_far=1.8, backend="eager"):
+        self.net = net
+        self.renderer = renderer
+        self.z_near = z_near
+        self.z_far = z_far
+        self.render_par = renderer.bind_parallel(net, simple_output=True)
+        self.compiled = None
+        if backend != "eager":
+            self.compiled = CompiledRenderer(net, renderer, backend=backend)
+        self.ray_gen = util.RayGenerator()
+
+    @property
+    def device(self):
+        return self.net.poses.device
+
+    @torch.no_grad()
+    def encode(self, images, poses=None):
+        """
+        :param images (N, 3, H, W) one source view per object, in [-1, 1]
+        :param poses optional (N, 4, 4) source camera poses; default the
+        poses predicted by the encoder
+        :return ObjectCode of the N objects
+        """
+        rotmat, shape, appearance = self.net.encoder(images.to(device=self.device))
+        if poses is None:
+            poses = rotmat
+        poses = poses.reshape(-1, 4, 4).to(device=self.device)
+        return ObjectCode(shape, appearance, self.net.world_to_input(poses), rotmat)
+
+    @torch.no_grad()
+    def render(self, codes, poses, resolution=None):
+        """
+        :param codes ObjectCode of N objects (e.g. ObjectCode.cat of several
+        requests)
+        :param poses (N, V, 4, 4) camera poses to render, V views per object
+        :param resolution feature map size (see util.feat_intrinsics); the
+        images are upsampled from it by the neural renderer. Default the
+        model's feat_size
+        :return images (N, V, 3, H, W) in [0, 1]
+        """
+        feat_size = resolution or self.net.feat_size
+        codes = codes.to(device=self.device)
+        N, V = poses.shape[:2]
+        focal, c = util.feat_intrinsics(feat_size)
+        rays = self.ray_gen(
+            poses.reshape(-1, 4, 4).to(device=self.device),
+            feat_size,
+            feat_size,
+            focal,
+            self.z_near,
+            self.z_far,
+            c=c,
+        ).reshape(N, -1, 8)
+        if self.compiled is not None:
+            images = self.compiled(
+                rays, V, codes.shape, codes.appearance, codes.input_poses
+            )
+        else:
+            feat = self.render_par(
+                rays,
+                val_num=V,
+                shape=codes.shape,
+                appearance=codes.appearance,
+                poses=codes.input_poses,
+            )
+            images = self.net.neural_renderer(feat)
+        return images.float().clamp(0.0, 1.0).view(N, V, *images.shape[1:])
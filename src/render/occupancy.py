@@ -0,0 +1,140 @@
+"""
+Occupancy grids for empty-space skipping.
+"""
+from collections import OrderedDict
+import torch
+import torch.nn.functional as F
+import util
+
+
+class OccupancyGridCache:
+    """
+    LRU cache of coarse per-shape occupancy grids.
+    A grid is built by querying the decoder density branch once at the cell
+    centers of a (R, R, R) grid spanning [-bound, bound]^3, and marks cells
+    with sigma above sigma_thresh (dilated by a few cells to be conservative).
+    Grids live in the decoder's input frame (world points rotated into the
+    encoded view, see PixelNeRFNet.to_input_space), so they depend on the
+    shape latent only and can be reused across all render poses of an object.
+    :param resolution grid resolution per axis
+    :param bound half extent of the grid; points outside are always evaluated
+    :param sigma_thresh cells with relu(sigma) <= this are considered empty
+    :param dilate number of cells to dilate occupied regions by
+    :param cache_size max number of shapes kept
+    :param eval_batch_size max number of points per decoder call while building
+    """
+
+    def __init__(
+        self,
+        resolution=32,
+        bound=1.0,
+        sigma_thresh=0.01,
+        dilate=1,
+        cache_size=64,
+        eval_batch_size=100000,
+    ):
+        self.resolution = resolution
+        self.bound = bound
+        self.sigma_thresh = sigma_thresh
+        self.dilate = dilate
+        self.cache_size = cache_size
+        self.eval_batch_size = eval_batch_size
+
+        self.grids = OrderedDict()
+        self._weights_version = None
+        # Decoder query statistics, see skip_ratio
+        self.num_total = 0
+        self.num_queried = 0
+
+    def clear(self):
+        self.grids.clear()
+
+    @property
+    def skip_ratio(self):
+        """
+        Fraction of samples skipped so far
+        """
+        if self.num_total == 0:
+            return 0.0
+        return 1.0 - self.num_queried / self.num_total
+
+    def _check_weights(self, decoder):
+        # Optimizer steps bump the parameter versions; drop stale grids
+        version = tuple(p._version for p in decoder.parameters())
+        if version != self._weights_version:
+            self.clear()
+            self._weights_version = version
+
+    @torch.no_grad()
+    def build(self, decoder, z_shape):
+        """
+        Build the occupancy grid of a single shape
+        :param decoder model.Decoder
+        :param z_shape (z_dim)
+        :return (R, R, R) bool
+        """
+        reso = self.resolution
+        c1, c2 = [-self.bound] * 3, [self.bound] * 3
+        grid = util.gen_grid(*zip(c1, c2, [reso] * 3), ij_indexing=True)
+        grid = grid.to(device=z_shape.device)
+
+        all_sigmas = []
+        for pnts in torch.split(grid, self.eval_batch_size, dim=0):
+            _, sigma = decoder.forward_density(pnts[None], z_shape[None])
+            all_sigmas.append(sigma[0])
+        sigmas = torch.cat(all_sigmas).view(1, 1, reso, reso, reso)
+
+        occ = (torch.relu(sigmas) > self.sigma_thresh).float()
+        if self.dilate > 0:
+            ksz = 2 * self.dilate + 1
+            occ = F.max_pool3d(occ, ksz, stride=1, padding=self.dilate)
+        return occ[0, 0] > 0
+
+    def get(self, decoder, z_shape):
+        """
+        Get (building if needed) the occupancy grids of a batch of shapes
+        :param decoder model.Decoder
+        :param z_shape (SB, z_dim)
+        :return (SB, R, R, R) bool
+        """
+        self._check_weights(decoder)
+        grids = []
+        for z in z_shape.detach():
+            key = z.cpu().numpy().tobytes()
+            if key in self.grids:
+                self.grids.move_to_end(key)
+            else:
+                self.grids[key] = self.build(decoder, z)
+                if len(self.grids) > self.cache_size:
+                    self.grids.popitem(last=False)
+            grids.append(self.grids[key].to(device=z_shape.device))
+        return torch.stack(grids)
+
+    def lookup(self, grids, points):
+        """
+        Look up occupancy of points in the decoder input frame
+        :param grids (SB, R, R, R) bool from get()
+        :param points (SB, N, 3)
+        :return (SB, N) bool, True where the point must be evaluated
+        """
+        SB, N, _ = points.shape
+        reso = self.resolution
+        coords = (points + self.bound) / (2 * self.bound) * (reso - 1)
+        inds = torch.round(coords).long()
+        inside = ((inds >= 0) & (inds < reso)).all(dim=-1)  # (SB, N)
+        inds = inds.clamp(0, reso - 1)
+        flat = (inds[..., 0] * reso + inds[..., 1]) * reso + inds[..., 2]
+        occupied = grids.reshape(SB, -1).gather(1, flat)
+        # Outside the grid we know nothing; keep those samples
+        return occupied | ~inside
+
+    @classmethod
+    def from_conf(cls, conf, eval_batch_size=100000):
+        return cls(
+            resolution=conf.get_int("resolution", 32),
+            bound=conf.get_float("bound", 1.0),
+            sigma_thresh=conf.get_float("sigma_thresh", 0.01),
+            dilate=conf.get_int("dilate", 1),
+            cache_size=conf.get_int("cache_size", 64),
+            eval_batch_size=eval_batch_size,
+        )
@@ -1,4 +1,6 @@
 from .util import *
 from . import args
+from . import distributed
+from .checkpoint import CheckpointManager
 
 #  from . import recon
@@ -73,6 +73,13 @@ def parse_args(
     parser.add_argument(
         "--ray_batch_size", "-R", type=int, default=default_ray_batch_size, help="Ray batch size"
     )
+    parser.add_argument(
+        "--amp",
+        type=str,
+        default="none",
+        choices=["none", "fp16", "bf16"],
+        help="Mixed precision mode; fp16 needs CUDA, bf16 also runs on CPU",
+    )
     if callback is not None:
         parser = callback(parser)
     args = parser.parse_args()
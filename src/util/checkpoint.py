@@ -0,0 +1,109 @@
+"""
+Consolidated, asynchronously written training checkpoints.
+"""
+import os
+import re
+import threading
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r"^ckpt_(\d+)\.pt$")
+
+
+def snapshot(state):
+    """
+    Copy of a (nested) state dict with all tensors cloned to CPU, so that
+    training can keep updating the originals while it is being written
+    """
+    if torch.is_tensor(state):
+        return state.detach().to(device="cpu", copy=True)
+    if isinstance(state, dict):
+        return type(state)((k, snapshot(v)) for k, v in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(v) for v in state)
+    return state
+
+
+class CheckpointManager:
+    """
+    Writes one file per save (ckpt_<step>.pt in ckpt_dir) holding all training
+    state, on a background thread. Files are written to a temporary name and
+    renamed into place, so a crash mid-save leaves the previous checkpoints
+    intact; only the last keep_last checkpoints are kept.
+    :param ckpt_dir checkpoint directory
+    :param keep_last number of checkpoints kept, 0 = all
+    """
+
+    def __init__(self, ckpt_dir, keep_last=3):
+        self.ckpt_dir = ckpt_dir
+        self.keep_last = keep_last
+        self.thread = None
+        self.error = None
+        os.makedirs(ckpt_dir, exist_ok=True)
+
+    def steps(self):
+        """
+        :return sorted steps of the checkpoints on disk
+        """
+        steps = []
+        for name in os.listdir(self.ckpt_dir):
+            match = CHECKPOINT_PATTERN.match(name)
+            if match:
+                steps.append(int(match.group(1)))
+        return sorted(steps)
+
+    def path(self, step):
+        return os.path.join(self.ckpt_dir, "ckpt_{:08d}.pt".format(step))
+
+    def latest(self):
+        """
+        :return path of the newest checkpoint, None if there is none
+        """
+        steps = self.steps()
+        return self.path(steps[-1]) if steps else None
+
+    def load(self, map_location="cpu"):
+        """
+        :return state of the newest checkpoint, None if there is none
+        """
+        path = self.latest()
+        if path is None:
+            return None
+        return torch.load(path, map_location=map_location)
+
+    def save(self, step, state):
+        """
+        Snapshot state to CPU now and write it in the background.
+        Waits for the previous save first, so at most one snapshot is held.
+        :param step training step, orders the checkpoints
+        :param state dict of state dicts / values
+        """
+        self.wait()
+        state = snapshot(state)
+        self.thread = threading.Thread(target=self._write, args=(step, state), daemon=False)
+        self.thread.start()
+
+    def wait(self):
+        """
+        Block until the pending save is on disk; re-raises its error
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _write(self, step, state):
+        try:
+            path = self.path(step)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                torch.save(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            if self.keep_last > 0:
+                for old_step in self.steps()[: -self.keep_last]:
+                    os.remove(self.path(old_step))
+        except Exception as e:
+            self.error = e
@@ -0,0 +1,94 @@
+"""
+Multi-process (data parallel) training helpers.
+Processes are started by torchrun (or any launcher setting RANK, WORLD_SIZE,
+LOCAL_RANK, MASTER_ADDR and MASTER_PORT); without them everything here is a
+no-op for a single process.
+"""
+import os
+import torch
+import torch.distributed as dist
+
+
+def init(backend=None):
+    """
+    Join the process group if launched with WORLD_SIZE > 1
+    :param backend nccl | gloo; default nccl with CUDA, else gloo
+    :return (rank, world_size, local_rank)
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size <= 1:
+        return 0, 1, 0
+    rank = int(os.environ["RANK"])
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    if backend is None:
+        backend = "nccl" if torch.cuda.is_available() else "gloo"
+    if backend == "nccl":
+        torch.cuda.set_device(local_rank)
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend, rank=rank, world_size=world_size)
+    return rank, world_size, local_rank
+
+
+def is_initialized():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_initialized() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_initialized() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def broadcast_module(module, src=0):
+    """
+    Copy the parameters and buffers of module on rank src to all ranks
+    """
+    if get_world_size() == 1:
+        return
+    with torch.no_grad():
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            dist.broadcast(tensor.data, src)
+
+
+def average_gradients(module, bucket_numel=2 ** 24):
+    """
+    All-reduce (average) the gradients of module across ranks, coalesced into
+    flat buckets of up to bucket_numel elements per dtype.
+    All ranks must have gradients for the same parameters.
+    """
+    world_size = get_world_size()
+    if world_size == 1:
+        return
+    buckets = {}
+    for param in module.parameters():
+        if param.grad is None:
+            continue
+        bucket = buckets.setdefault(param.grad.dtype, [[]])
+        if sum(g.numel() for g in bucket[-1]) + param.grad.numel() > bucket_numel and bucket[-1]:
+            bucket.append([])
+        bucket[-1].append(param.grad)
+    for bucket in buckets.values():
+        for grads in bucket:
+            flat = torch.cat([g.reshape(-1) for g in grads])
+            dist.all_reduce(flat)
+            flat /= world_size
+            offset = 0
+            for g in grads:
+                g.copy_(flat[offset : offset + g.numel()].view_as(g))
+                offset += g.numel()
+
+
+def barrier():
+    if get_world_size() > 1:
+        dist.barrier()
+
+
+def destroy():
+    if is_initialized():
+        dist.destroy_process_group()
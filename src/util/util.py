@@ -6,8 +6,12 @@ from torch import nn
 from torch.nn import init
 import torch.nn.functional as F
 import functools
+import contextlib
 import math
+import time
+import torch.autograd.profiler as profiler
 import warnings
+import weakref
 
 
 def image_float_to_uint8(img):
@@ -203,6 +207,71 @@ def get_cuda(gpu_id):
     )
 
 
+AMP_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def autocast(device, amp="none"):
+    """
+    Mixed precision context for running a model on device.
+    fp16 needs CUDA (and loss scaling when training, see trainlib.Trainer);
+    bf16 also works on CPU.
+    :param device torch.device
+    :param amp none | fp16 | bf16
+    """
+    if amp == "none":
+        return contextlib.nullcontext()
+    device = torch.device(device)
+    if amp == "fp16" and device.type != "cuda":
+        raise ValueError("fp16 autocast needs CUDA, use bf16 on CPU")
+    return torch.autocast(device.type, dtype=AMP_DTYPES[amp])
+
+
+class StageTimer:
+    """
+    Wall time per named stage of a step. Stages are also labelled with
+    profiler.record_function, so they show up in torch.profiler traces.
+    Timing synchronizes CUDA at stage boundaries, so it is opt-in.
+    Usage: with timer("encode"): ...; times = timer.pop()
+    :param enabled measure times; if false only labels the stages
+    :param device device the stages run on
+    """
+
+    def __init__(self, enabled=False, device=None):
+        self.enabled = enabled
+        self.cuda = device is not None and torch.device(device).type == "cuda"
+        self.times = {}
+
+    def _sync(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        with profiler.record_function(name):
+            if not self.enabled:
+                yield
+                return
+            self._sync()
+            t0 = time.perf_counter()
+            yield
+            self._sync()
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name, seconds):
+        """
+        Add time to a stage; repeated stages in a step accumulate
+        """
+        if self.enabled:
+            self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def pop(self):
+        """
+        :return dict of stage name -> seconds since the last pop
+        """
+        times, self.times = self.times, {}
+        return times
+
+
 def masked_sample(masks, num_pix, prop_inside, thresh=0.5):
     """
     :return (num_pix, 3)
@@ -236,6 +305,19 @@ def bbox_sample(bboxes, num_pix):
     return pix
 
 
+def feat_intrinsics(feat_size=16):
+    """
+    Focal length and principal point of a rendered feature map.
+    The model is trained with a focal of 21.87719 px on 16x16 feature maps;
+    other resolutions scale it, so the same model can render any size.
+    :param feat_size feature map width/height
+    :return focal (1), c (2)
+    """
+    focal = torch.tensor([2.187719,]) * 10 * (feat_size / 16)
+    c = torch.tensor([feat_size * 0.5, feat_size * 0.5])
+    return focal, c
+
+
 def gen_rays(poses, width, height, focal, z_near, z_far, c=None, ndc=False):
     """
     Generate camera rays
@@ -248,6 +330,17 @@ def gen_rays(poses, width, height, focal, z_near, z_far, c=None, ndc=False):
         .unsqueeze(0)      
         .repeat(num_images, 1, 1, 1)     # 어차피 NV여도 f,c 는 전부 동일하니까!-> 바로 repeat num_images 
     )       # output: (H, W, 3)
+    return _rays_from_unproj(poses, cam_unproj_map, width, height, focal, z_near, z_far, ndc)
+
+
+def _rays_from_unproj(poses, cam_unproj_map, width, height, focal, z_near, z_far, ndc):
+    """
+    Transform camera-space ray directions to world rays
+    :param cam_unproj_map (B or 1, H, W, 3)
+    :return (B, H, W, 8)
+    """
+    num_images = poses.shape[0]
+    device = poses.device
     cam_centers = poses[:, None, None, :3, 3].expand(-1, height, width, -1)
     # poses dimension: (NV, 4, 4) 
 
@@ -279,6 +372,63 @@ def gen_rays(poses, width, height, focal, z_near, z_far, c=None, ndc=False):
     )  # (B, H, W, 8)
 
 
+class RayGenerator:
+    """
+    Camera ray generator with the same output as gen_rays, but caching the
+    camera-space unprojection map per (width, height, focal, c, device), so
+    repeated calls only do the batched rotation by the poses.
+    Keys of focal / c tensors on a GPU are read back once per tensor and
+    version, so reusing the same tensors does not sync with the device.
+    :param cache_size max number of unprojection maps kept
+    """
+
+    def __init__(self, cache_size=16):
+        self.cache_size = cache_size
+        self.unproj_maps = {}
+        # id(tensor) -> (weakref to it, its _version, key)
+        self.tensor_keys = {}
+
+    def _key(self, x):
+        if x is None:
+            return None
+        if torch.is_tensor(x):
+            if x.device.type == "cpu" or x.is_inference():
+                return tuple(x.detach().reshape(-1).tolist())
+            entry = self.tensor_keys.get(id(x))
+            if entry is None or entry[0]() is not x or entry[1] != x._version:
+                # .tolist() waits for the device
+                entry = (weakref.ref(x), x._version, tuple(x.detach().reshape(-1).tolist()))
+                self.tensor_keys[id(x)] = entry
+                if len(self.tensor_keys) > self.cache_size:
+                    self.tensor_keys.pop(next(iter(self.tensor_keys)))
+            return entry[2]
+        if isinstance(x, (list, tuple)):
+            return tuple(float(v) for v in x)
+        return float(x)
+
+    def get_unproj_map(self, width, height, focal, c=None, device="cpu"):
+        """
+        Cached unproj_map
+        :return (1, H, W, 3)
+        """
+        key = (width, height, self._key(focal), self._key(c), torch.device(device))
+        cam_unproj_map = self.unproj_maps.get(key)
+        if cam_unproj_map is None:
+            if len(self.unproj_maps) >= self.cache_size:
+                self.unproj_maps.pop(next(iter(self.unproj_maps)))
+            cam_unproj_map = unproj_map(width, height, focal, c=c, device=device)[None]
+            self.unproj_maps[key] = cam_unproj_map
+        return cam_unproj_map
+
+    def __call__(self, poses, width, height, focal, z_near, z_far, c=None, ndc=False):
+        """
+        Generate camera rays, see gen_rays
+        :return (B, H, W, 8)
+        """
+        cam_unproj_map = self.get_unproj_map(width, height, focal, c=c, device=poses.device)
+        return _rays_from_unproj(poses, cam_unproj_map, width, height, focal, z_near, z_far, ndc)
+
+
 def trans_t(t):
     return torch.tensor(
         [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, t], [0, 0, 0, 1],], dtype=torch.float32,
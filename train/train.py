@@ -11,7 +11,7 @@ sys.path.insert(
 import warnings
 import trainlib
 from model import make_model, loss
-from render import NeRFRenderer
+from render import NeRFRenderer, render_multi
 from data import get_split_dataset
 import util
 import numpy as np
@@ -85,57 +85,61 @@ def extra_args(parser):
         default=100000,
         help="Step to stop using bbox sampling",
     )
+    parser.add_argument(
+        "--shared_forward",
+        action="store_true",
+        default=None,
+        help="Compute encode + renders once per step and reuse them for the discriminator and generator updates",
+    )
     parser.add_argument(
         "--fixed_test",
         action="store_true",
         default=None,
         help="Freeze encoder weights and only train MLP",
     )
+    parser.add_argument(
+        "--dist_backend",
+        type=str,
+        default=None,
+        choices=["nccl", "gloo"],
+        help="Process group backend when launched with torchrun (default: nccl on CUDA, else gloo)",
+    )
+    parser.add_argument(
+        "--time_stages",
+        action="store_true",
+        default=None,
+        help="Log per-stage wall time of each step (time/* in tensorboard); syncs CUDA",
+    )
+    parser.add_argument(
+        "--profile",
+        type=int,
+        default=0,
+        help="Capture this many steps with torch.profiler into <logs>/<name>/profile (0 = off)",
+    )
+    parser.add_argument(
+        "--profile_wait",
+        type=int,
+        default=5,
+        help="Steps to skip before profiling",
+    )
     return parser
 
 
-args, conf = util.args.parse_args(extra_args, training=True, default_ray_batch_size=128)
-device = util.get_cuda(args.gpu_id[0])
-
-dset, val_dset, _ = get_split_dataset(args.dataset_format, args.datadir)
-print(
-    "dset z_near {}, z_far {}, lindisp {}".format(dset.z_near, dset.z_far, dset.lindisp)
-)
-
-# make_model: model에 대한 option. 
-net = make_model(conf["model"]).to(device=device)   # PixelNeRFNet
-
-
-
-# conf['renderer']
-# renderer {
-#     n_coarse = 64
-#     n_fine = 32
-#     # Try using expected depth sample
-#     n_fine_depth = 16
-#     # Noise to add to depth sample
-#     depth_std = 0.01
-#     # Decay schedule, not used
-#     sched = []
-#     # White background color (false : black)
-#     white_bkgd = True
-# }
-
-# Ours로 변경 예정!     # from_config: 모델 세팅 알려줌    
-renderer = NeRFRenderer.from_conf(conf["renderer"], lindisp=dset.lindisp,).to(
-    device=device       # NeRFRenderer -> renderer setting 
-)
-
-# Parallize         # net: pixelNeRF -> pixelNeRF를 
-render_par = renderer.bind_parallel(net, args.gpu_id).eval()   # -> _RenderWrapper를 선언함 -> 얘의 forward 함수가 class NeRFRenderer 실행하는거!
-# self까지도 속성받아버림!
-# renderer.bind_parallel -> _RenderWrapper(net, self, simple_output=simple_output)
-
-nviews = list(map(int, args.nviews.split()))        # 1. 
-
-
 class PixelNeRFTrainer(trainlib.Trainer):
-    def __init__(self):
+    def __init__(self, net, renderer, render_par, dset, val_dset, args, conf, device=None):
+        """
+        :param net PixelNeRFNet
+        :param renderer NeRFRenderer
+        :param render_par renderer.bind_parallel(net) wrapper
+        :param dset training dataset
+        :param val_dset test dataset
+        :param args parsed arguments (see extra_args)
+        :param conf full config (train subtree goes to trainlib.Trainer)
+        """
+        # Used when resuming in trainlib.Trainer.__init__ (load_extra_state)
+        self.renderer = renderer
+        self.render_par = render_par
+        self.nviews = list(map(int, args.nviews.split()))
         super().__init__(net, dset, val_dset, args, conf["train"], device=device)   # superclass에서의 init
         self.renderer_state_path = "%s/%s/_renderer" % (
             self.args.checkpoints_path,
@@ -153,17 +157,21 @@ class PixelNeRFTrainer(trainlib.Trainer):
             fine_loss_conf = conf["loss.rgb_fine"]
         self.rgb_fine_crit = loss.get_rgb_loss(fine_loss_conf, False)
 
-        if args.resume:
+        # Older runs without consolidated checkpoints
+        if self.args.resume and self.ckpt.latest() is None:
             if os.path.exists(self.renderer_state_path):
-                renderer.load_state_dict(
-                    torch.load(self.renderer_state_path, map_location=device), strict=False
+                self.renderer.load_state_dict(
+                    torch.load(self.renderer_state_path, map_location=self.device), strict=False
                 )
 
         self.z_near = dset.z_near       # 일단은 그냥 두기 
         self.z_far = dset.z_far
-        self.focal = torch.tensor([2.187719,]) * 10
-        self.c = torch.tensor([8.000000, 8.000000])
-        self.use_bbox = args.no_bbox_step > 0
+        # Rendered feature map size and its intrinsics (model.feat_size in the conf)
+        self.feat_size = self.net.feat_size
+        self.focal, self.c = util.feat_intrinsics(self.feat_size)
+        # focal, c and the feature resolution are fixed: cache the unprojection map
+        self.ray_gen = util.RayGenerator()
+        self.use_bbox = self.args.no_bbox_step > 0
         self.recon_loss = torch.nn.MSELoss()
         self.cam_loss = torch.nn.MSELoss()
         self.cycle_loss = torch.nn.MSELoss()
@@ -175,10 +183,52 @@ class PixelNeRFTrainer(trainlib.Trainer):
         return loss
 
     def post_batch(self, epoch, batch):
-        renderer.sched_step(args.batch_size)
-
-    def extra_save_state(self):
-        torch.save(renderer.state_dict(), self.renderer_state_path)
+        self.renderer.sched_step(self.args.batch_size)
+
+    def extra_state(self):
+        return {"renderer": self.renderer.state_dict()}
+
+    def load_extra_state(self, state):
+        if "renderer" in state:
+            self.renderer.load_state_dict(state["renderer"], strict=False)
+
+    def calc_gen_losses(self, fwd):
+        # neural renderer를 저 render par 프로세스 안에 넣기!
+        # discriminator가 swap을 지날 예정!
+        with self.timer("discriminator"):
+            d_fake = self.discriminator(fwd.rgb_swap)
+        with self.timer("encode"):
+            new_shape, new_appearance = self.net.encode(     # <- encode부분은 동일하게 가져오고, forward하는 부분 좀더 신경써서 가져오기!
+                fwd.rgb_cycle,
+                focal=self.focal.to(device=self.device),
+                c=self.c.to(device=self.device)
+            )   # encoder 결과로 self.rotmat, self.shape, self.appearance 예측됨  
+
+        new_rotmat = self.net.rotmat
+        cycle_loss = self.cycle_loss(fwd.rotmat, new_rotmat) + \
+                        self.cycle_loss(fwd.shape, new_shape) + \
+                            self.cycle_loss(fwd.appearance, new_appearance)          # 아니.. shape과 appearance를 disentangle 보장은 못하지만 camera는 확실히 잡을 수 있도록 돕는다.. 
+
+        rgb_loss = self.recon_loss(fwd.rgb_fake, fwd.all_images) # 아 오키. sampling된 points 갯수가 128개인가보군 
+        # net attribute으로 rotmat있는지 확인 + 예측했던 rotmat과 같은지 확인 
+        cam_loss = self.cam_loss(self.net.rotmat, fwd.all_poses) # 아 오키. sampling된 points 갯수가 128개인가보군 
+        gen_swap_loss = self.compute_bce(d_fake, 1)
+        loss_gen = rgb_loss * self.args.recon + cam_loss * self.args.cam + gen_swap_loss * self.args.swap + cycle_loss * self.args.cycle
+        return loss_gen, rgb_loss.item(), cam_loss.item(), gen_swap_loss.item(), cycle_loss.item()
+
+    def calc_disc_losses(self, fwd, detach=False):
+        """
+        :param detach if true, fakes are detached so that the discriminator
+        loss does not backprop into the generator
+        """
+        rgb_swap = fwd.rgb_swap.detach() if detach else fwd.rgb_swap
+        with self.timer("discriminator"):
+            d_fake = self.discriminator(rgb_swap)
+            d_real = self.discriminator(fwd.all_images)
+        disc_swap_loss = self.compute_bce(d_fake, 0)
+        disc_real_loss = self.compute_bce(d_real, 1)
+        loss_disc = (disc_swap_loss * self.args.swap + disc_real_loss * self.args.swap) / 2
+        return loss_disc, disc_swap_loss.item(), disc_real_loss.item()
 
     def calc_losses(self, data, is_train=True, global_step=0, mode=None):
         #######################################################################################
@@ -188,10 +238,10 @@ class PixelNeRFTrainer(trainlib.Trainer):
             # SB: number of batches 
             if "images" not in data:
                 return {}
-            all_images = data["images"].to(device=device)  # (B, 3, H, W)   # images: 128, 128
+            all_images = data["images"].to(device=self.device)  # (B, 3, H, W)   # images: 128, 128
 
             B, _, H, W = all_images.shape   
-            all_poses = data["poses"].to(device=device)  # (B, 4, 4)
+            all_poses = data["poses"].to(device=self.device)  # (B, 4, 4)
             all_focals = data["focal"]  # (B)      # 각 batch sample마다의 focal length가 존재함 
             all_c = data.get("c")  # (B, 2)       # 아이고.. 생각해보면 각 sample마다 f, c가 다를텐데.. <- 같다!
 
@@ -204,145 +254,99 @@ class PixelNeRFTrainer(trainlib.Trainer):
             )  # (B, H, W, 3)
 
             # feat-W, feat-H 받아야 함! 
-            feat_H = 16 # <- args로 조정 가능하도록!
-            feat_W = 16 # <- args로 조정 가능하도록!    # 아 오키 이거 volume renderer 세팅 따라가고, 다른 부분 있으면 giraffe 모듈 가져오기 
+            feat_H = feat_W = self.feat_size    # 아 오키 이거 volume renderer 세팅 따라가고, 다른 부분 있으면 giraffe 모듈 가져오기 
         
-            shape, appearance = net.encode(     # <- encode부분은 동일하게 가져오고, forward하는 부분 좀더 신경써서 가져오기!
-                all_images,
-                focal=self.focal.to(device=device),
-                c=self.c.to(device=device)
-            )   # encoder 결과로 self.rotmat, self.shape, self.appearance 예측됨 
-            rotmat = net.rotmat
+            with self.timer("encode"):
+                shape, appearance = self.net.encode(     # <- encode부분은 동일하게 가져오고, forward하는 부분 좀더 신경써서 가져오기!
+                    all_images,
+                    focal=self.focal.to(device=self.device),
+                    c=self.c.to(device=self.device)
+                )   # encoder 결과로 self.rotmat, self.shape, self.appearance 예측됨 
+            rotmat = self.net.rotmat
             
-            ################################################
-            ########################### for generated views 
-            cam_rays = util.gen_rays(       # 여기서의 W, H 사이즈는 output target feature image의 resolution이어야 함!
-                rotmat, feat_W, feat_H, self.focal, self.z_near, self.z_far, self.c       # poses에 해당하는 부분이 extrinsic으로 잘 반영되고 있음..!
-            )  # (NV, H, W, 8)
-            rays = cam_rays.view(B, -1, cam_rays.shape[-1]).to(device=device)      # (batch * num_ray * num_points, 8)
-
-            featmap = render_par(rays, want_weights=True, shape=shape, appearance=appearance, training=True) # <-outputs.toDict()의 결과 
-            rgb_fake = net.neural_renderer(featmap)
-
             ################################################
             ########################### for swapped views 
             swap_rot = rotmat.flip(0)
-            swap_cam_rays = util.gen_rays(       # 여기서의 W, H 사이즈는 output target feature image의 resolution이어야 함!
+            swap_cam_rays = self.ray_gen(       # 여기서의 W, H 사이즈는 output target feature image의 resolution이어야 함!
                 swap_rot.detach(), feat_W, feat_H, self.focal, self.z_near, self.z_far, self.c       # poses에 해당하는 부분이 extrinsic으로 잘 반영되고 있음..!
             )  # (NV, H, W, 8)
-            swap_rays = swap_cam_rays.view(B, -1, swap_cam_rays.shape[-1]).to(device=device)      # (batch * num_ray * num_points, 8)
-
-            swap_featmap = render_par(swap_rays, want_weights=True, shape=shape, appearance=appearance, training=True) # <-outputs.toDict()의 결과 
-            rgb_swap = net.neural_renderer(swap_featmap)
-
+            swap_rays = swap_cam_rays.view(B, -1, swap_cam_rays.shape[-1]).to(device=self.device)      # (batch * num_ray * num_points, 8)
+            passes = [(swap_rays, shape, appearance)]
+
+            if mode == 'generator' or mode == 'shared':
+                ################################################
+                ########################### for generated views 
+                cam_rays = self.ray_gen(       # 여기서의 W, H 사이즈는 output target feature image의 resolution이어야 함!
+                    rotmat, feat_W, feat_H, self.focal, self.z_near, self.z_far, self.c       # poses에 해당하는 부분이 extrinsic으로 잘 반영되고 있음..!
+                )  # (NV, H, W, 8)
+                rays = cam_rays.view(B, -1, cam_rays.shape[-1]).to(device=self.device)      # (batch * num_ray * num_points, 8)
 
-            # neural renderer를 저 render par 프로세스 안에 넣기!
-            # discriminator가 swap을 지날 예정!
-            d_fake = self.discriminator(rgb_swap)
-            loss_dict = {}
-            if mode == 'generator':
                 ######## for cycle appearance 
                 cycle_appearance = appearance.flip(0)
-                cycle_featmap = render_par(rays, want_weights=True,  shape=shape, appearance=cycle_appearance, training=True,) # <-outputs.toDict()의 결과 
-                rgb_cycle = net.neural_renderer(cycle_featmap)
-
-                new_shape, new_appearance = net.encode(     # <- encode부분은 동일하게 가져오고, forward하는 부분 좀더 신경써서 가져오기!
-                    rgb_cycle,
-                    focal=self.focal.to(device=device),
-                    c=self.c.to(device=device)
-                )   # encoder 결과로 self.rotmat, self.shape, self.appearance 예측됨  
-
-                new_rotmat = net.rotmat
-                cycle_loss = self.cycle_loss(rotmat, new_rotmat) + \
-                                self.cycle_loss(shape, new_shape) + \
-                                    self.cycle_loss(appearance, new_appearance)          # 아니.. shape과 appearance를 disentangle 보장은 못하지만 camera는 확실히 잡을 수 있도록 돕는다.. 
-
-                rgb_loss = self.recon_loss(rgb_fake, all_images) # 아 오키. sampling된 points 갯수가 128개인가보군 
-                # net attribute으로 rotmat있는지 확인 + 예측했던 rotmat과 같은지 확인 
-                cam_loss = self.cam_loss(net.rotmat, all_poses) # 아 오키. sampling된 points 갯수가 128개인가보군 
-                gen_swap_loss = self.compute_bce(d_fake, 1)
-                loss_gen = rgb_loss * args.recon + cam_loss * args.cam + gen_swap_loss * args.swap + cycle_loss * args.cycle
-                return loss_gen, rgb_loss.item(), cam_loss.item(), gen_swap_loss.item(), cycle_loss.item()
+                passes = [(rays, shape, appearance)] + passes + [(rays, shape, cycle_appearance)]
+
+            # All passes share one encode: render them as a single superbatch
+            rgb_outs = render_multi(
+                self.render_par, passes, self.net.neural_renderer, want_weights=True, training=True, timer=self.timer
+            )
+            fwd = DotMap(all_images=all_images, all_poses=all_poses, rotmat=rotmat, shape=shape, appearance=appearance)
+            if mode == 'discriminator':
+                fwd.rgb_swap, = rgb_outs
+            else:
+                fwd.rgb_fake, fwd.rgb_swap, fwd.rgb_cycle = rgb_outs
 
+            if mode == 'generator':
+                return self.calc_gen_losses(fwd)
             elif mode =='discriminator':
-                d_real = self.discriminator(all_images)
-                disc_swap_loss = self.compute_bce(d_fake, 0)
-                disc_real_loss = self.compute_bce(d_real, 1)
-                loss_disc = (disc_swap_loss * args.swap + disc_real_loss * args.swap) / 2
-                return loss_disc, disc_swap_loss.item(), disc_real_loss.item()
+                return self.calc_disc_losses(fwd)
+            elif mode == 'shared':
+                # Forward shared by both updates, see train_step
+                return fwd
             else:
                 pass
         else:
             # SB: number of batches 
             if "images" not in data:
                 return {}
-            all_images = data["images"].to(device=device)  # (SB, NV, 3, H, W)
-            all_poses = data["poses"].to(device=device)
+            all_images = data["images"].to(device=self.device)  # (SB, NV, 3, H, W)
+            all_poses = data["poses"].to(device=self.device)
             
             SB, NV, _, H, W = all_images.shape      # SB: number of obj, NV: number of view     -> 4, 50, 3, 128, 128
             all_focals = data["focal"]  # (SB)      # 각 batch sample마다의 focal length가 존재함 
             all_c = data.get("c")  # (SB)
 
-            if self.use_bbox and global_step >= args.no_bbox_step:
+            if self.use_bbox and global_step >= self.args.no_bbox_step:
                 self.use_bbox = False
                 print(">>> Stopped using bbox sampling @ iter", global_step)
 
-            all_rgb_gt = []
-            all_rays = []
+            curr_nviews = self.nviews[torch.randint(0, len(self.nviews), ()).item()]
 
-            curr_nviews = nviews[torch.randint(0, len(nviews), ()).item()]
+            val_num = 5
+            ##### 여기서는 RGB sampling하는 과정은 아예 빼고, extrinsic을 통한 camera ray를 가져올 것 pix_inds는 필요없음 
+            # 모든 object에 대해 한번에 val_num개의 view 뽑기 (전체 251개의 view 중 5개)
+            indices = torch.randint(0, NV, (SB, val_num), device=self.device)
             if curr_nviews == 1:       # (0,) 을 batch size만큼 만들어준다!
                 image_ord = torch.randint(0, NV, (SB, 1))   # ours -> 계속 nviews=1일 예정! 
             else: # Pass
-                image_ord = torch.empty((SB, curr_nviews), dtype=torch.long)
-
-            val_num = 5
-            ##### object마다의 Process 
-            ##### 여기서는 RGB sampling하는 과정은 아예 빼고, extrinsic을 통한 camera ray를 가져올 것 pix_inds는 필요없음 
-            for obj_idx in range(SB):       # batch 안의 index마다 pose가 다르기 때문!      # SB: 4     # meshgrid만 괜찮다면 batch 연산으로 큼지막하게 한번 가도 괜찮을듯 
-                # batch size는 작은 편, 각 sample에 대해서 처리함 
-                # 이거 자체가 하나의 batch로서 기능함 
-                # 너무 메모리가 커서 조금 샘플링 해야할 것 같기도.. 
-                indices = torch.randint(0, NV, (val_num,))      # (전체 251개의 view 중 5개 뽑기!)
-
-                # 딱 5개만 뽑아냄!
-                images = all_images[obj_idx][indices]  # (NV, 3, H, W)       # (50, 3, 128, 128)
-                poses = all_poses[obj_idx][indices]  # (NV, 4, 4)            # (50, 4, 4)        # <- multi-view rotation
-                
-                focal = self.focal
-                c = self.c
-                if curr_nviews > 1: # Pass
-                    # Somewhat inefficient, don't know better way
-                    image_ord[obj_idx] = torch.from_numpy(          # 배치 안의 한 샘플에 대해 5개 중에 하나 뽑기!
-                        np.random.choice(indices, curr_nviews, replace=False)       # 0부터 4중에 하나 고르기!  <- 각 batch마다 어떤 view에서 source image를 가져올지 결정!
-                    )       # ex. image_ord[0] = 2 -> 0번째 샘플의 obj index는 2
-                images_0to1 = images * 0.5 + 0.5
-
-                feat_H, feat_W = 16, 16
-                # ㅇㅇ 다 넣고 봐도 될 듯. 어차피 feature field에 대해서 보는거라! 
-                cam_rays = util.gen_rays(       # 여기서의 W, H 사이즈는 output target feature image의 resolution이어야 함!
-                    poses, feat_W, feat_H, focal, self.z_near, self.z_far, c=c        # poses에 해당하는 부분이 extrinsic으로 잘 반영되고 있음..!
-                )  # (NV, H, W, 8)
-                rgb_gt_all = images_0to1        # image는 encoder에 들어가는 그대로 넣어주면 됨
-                rgb_gt_all = (
-                    rgb_gt_all.permute(0, 2, 3, 1).contiguous().reshape(-1, 3)
-                )  # (NV * H * W, 3)
-
-                # 여기선 Ray sampling을 해서 pix_inds를 얻어내려고 하는데, 우리는 Feature map을 보고 하기 때문에 
-                # pix_inds로 인덱싱해줄 대상이 없음. 그냥 이거 자체를 없애도 됨. 
-                rgb_gt = rgb_gt_all  # (ray_batch_size, 3)
-                rays = cam_rays.view(-1, cam_rays.shape[-1]).to(
-                    device=device       # 그냥 어떤 resolution에 대해 생성하기 때문..
-                )  # (ray_batch_size, 8)
+                # 각 object마다 뽑은 val_num개 중에서 curr_nviews개를 중복없이 source로 고르기
+                sel = torch.rand(SB, val_num, device=self.device).argsort(dim=-1)[:, :curr_nviews]
+                image_ord = torch.gather(indices, 1, sel)
 
-                all_rgb_gt.append(rgb_gt)
-                all_rays.append(rays)
+            images = util.batched_index_select_nd(all_images, indices)  # (SB, val_num, 3, H, W)
+            poses = util.batched_index_select_nd(all_poses, indices)  # (SB, val_num, 4, 4)     # <- multi-view rotation
 
+            feat_H = feat_W = self.feat_size
+            # ㅇㅇ 다 넣고 봐도 될 듯. 어차피 feature field에 대해서 보는거라! 
+            cam_rays = self.ray_gen(       # 여기서의 W, H 사이즈는 output target feature image의 resolution이어야 함!
+                poses.reshape(-1, 4, 4), feat_W, feat_H, self.focal, self.z_near, self.z_far, c=self.c
+            )  # (SB * val_num, H, W, 8)
+            all_rays = cam_rays.view(SB, -1, cam_rays.shape[-1])  # (SB, 5*ray_batch_size, 8)
 
-            all_rgb_gt = torch.stack(all_rgb_gt)  # (SB, 5*ray_batch_size, 3)     # 5장의 이미지
-            all_rays = torch.stack(all_rays)  # (SB, 5*ray_batch_size, 8)
+            # image는 encoder에 들어가는 그대로 넣어주면 됨
+            images_0to1 = images * 0.5 + 0.5
+            all_rgb_gt = images_0to1.permute(0, 1, 3, 4, 2).reshape(SB, -1, 3)  # (SB, 5*ray_batch_size, 3)     # 5장의 이미지
 
-            image_ord = image_ord.to(device)    #  single-view이기 때문에 어차피 0으로 전부 indexing 되어있음 
+            image_ord = image_ord.to(self.device)    #  single-view이기 때문에 어차피 0으로 전부 indexing 되어있음 
             src_images = util.batched_index_select_nd(      # NS: number of samples 
                 all_images, image_ord # 모든 이미지에 대해 랜덤하게 뽑은 source image를 가져오게 됨 
             )  # (SB, NS, 3, H, W) <- NV에서 NS로 바뀜 -> index_select_nd에 따라서 결정됨! <- ㅇㅋ 인정 어차피 한 obj 안에 50개 있으니까 
@@ -358,27 +362,27 @@ class PixelNeRFTrainer(trainlib.Trainer):
 
             # remove 
             ############### NeRF encoding하는 부분!!!!!!!!
-            shape, appearance = net.encode(
+            shape, appearance = self.net.encode(
                 src_images,      # batch, 1, 3, 128, 128
-                focal=self.focal.to(device=device),   # batch
-                c=self.c.to(device=device) if all_c is not None else None,
+                focal=self.focal.to(device=self.device),   # batch
+                c=self.c.to(device=self.device) if all_c is not None else None,
             )
 
             # 하나의 source image에 대해 5개의 feature output을 만듦 -> 전체 sample에 대해서!
             # all_rays: ((SB, ray_batch_size, 8)) <- NV images에서의 전체 rays에 SB만큼을!
-            feat_out = render_par(all_rays, val_num=val_num, want_weights=True, shape=shape, appearance=appearance, training=False) # models.py의 forward 함수를 볼 것 
+            feat_out = self.render_par(all_rays, val_num=val_num, want_weights=True, shape=shape, appearance=appearance, training=False) # models.py의 forward 함수를 볼 것 
             # render par 함수 밑으로 전부 giraffe renderer로 바꾸기 
-            test_out = net.neural_renderer(feat_out)          
+            test_out = self.net.neural_renderer(feat_out)          
 
             # test out 있는 여기에 self.neural_renderer 놓기 
             loss_dict = {}
             test_out_pred = test_out.reshape(SB, -1, 3)
 
             rgb_loss = self.recon_loss(test_out_pred, all_rgb_gt)
-            cam_loss = self.cam_loss(net.rotmat, src_poses)
+            cam_loss = self.cam_loss(self.net.rotmat, src_poses)
 
-            loss_dict["rc"] = rgb_loss.item() * args.recon
-            loss_dict["cam"] = cam_loss.item() * args.cam
+            loss_dict["rc"] = rgb_loss.item() * self.args.recon
+            loss_dict["cam"] = cam_loss.item() * self.args.cam
             loss = rgb_loss
             loss_dict["t"] = loss.item()
 
@@ -388,16 +392,48 @@ class PixelNeRFTrainer(trainlib.Trainer):
     def train_step(self, data, global_step):
         # discriminator가 먼저 update 
         dict_ = {}
-        disc_loss, disc_swap, disc_real = self.calc_losses(data, is_train=True, global_step=global_step, mode='discriminator')
-        disc_loss.backward()
-        self.optim_d.step()
-        self.optim_d.zero_grad()        
+        with util.autocast(self.device, self.args.amp):
+            if self.args.shared_forward:
+                # Encode and render once; the discriminator sees detached fakes
+                # and the generator keeps the graph for its own backward
+                fwd = self.calc_losses(data, is_train=True, global_step=global_step, mode='shared')
+                self.optim_d.zero_grad()
+                disc_loss, disc_swap, disc_real = self.calc_disc_losses(fwd, detach=True)
+            else:
+                disc_loss, disc_swap, disc_real = self.calc_losses(data, is_train=True, global_step=global_step, mode='discriminator')
+        # Scalers are no-ops unless --amp fp16. Each loss also backprops into
+        # the other model, and those leftover gradients are added to its next
+        # update (as in fp32); under fp16 they are moved to the loss scale of
+        # that update's backward, and kept unscaled in between
+        loss_scaling = self.scaler.is_enabled()
+        if loss_scaling:
+            self.rescale_grads(self.discriminator, self.scaler_d.get_scale())
+        with self.timer("backward"):
+            self.scaler_d.scale(disc_loss).backward()
+            self.sync_grads(self.discriminator)
+        with self.timer("optimizer"):
+            if loss_scaling:
+                self.rescale_grads(self.net, self.scaler.get_scale() / self.scaler_d.get_scale())
+            self.scaler_d.step(self.optim_d)
+            self.scaler_d.update()
+            self.optim_d.zero_grad()        
 
         # generator 그다음에 update 
-        gen_loss, gen_rgb, gen_cam, gen_swap, gen_cycle = self.calc_losses(data, is_train=True, global_step=global_step, mode='generator')
-        gen_loss.backward()
-        self.optim.step()
-        self.optim.zero_grad() 
+        with util.autocast(self.device, self.args.amp):
+            if self.args.shared_forward:
+                gen_loss, gen_rgb, gen_cam, gen_swap, gen_cycle = self.calc_gen_losses(fwd)
+                fwd = None
+            else:
+                gen_loss, gen_rgb, gen_cam, gen_swap, gen_cycle = self.calc_losses(data, is_train=True, global_step=global_step, mode='generator')
+        with self.timer("backward"):
+            self.scaler.scale(gen_loss).backward()
+            self.sync_grads(self.net)
+        with self.timer("optimizer"):
+            if loss_scaling:
+                self.rescale_grads(self.discriminator, 1.0 / self.scaler.get_scale())
+            self.scaler.step(self.optim)
+            self.scaler.update()
+            self.optim.zero_grad() 
 
         dict_['disc_loss'] = round(disc_loss.item(), 3)
         dict_['disc_swap'] = round(disc_swap, 3)
@@ -412,9 +448,10 @@ class PixelNeRFTrainer(trainlib.Trainer):
         return dict_
 
     def eval_step(self, data, global_step):
-        renderer.eval()
-        losses = self.calc_losses(data, is_train=False, global_step=global_step)
-        renderer.train()
+        self.renderer.eval()
+        with util.autocast(self.device, self.args.amp):
+            losses = self.calc_losses(data, is_train=False, global_step=global_step)
+        self.renderer.train()
         return losses
 
 
@@ -436,18 +473,18 @@ class PixelNeRFTrainer(trainlib.Trainer):
 
         for batch_idx in range(len(batch_indices)):
             # 16개 batch objects 중에 하나의 batch index를 
-            images = data["images"][batch_idx].to(device=device)  # (NV, 3, H, W)
-            poses = data["poses"][batch_idx].to(device=device)  # (NV, 4, 4)
+            images = data["images"][batch_idx].to(device=self.device)  # (NV, 3, H, W)
+            poses = data["poses"][batch_idx].to(device=self.device)  # (NV, 4, 4)
 
             # for swapped appearance # appearance target 
-            images_cycle = data["images"][batch_idx+1].to(device=device)  # (NV, 3, H, W)
-            poses_cycle = data["poses"][batch_idx].to(device=device)  # (NV, 4, 4)
+            images_cycle = data["images"][batch_idx+1].to(device=self.device)  # (NV, 3, H, W)
+            poses_cycle = data["poses"][batch_idx].to(device=self.device)  # (NV, 4, 4)
 
             focal = self.focal  # (1)
             c = self.c
-            feat_H, feat_W = 16, 16
+            feat_H = feat_W = self.feat_size
             NV, _, H, W = images.shape
-            cam_rays = util.gen_rays(   # (251개의 poses에 대해서 만듦..)
+            cam_rays = self.ray_gen(   # (251개의 poses에 대해서 만듦..)
                 poses, feat_W, feat_H, focal, self.z_near, self.z_far, c=c      # (251, 16, 16, 8)
             )  # (NV, H, W, 8)
             images_0to1 = images * 0.5 + 0.5  # (NV, 3, H, W)       # (251, 3, 128, 128)
@@ -455,7 +492,7 @@ class PixelNeRFTrainer(trainlib.Trainer):
             val_num = 3
 
             # curr_nviews를 4개로 잡아볼까
-            curr_nviews = nviews[torch.randint(0, len(nviews), (1,)).item()]        # curr_nviews = 1
+            curr_nviews = self.nviews[torch.randint(0, len(self.nviews), (1,)).item()]        # curr_nviews = 1
             views_src = np.sort(np.random.choice(NV, curr_nviews, replace=False))   # NV: 251 -> ex.views_src: 여러 이미지들 나오는디요 시발
             view_dests = np.random.randint(0, NV - curr_nviews, val_num)  # ex. 63
             for vs in range(curr_nviews):
@@ -463,7 +500,7 @@ class PixelNeRFTrainer(trainlib.Trainer):
             views_src = torch.from_numpy(views_src)
 
             # set renderer net to eval mode
-            renderer.eval()     # <- encoder는 왜 eval() 아니지         # renderer의 parameter 찾고 여기에 2DCNN 포함되는지 확인!
+            self.renderer.eval()     # <- encoder는 왜 eval() 아니지         # renderer의 parameter 찾고 여기에 2DCNN 포함되는지 확인!
             source_views = (
                 images_0to1[views_src].repeat(val_num, 1, 1, 1)
                 .permute(0, 2, 3, 1)
@@ -481,22 +518,22 @@ class PixelNeRFTrainer(trainlib.Trainer):
                 test_images_dest = images[view_dests] # -> # -> (val_num, 3, 128, 128)
 
                 ##### for reconstructed views 
-                shape, appearance = net.encode(
+                shape, appearance = self.net.encode(
                     test_images_src,  # (val_num, 3, 128, 128) 
                     poses[views_src].repeat(val_num, 1, 1),  # (val_num, 4, 4)
-                    focal=self.focal.to(device=device),   
-                    c=self.c.to(device=device),
+                    focal=self.focal.to(device=self.device),   
+                    c=self.c.to(device=self.device),
                 )
 
                 test_rays_dest = test_rays_dest.reshape(val_num, feat_H * feat_W, -1)   # -> (1, 16*16, 8)
                 test_rays_src = test_rays_src.reshape(val_num, feat_H * feat_W, -1)   # -> (1, 16*16, 8)
                                     # test_rays: 1, 16x16, 8
 
-                feat_test_dest = render_par(test_rays_dest, val_num = 1, want_weights=True, shape=shape, appearance=appearance)   # -> (1, 16*16, 8)
-                out_dest = net.neural_renderer(feat_test_dest)
+                feat_test_dest = self.render_par(test_rays_dest, val_num = 1, want_weights=True, shape=shape, appearance=appearance)   # -> (1, 16*16, 8)
+                out_dest = self.net.neural_renderer(feat_test_dest)
 
-                feat_test_src = render_par(test_rays_src, val_num = 1, want_weights=True, shape=shape, appearance=appearance,)   # -> (1, 16*16, 8)
-                out_src = net.neural_renderer(feat_test_src)
+                feat_test_src = self.render_par(test_rays_src, val_num = 1, want_weights=True, shape=shape, appearance=appearance,)   # -> (1, 16*16, 8)
+                out_src = self.net.neural_renderer(feat_test_src)
 
                 rgb_psnr = out_dest.cpu().numpy().reshape(val_num, H, W, 3)
 
@@ -516,24 +553,24 @@ class PixelNeRFTrainer(trainlib.Trainer):
 
         import pdb 
         pdb.set_trace()        
-        feat_test_dest = render_par(test_rays_dest_list[0], val_num = 1, want_weights=True, shape=shape_list[0], appearance=appearance_list[-1])   # -> (1, 16*16, 8)
-        out_dest_1 = net.neural_renderer(feat_test_dest)
+        feat_test_dest = self.render_par(test_rays_dest_list[0], val_num = 1, want_weights=True, shape=shape_list[0], appearance=appearance_list[-1])   # -> (1, 16*16, 8)
+        out_dest_1 = self.net.neural_renderer(feat_test_dest)
 
-        feat_test_src = render_par(test_rays_src_list[0], val_num = 1, want_weights=True, shape=shape_list[0], appearance=appearance_list[-1])   # -> (1, 16*16, 8)
-        out_src_1 = net.neural_renderer(feat_test_src)
+        feat_test_src = self.render_par(test_rays_src_list[0], val_num = 1, want_weights=True, shape=shape_list[0], appearance=appearance_list[-1])   # -> (1, 16*16, 8)
+        out_src_1 = self.net.neural_renderer(feat_test_src)
 
-        feat_test_dest = render_par(test_rays_dest_list[-1], val_num = 1, want_weights=True, shape=shape_list[-1], appearance=appearance_list[0])   # -> (1, 16*16, 8)
-        out_dest_2 = net.neural_renderer(feat_test_dest)
+        feat_test_dest = self.render_par(test_rays_dest_list[-1], val_num = 1, want_weights=True, shape=shape_list[-1], appearance=appearance_list[0])   # -> (1, 16*16, 8)
+        out_dest_2 = self.net.neural_renderer(feat_test_dest)
 
-        feat_test_src = render_par(test_rays_src_list[-1], val_num = 1, want_weights=True, shape=shape_list[-1], appearance=appearance_list[0])   # -> (1, 16*16, 8)
-        out_src_2 = net.neural_renderer(feat_test_src)
+        feat_test_src = self.render_par(test_rays_src_list[-1], val_num = 1, want_weights=True, shape=shape_list[-1], appearance=appearance_list[0])   # -> (1, 16*16, 8)
+        out_src_2 = self.net.neural_renderer(feat_test_src)
 
         cat = torch.cat((out_src_1[[0]], out_dest_1.reshape(-1, 3, H, W), out_src_2[[0]].clamp_(0., 1.), out_dest_2.reshape(-1, 3, H, W).clamp_(0., 1.)), dim=0)
         cat_list.append(cat)
         
         cat_new = torch.cat(cat_list, dim=0)
         image_grid = make_grid(cat_new, nrow=len(cat))  # row에 들어갈 image 갯수
-        save_image(image_grid, f'visuals/{args.name}/{epoch}_{batch}_out.jpg')
+        save_image(image_grid, f'visuals/{self.args.name}/{epoch}_{batch}_out.jpg')
 
 
         # source views, gt, test_out
@@ -541,7 +578,7 @@ class PixelNeRFTrainer(trainlib.Trainer):
         # cat = torch.cat((test_images_src[[0]], test_images_dest.reshape(-1, 3, H, W), out_src[[0]].clamp_(0., 1.), out_dest.reshape(-1, 3, H, W).clamp_(0., 1.)), dim=0)
         # cat_cycle = torch.cat((test_images_src[[0]], test_images_dest.reshape(-1, 3, H, W), out_src[[0]].clamp_(0., 1.), out_dest.reshape(-1, 3, H, W).clamp_(0., 1.)), dim=0)
         # image_grid = make_grid(cat, nrow=len(cat))  # row에 들어갈 image 갯수
-        # save_image(image_grid, f'visuals/{args.name}/{epoch}_{batch}_out.jpg')
+        # save_image(image_grid, f'visuals/{self.args.name}/{epoch}_{batch}_out.jpg')
 
         # for vals calculation 
         psnr_total = 0
@@ -554,9 +591,52 @@ class PixelNeRFTrainer(trainlib.Trainer):
         print("psnr", psnr)
 
         # set the renderer network back to train mode
-        renderer.train()
+        self.renderer.train()
         return None, vals
 
 
-trainer = PixelNeRFTrainer()
-trainer.start()
+if __name__ == "__main__":
+    args, conf = util.args.parse_args(extra_args, training=True, default_ray_batch_size=128)
+    # Launched with torchrun: one process (and GPU) per rank
+    rank, world_size, local_rank = util.distributed.init(args.dist_backend)
+    if world_size > 1:
+        args.gpu_id = [local_rank]
+    device = util.get_cuda(args.gpu_id[0])
+
+    dset, val_dset, _ = get_split_dataset(args.dataset_format, args.datadir)
+    print(
+        "dset z_near {}, z_far {}, lindisp {}".format(dset.z_near, dset.z_far, dset.lindisp)
+    )
+
+    # make_model: model에 대한 option. 
+    net = make_model(conf["model"]).to(device=device)   # PixelNeRFNet
+
+
+
+    # conf['renderer']
+    # renderer {
+    #     n_coarse = 64
+    #     n_fine = 32
+    #     # Try using expected depth sample
+    #     n_fine_depth = 16
+    #     # Noise to add to depth sample
+    #     depth_std = 0.01
+    #     # Decay schedule, not used
+    #     sched = []
+    #     # White background color (false : black)
+    #     white_bkgd = True
+    # }
+
+    # Ours로 변경 예정!     # from_config: 모델 세팅 알려줌    
+    renderer = NeRFRenderer.from_conf(conf["renderer"], lindisp=dset.lindisp,).to(
+        device=device       # NeRFRenderer -> renderer setting 
+    )
+
+    # Parallize         # net: pixelNeRF -> pixelNeRF를 
+    render_par = renderer.bind_parallel(net, args.gpu_id).eval()   # -> _RenderWrapper를 선언함 -> 얘의 forward 함수가 class NeRFRenderer 실행하는거!
+    # self까지도 속성받아버림!
+    # renderer.bind_parallel -> _RenderWrapper(net, self, simple_output=simple_output)
+
+    trainer = PixelNeRFTrainer(net, renderer, render_par, dset, val_dset, args, conf, device=device)
+    trainer.start()
+    util.distributed.destroy()
@@ -113,7 +113,8 @@ class PixelNeRFTrainer(trainlib.Trainer):
             fine_loss_conf = conf["loss.rgb_fine"]
         self.rgb_fine_crit = loss.get_rgb_loss(fine_loss_conf, False)
 
-        if args.resume:
+        # Older runs without consolidated checkpoints
+        if args.resume and self.ckpt.latest() is None:
             if os.path.exists(self.renderer_state_path):
                 renderer.load_state_dict(
                     torch.load(self.renderer_state_path, map_location=device)
@@ -127,8 +128,12 @@ class PixelNeRFTrainer(trainlib.Trainer):
     def post_batch(self, epoch, batch):
         renderer.sched_step(args.batch_size)
 
-    def extra_save_state(self):
-        torch.save(renderer.state_dict(), self.renderer_state_path)
+    def extra_state(self):
+        return {"renderer": renderer.state_dict()}
+
+    def load_extra_state(self, state):
+        if "renderer" in state:
+            renderer.load_state_dict(state["renderer"], strict=False)
 
     def calc_losses(self, data, is_train=True, global_step=0):
         #######################################################################################
@@ -11,6 +11,8 @@ sys.path.insert(
     0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
 )
 from model import DCDiscriminator
+from data import ObjectBatchSampler, DevicePrefetcher
+from util import CheckpointManager, StageTimer, distributed
 
 class Trainer:
     def __init__(self, net, train_dataset, test_dataset, args, conf, device=None):
@@ -20,19 +22,61 @@ class Trainer:
         self.test_dataset = test_dataset
         self.discriminator = DCDiscriminator().to(device)       # <- 편의상 default 값으로 다 가져오기 
 
-        self.train_data_loader = torch.utils.data.DataLoader(
-            train_dataset,
-            batch_size=args.batch_size,
-            shuffle=True,
-            num_workers=8,
-            pin_memory=False,
+        # Loader workers stay alive across epochs; batches are pinned and
+        # copied to the device prefetch_depth steps ahead (DevicePrefetcher)
+        self.device = device
+        self.num_workers = conf.get_int("num_workers", 8)
+        self.prefetch_depth = conf.get_int("prefetch_depth", 2)
+        loader_kwargs = dict(
+            num_workers=self.num_workers,
+            pin_memory=device is not None and torch.device(device).type == "cuda",
+            persistent_workers=self.num_workers > 0,
         )
+
+        # Data parallel over processes (util.distributed): each rank trains on
+        # its own share of the data with batch_size per rank, gradients are
+        # averaged before each optimizer step, rank 0 logs and checkpoints
+        self.rank = distributed.get_rank()
+        self.world_size = distributed.get_world_size()
+        self.is_main = self.rank == 0
+
+        # Object-major batches of views_per_object views per object, 0 = disable
+        self.views_per_object = conf.get_int("views_per_object", 0)
+        if self.views_per_object > 0:
+            assert args.batch_size % self.views_per_object == 0
+            self.train_sampler = ObjectBatchSampler(
+                train_dataset.obj_view_indices,
+                args.batch_size // self.views_per_object,
+                self.views_per_object,
+                num_replicas=self.world_size,
+                rank=self.rank,
+            )
+            self.train_data_loader = torch.utils.data.DataLoader(
+                train_dataset, batch_sampler=self.train_sampler, **loader_kwargs
+            )
+        elif self.world_size > 1:
+            self.train_sampler = torch.utils.data.DistributedSampler(
+                train_dataset, num_replicas=self.world_size, rank=self.rank, shuffle=True
+            )
+            self.train_data_loader = torch.utils.data.DataLoader(
+                train_dataset,
+                batch_size=args.batch_size,
+                sampler=self.train_sampler,
+                drop_last=True,
+                **loader_kwargs
+            )
+        else:
+            self.train_sampler = None
+            self.train_data_loader = torch.utils.data.DataLoader(
+                train_dataset, batch_size=args.batch_size, shuffle=True, **loader_kwargs
+            )
         self.test_data_loader = torch.utils.data.DataLoader(
             test_dataset,
             batch_size=min(args.batch_size, 16),
             shuffle=True,
-            num_workers=4,
-            pin_memory=False,
+            num_workers=min(self.num_workers, 4),
+            pin_memory=loader_kwargs["pin_memory"],
+            persistent_workers=self.num_workers > 0,
         )
 
         self.num_total_batches = len(self.train_dataset)
@@ -45,10 +89,20 @@ class Trainer:
         self.num_epochs = args.epochs
         self.accu_grad = conf.get_int("accu_grad", 1)
         self.summary_path = os.path.join(args.logs_path, args.name)
-        self.writer = SummaryWriter(self.summary_path)
+        self.writer = SummaryWriter(self.summary_path) if self.is_main else None
 
         self.fixed_test = hasattr(args, "fixed_test") and args.fixed_test
 
+        # Optional torch.profiler capture of profile steps after profile_wait
+        # steps; stage times (time/* in tensorboard) are logged when profiling
+        # or with time_stages. Subclasses time their stages with self.timer
+        self.profile_steps = getattr(args, "profile", 0)
+        self.profile_wait = getattr(args, "profile_wait", 5)
+        self.timer = StageTimer(
+            enabled=bool(getattr(args, "time_stages", False)) or self.profile_steps > 0,
+            device=device,
+        )
+
         os.makedirs(self.summary_path, exist_ok=True)
 
         # net만: 208
@@ -59,6 +113,12 @@ class Trainer:
         self.optim = torch.optim.Adam(net.parameters(), lr=args.lr)
         self.optim_d = torch.optim.Adam(self.discriminator.parameters(), lr=args.lr * args.disc_lr)
 
+        # Mixed precision (util.autocast): fp16 needs loss scaling, one scaler
+        # per optimizer since the generator and discriminator step separately
+        self.amp = getattr(args, "amp", "none")
+        self.scaler = torch.cuda.amp.GradScaler(enabled=self.amp == "fp16")
+        self.scaler_d = torch.cuda.amp.GradScaler(enabled=self.amp == "fp16")
+
         if args.gamma != 1.0:
             self.lr_scheduler = torch.optim.lr_scheduler.ExponentialLR(
                 optimizer=self.optim, gamma=args.gamma
@@ -94,69 +154,177 @@ class Trainer:
             self.args.checkpoints_path,
             self.args.name,
         )
+        self.scaler_state_path = "%s/%s/_scaler" % (
+            self.args.checkpoints_path,
+            self.args.name,
+        )
         self.default_net_state_path = "%s/%s/net" % (
             self.args.checkpoints_path,
             self.args.name,
         )
+        # All training state in one file per save, written in the background
+        self.ckpt = CheckpointManager(
+            "%s/%s/ckpt" % (self.args.checkpoints_path, self.args.name),
+            keep_last=conf.get_int("keep_checkpoints", 3),
+        )
         self.start_iter_id = 0
         if args.resume:
-            # TODO: backup!!
-            if os.path.exists(self.optim_state_path):
-                try:
-                    self.optim.load_state_dict(
-                        torch.load(self.optim_state_path, map_location=device)
-                    )
-                except:
-                    warnings.warn(
-                        "Failed to load optimizer state at", self.optim_state_path
-                    )
-            if os.path.exists(self.optim_d_state_path):
-                try:
-                    self.optim_d.load_state_dict(
-                        torch.load(self.optim_d_state_path, map_location=device)
-                    )
-                except:
-                    warnings.warn(
-                        "Failed to load optimizer state at", self.optim_d_state_path
-                    )
-            if self.lr_scheduler is not None and os.path.exists(
-                self.lrsched_state_path
-            ):
-                self.lr_scheduler.load_state_dict(
-                    torch.load(self.lrsched_state_path, map_location=device)
-                )
-            if os.path.exists(self.iter_state_path):
-                self.start_iter_id = torch.load(
-                    self.iter_state_path, map_location=device
-                )["iter"]
-            if not self.managed_weight_saving and os.path.exists(
-                self.default_net_state_path
-            ):
-                net.load_state_dict(
-                    torch.load(self.default_net_state_path, map_location=device)
-                )
-            if os.path.exists(self.disc_state_path):
-                try:
-                    self.discriminator.load_state_dict(
-                        torch.load(self.disc_state_path, map_location=device)
-                    )
-                except:
-                    warnings.warn(
-                        "Failed to load discriminator state at", self.disc_state_path
-                    )
+            state = self.ckpt.load(map_location=device)
+            if state is not None:
+                print("Load", self.ckpt.latest())
+                self.load_state(state)
+            else:
+                self.load_legacy_state(device)
+
+        # Same initial (or resumed) weights on all ranks
+        distributed.broadcast_module(self.net)
+        distributed.broadcast_module(self.discriminator)
 
         self.visual_path = os.path.join(self.args.visual_path, self.args.name)
         self.conf = conf
 
+    def state_dict(self):
+        """
+        All training state, saved as one checkpoint
+        """
+        state = {
+            "net": self.net.state_dict(),
+            "discriminator": self.discriminator.state_dict(),
+            "optim": self.optim.state_dict(),
+            "optim_d": self.optim_d.state_dict(),
+            "scaler": self.scaler.state_dict(),
+            "scaler_d": self.scaler_d.state_dict(),
+        }
+        if self.lr_scheduler is not None:
+            state["lr_scheduler"] = self.lr_scheduler.state_dict()
+        state.update(self.extra_state())
+        return state
+
+    def load_state(self, state):
+        """
+        Resume from a checkpoint written by state_dict
+        """
+        self.net.load_state_dict(state["net"], strict=False)
+        self.discriminator.load_state_dict(state["discriminator"])
+        self.optim.load_state_dict(state["optim"])
+        self.optim_d.load_state_dict(state["optim_d"])
+        if self.amp == "fp16":
+            self.scaler.load_state_dict(state["scaler"])
+            self.scaler_d.load_state_dict(state["scaler_d"])
+        if self.lr_scheduler is not None and "lr_scheduler" in state:
+            self.lr_scheduler.load_state_dict(state["lr_scheduler"])
+        self.start_iter_id = state["iter"]
+        self.load_extra_state(state)
+
+    def load_legacy_state(self, device=None):
+        """
+        Resume from the per-file state of older runs (no consolidated checkpoint)
+        """
+        if os.path.exists(self.optim_state_path):
+            try:
+                self.optim.load_state_dict(
+                    torch.load(self.optim_state_path, map_location=device)
+                )
+            except:
+                warnings.warn(
+                    "Failed to load optimizer state at", self.optim_state_path
+                )
+        if os.path.exists(self.optim_d_state_path):
+            try:
+                self.optim_d.load_state_dict(
+                    torch.load(self.optim_d_state_path, map_location=device)
+                )
+            except:
+                warnings.warn(
+                    "Failed to load optimizer state at", self.optim_d_state_path
+                )
+        if self.lr_scheduler is not None and os.path.exists(
+            self.lrsched_state_path
+        ):
+            self.lr_scheduler.load_state_dict(
+                torch.load(self.lrsched_state_path, map_location=device)
+            )
+        if self.amp == "fp16" and os.path.exists(self.scaler_state_path):
+            scaler_state = torch.load(self.scaler_state_path, map_location=device)
+            self.scaler.load_state_dict(scaler_state["scaler"])
+            self.scaler_d.load_state_dict(scaler_state["scaler_d"])
+        if os.path.exists(self.iter_state_path):
+            self.start_iter_id = torch.load(
+                self.iter_state_path, map_location=device
+            )["iter"]
+        if self.managed_weight_saving:
+            self.net.load_weights(self.args)
+        elif os.path.exists(self.default_net_state_path):
+            self.net.load_state_dict(
+                torch.load(self.default_net_state_path, map_location=device)
+            )
+        if os.path.exists(self.disc_state_path):
+            try:
+                self.discriminator.load_state_dict(
+                    torch.load(self.disc_state_path, map_location=device)
+                )
+            except:
+                warnings.warn(
+                    "Failed to load discriminator state at", self.disc_state_path
+                )
+
+    def make_profiler(self):
+        """
+        torch.profiler over profile_steps training steps, written as Chrome
+        traces (open in chrome://tracing or tensorboard) to
+        <logs>/<name>/profile; None if not profiling
+        """
+        if self.profile_steps <= 0 or not self.is_main:
+            return None
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.timer.cuda:
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        trace_path = os.path.join(self.summary_path, "profile")
+        print("Profiling", self.profile_steps, "steps to", trace_path)
+        return torch.profiler.profile(
+            activities=activities,
+            schedule=torch.profiler.schedule(
+                wait=max(self.profile_wait - 1, 0),
+                warmup=1 if self.profile_wait > 0 else 0,
+                active=self.profile_steps,
+                repeat=1,
+            ),
+            on_trace_ready=torch.profiler.tensorboard_trace_handler(trace_path),
+            profile_memory=True,
+        )
+
+    def rescale_grads(self, module, factor):
+        """
+        Multiply the gradients of module by factor. Under fp16 loss scaling,
+        moves gradients left over from a backward at one loss scale to the
+        scale of the backward they are added to
+        """
+        for param in module.parameters():
+            if param.grad is not None:
+                param.grad.mul_(factor)
+
+    def sync_grads(self, module):
+        """
+        Average the gradients of module over the ranks; call between backward
+        and the optimizer step. No-op in a single process
+        """
+        distributed.average_gradients(module)
+
     def post_batch(self, epoch, batch):
         """
         Ran after each batch
         """
         pass
 
-    def extra_save_state(self):
+    def extra_state(self):
+        """
+        Extra state (dict) saved in each checkpoint
+        """
+        return {}
+
+    def load_extra_state(self, state):
         """
-        Ran at each save step for saving extra state
+        Restore extra state from a checkpoint
         """
         pass
 
@@ -182,32 +350,55 @@ class Trainer:
         def fmt_loss_str(losses):
             return "loss " + (" ".join(k + ":" + str(losses[k]) for k in losses))
 
-        def data_loop(dl):
-            """
-            Loop an iterable infinitely
-            """
-            while True:
-                for x in iter(dl):
-                    yield x
-
-        print('training start!!!!!!!!')
-        test_data_iter = data_loop(self.test_data_loader)
+        if self.is_main:
+            print('training start!!!!!!!!')
+        # Test batches are only used every eval/vis interval: no device prefetch
+        test_data_iter = iter(
+            DevicePrefetcher(self.test_data_loader, None, depth=1, repeat=True)
+        )
+        train_batches = DevicePrefetcher(
+            self.train_data_loader, self.device, depth=self.prefetch_depth
+        )
+        prof = self.make_profiler()
+        if prof is not None:
+            prof.start()
 
         step_id = self.start_iter_id
 
-        progress = tqdm.tqdm(bar_format="[{rate_fmt}] ")
+        progress = tqdm.tqdm(bar_format="[{rate_fmt}] ", disable=not self.is_main)
         for epoch in range(self.num_epochs):
-            self.writer.add_scalar(
-                "lr", self.optim.param_groups[0]["lr"], global_step=step_id
-            )
+            if self.train_sampler is not None and hasattr(self.train_sampler, "set_epoch"):
+                self.train_sampler.set_epoch(epoch)
+            if self.is_main:
+                self.writer.add_scalar(
+                    "lr", self.optim.param_groups[0]["lr"], global_step=step_id
+                )
 
             batch = 0
             for _ in range(self.num_epoch_repeats):
-                for data in self.train_data_loader:
+                for data in train_batches:
+                    self.timer.pop()
+                    self.timer.add("data", train_batches.wait_time)
                     # gan loss에 generator 담아서 update 
-                    losses = self.train_step(data, global_step=step_id)
+                    with self.timer("step"):
+                        losses = self.train_step(data, global_step=step_id)
                     # generator loss 
 
+                    stage_times = self.timer.pop()
+                    if not self.is_main:
+                        # Other ranks only train
+                        self.post_batch(epoch, batch)
+                        step_id += 1
+                        batch += 1
+                        continue
+
+                    self.writer.add_scalar(
+                        "loader_wait", train_batches.wait_time, global_step=step_id
+                    )
+                    for stage, seconds in stage_times.items():
+                        self.writer.add_scalar(
+                            "time/" + stage, seconds, global_step=step_id
+                        )
                     loss_str = fmt_loss_str(losses)
                     if batch % self.print_interval == 0:
                         print(
@@ -218,6 +409,7 @@ class Trainer:
                             loss_str,
                             " lr",
                             self.optim.param_groups[0]["lr"],
+                            " wait {:.3f}s".format(train_batches.wait_time),
                         )
 
                     if batch % self.eval_interval == 0:
@@ -236,23 +428,9 @@ class Trainer:
 
                     if batch % self.save_interval == 0 and (epoch > 0 or batch > 0):
                         print("saving")
-                        if self.managed_weight_saving:
-                            self.net.save_weights(self.args)
-                        else:
-                            torch.save(
-                                self.net.state_dict(), self.default_net_state_path
-                            )
-                        ## added related to discriminator 
-                        torch.save(self.discriminator.state_dict(), self.disc_state_path)
-                        torch.save(self.optim_d.state_dict(), self.self.optim_d_state_path)
-                         ## added related to discriminator                       
-                        torch.save(self.optim.state_dict(), self.optim_state_path)
-                        if self.lr_scheduler is not None:
-                            torch.save(
-                                self.lr_scheduler.state_dict(), self.lrsched_state_path
-                            )
-                        torch.save({"iter": step_id + 1}, self.iter_state_path)
-                        self.extra_save_state()
+                        state = self.state_dict()
+                        state["iter"] = step_id + 1
+                        self.ckpt.save(step_id + 1, state)
 
                     if batch % self.vis_interval == 0:
                         print("generating visualization")
@@ -291,8 +469,14 @@ class Trainer:
 
 
                     self.post_batch(epoch, batch)
+                    if prof is not None:
+                        prof.step()
                     step_id += 1
                     batch += 1
                     progress.update(1)
             if self.lr_scheduler is not None:
                 self.lr_scheduler.step()
+        self.ckpt.wait()
+        if prof is not None:
+            prof.stop()
+        distributed.barrier()